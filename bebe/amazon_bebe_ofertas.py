@@ -9,15 +9,12 @@ import time
 import os
 import sys
 import logging
-from datetime import datetime, timedelta
 
 # Add project root to path so shared/ is importable
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from shared.amazon_ofertas_core import (
     setup_logging,
-    BASE_URL,
-    PARTNER_TAG,
     obtener_pagina,
     extraer_productos_busqueda,
     normalizar_titulo,
@@ -25,12 +22,19 @@ from shared.amazon_ofertas_core import (
     titulo_similar_a_recientes,
     agrupar_variantes,
     format_telegram_message,
+    prefiltrar_tarjetas_con_oferta,
     obtener_prioridad_marca as _obtener_prioridad_marca_core,
+    anotar_marca,
     send_telegram_message as _send_telegram_message_core,
     send_telegram_photo as _send_telegram_photo_core,
+    load_reserva_candidatos as _load_reserva_candidatos_core,
+    save_reserva_candidatos as _save_reserva_candidatos_core,
+)
+from shared.estado import (
     load_posted_deals as _load_posted_deals_core,
     save_posted_deals as _save_posted_deals_core,
 )
+from shared.pipeline import ConfigCanal, ejecutar_ciclo
 
 _LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ofertas_bebe.log")
 setup_logging(_LOG_FILE)
@@ -51,6 +55,11 @@ DEV_MODE = False
 # Archivo para guardar ofertas ya publicadas
 POSTED_BEBE_DEALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "posted_bebe_deals.json")
 
+# Reserva de candidatos del ultimo scrapeo (si falla la pagina de una categoria
+# se publica desde aqui, sin peticiones extra, mientras sean recientes)
+RESERVA_CANDIDATOS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reserva_bebe_candidatos.json")
+
+
 
 def _effective_token():
     return DEV_TELEGRAM_BOT_TOKEN if DEV_MODE and DEV_TELEGRAM_BOT_TOKEN else TELEGRAM_BOT_TOKEN
@@ -63,9 +72,24 @@ def _effective_chat_id():
 # (para evitar publicar el mismo tipo de producto repetidamente)
 CATEGORIAS_VERIFICAR_TITULOS = ["Chupetes", "Juguetes"]
 
+# Umbral de similitud (Jaccard de palabras) a partir del cual un titulo
+# cuenta como repetido de uno reciente
+UMBRAL_SIMILITUD_TITULOS = 0.5
+
 # Categorias que solo se publican una vez por semana (no son compra recurrente)
 CATEGORIAS_LIMITE_SEMANAL = ["Tronas", "Camaras seguridad", "Chupetes", "Vajilla bebe"]
 
+# Ofertas a publicar por ciclo (las mejores que cumplen anti-repeticion,
+# límites y diversidad); con 1 se comporta como siempre
+OFERTAS_POR_CICLO = 1
+
+# Segundos entre publicaciones del mismo ciclo (límite de mensajes de Telegram)
+PAUSA_ENTRE_PUBLICACIONES = 5
+
+# Procesos para parsear paginas en paralelo mientras se descargan las siguientes
+# (0 = parseo en el proceso principal, como siempre)
+PROCESOS_PARSEO = 0
+
 # Marcas prioritarias (se prefieren cuando hay igualdad de descuento)
 MARCAS_PRIORITARIAS = ["dodot", "suavinex", "baby sebamed", "mustela", "waterwipes"]
 
@@ -94,6 +118,11 @@ def obtener_prioridad_marca(titulo):
     return _obtener_prioridad_marca_core(titulo, MARCAS_PRIORITARIAS)
 
 
+def prioridad_producto(producto):
+    """Prioridad de marca del producto: se calcula la primera vez y queda guardada en el registro."""
+    return anotar_marca(producto, MARCAS_PRIORITARIAS)
+
+
 def send_telegram_message(message):
     """Envia un mensaje al canal de Telegram de bebe."""
     return _send_telegram_message_core(message, _effective_token(), _effective_chat_id())
@@ -106,286 +135,67 @@ def send_telegram_photo(photo_url, caption):
 
 def load_posted_deals():
     """
-    Carga las ofertas publicadas (ultimas 48h) desde un archivo JSON.
+    Carga las ofertas publicadas (ultimas 48h) del historial (JSON, SQLite o diario, ver shared.estado).
     Retorna tupla: (dict_ofertas, ultimas_categorias, ultimos_titulos, categorias_semanales)
     """
     return _load_posted_deals_core(POSTED_BEBE_DEALS_FILE)
 
 
 def save_posted_deals(deals_dict, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
-    """Guarda el diccionario de ofertas publicadas en un archivo JSON."""
+    """Guarda el diccionario de ofertas publicadas en el historial (JSON, SQLite o diario)."""
     return _save_posted_deals_core(deals_dict, POSTED_BEBE_DEALS_FILE, ultimas_categorias, ultimos_titulos, categorias_semanales)
 
 
-def buscar_y_publicar_ofertas():
-    """
-    Busca la mejor oferta de cada categoria y publica solo la que tenga
-    mayor descuento de entre todas.
-    """
-    if not _effective_token() or not _effective_chat_id():
-        if DEV_MODE:
-            log.error(
-                "DEV_MODE activo pero credenciales dev no configuradas. "
-                "Establece DEV_TELEGRAM_BOT_TOKEN y DEV_TELEGRAM_CHAT_ID."
-            )
-        else:
-            log.error(
-                "Credenciales de Telegram no configuradas. "
-                "Establece las variables de entorno TELEGRAM_BOT_TOKEN y TELEGRAM_CHAT_ID."
-            )
-        return 0
-
-    log.info("=" * 60)
-    if DEV_MODE:
-        log.info("INICIO [DEV MODE] - BUSCADOR DE OFERTAS DE BEBE | Amazon.es -> Telegram (canal de pruebas)")
-    else:
-        log.info("INICIO - BUSCADOR DE OFERTAS DE BEBE | Amazon.es -> Telegram")
-    log.info("Tag de afiliado: %s | Hora: %s", PARTNER_TAG, datetime.now().strftime('%d/%m/%Y %H:%M'))
-    log.info("=" * 60)
-
-    # Cargar ofertas ya publicadas (ultimas 48h), ultimas categorias y titulos
-    # En DEV_MODE se ignora el historial para no contaminar el JSON de produccion
-    if DEV_MODE:
-        posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales = {}, [], [], {}
-        log.info("DEV_MODE: historial de publicaciones ignorado (posted_bebe_deals.json no se leerá ni escribirá)")
-    else:
-        posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales = load_posted_deals()
-    posted_asins = set(posted_deals.keys())
-
-    if ultimas_categorias:
-        log.info(
-            "Anti-repeticion de categoria: se evitaran las ultimas %d categorias [%s]",
-            len(ultimas_categorias), ", ".join(ultimas_categorias)
-        )
-    if ultimos_titulos:
-        log.info(
-            "Anti-titulo-similar activo para categorias %s (%d titulos recientes guardados)",
-            ", ".join(CATEGORIAS_VERIFICAR_TITULOS), len(ultimos_titulos)
-        )
-
-    now = datetime.now()
-    una_semana = timedelta(days=7)
-
-    # Recopilar la mejor oferta de cada categoria
-    mejores_por_categoria = []
-
-    for categoria in CATEGORIAS_BEBE:
-        log.info("")
-        log.info("--- Categoria: %s ---", categoria['nombre'])
-
-        # Verificar limite semanal para ciertas categorias
-        if categoria['nombre'] in CATEGORIAS_LIMITE_SEMANAL:
-            ultima_pub_str = categorias_semanales.get(categoria['nombre'])
-            if ultima_pub_str:
-                try:
-                    ultima_pub = datetime.fromisoformat(ultima_pub_str)
-                    tiempo_transcurrido = now - ultima_pub
-                    if tiempo_transcurrido < una_semana:
-                        dias_restantes = (una_semana - tiempo_transcurrido).days + 1
-                        log.info(
-                            "  SALTADA por limite semanal: ultima publicacion el %s (hace %d dias, faltan ~%d dias)",
-                            ultima_pub.strftime('%d/%m %H:%M'), tiempo_transcurrido.days, dias_restantes
-                        )
-                        continue
-                    else:
-                        log.debug(
-                            "  Limite semanal OK: ultima publicacion hace %d dias (supera los 7 requeridos)",
-                            tiempo_transcurrido.days
-                        )
-                except (ValueError, TypeError):
-                    pass
-
-        url = BASE_URL + categoria['url']
-        html_content = obtener_pagina(url)
-
-        if not html_content:
-            log.warning("  No se pudo obtener la pagina, saltando categoria")
-            continue
-
-        productos = extraer_productos_busqueda(html_content)
-        ofertas = [p for p in productos if p['tiene_oferta']]
-        sin_oferta = len(productos) - len(ofertas)
-        log.info(
-            "  Scraped: %d productos (%d con oferta, %d sin descuento)",
-            len(productos), len(ofertas), sin_oferta
-        )
-
-        if not ofertas:
-            log.info("  No hay productos con descuento en esta categoria")
-            continue
-
-        # Ordenar ofertas: primero por mayor descuento, luego marca prioritaria, luego valoraciones, luego ventas
-        ofertas_ordenadas = sorted(
-            ofertas,
-            key=lambda x: (x['descuento'], obtener_prioridad_marca(x['titulo']), x['valoraciones'], x['ventas']),
-            reverse=True
-        )
-
-        # Log de los top candidatos antes de filtrar
-        log.debug("  Top candidatos antes de filtros anti-duplicacion:")
-        for i, p in enumerate(ofertas_ordenadas[:5], 1):
-            marca_flag = " [MARCA PRIO]" if obtener_prioridad_marca(p['titulo']) else ""
-            log.debug(
-                "    %d. [%s] %s | %.0f%% dto | %d vals | %d ventas%s",
-                i, p['asin'], p['titulo'][:50], p['descuento'],
-                p['valoraciones'], p['ventas'], marca_flag
-            )
-
-        # Buscar la mejor oferta no publicada en esta categoria
-        verificar_titulos = categoria['nombre'] in CATEGORIAS_VERIFICAR_TITULOS
-        candidato_elegido = None
-
-        for producto in ofertas_ordenadas:
-            asin = producto['asin']
-            titulo_corto = producto['titulo'][:45]
-
-            if asin in posted_asins:
-                log.info(
-                    "  DESCARTADO [ya publicado en <48h] %s... (%.0f%% dto, ASIN: %s)",
-                    titulo_corto, producto['descuento'], asin
-                )
-                continue
-
-            if verificar_titulos and titulo_similar_a_recientes(producto['titulo'], ultimos_titulos):
-                log.info(
-                    "  DESCARTADO [titulo similar a reciente] %s... (%.0f%% dto)",
-                    titulo_corto, producto['descuento']
-                )
-                continue
-
-            candidato_elegido = producto
-            marca_flag = " [marca prioritaria]" if obtener_prioridad_marca(producto['titulo']) else ""
-            log.info(
-                "  ELEGIDO para categoria: %s... (%.0f%% dto, %d valoraciones, ASIN: %s)%s",
-                titulo_corto, producto['descuento'], producto['valoraciones'], asin, marca_flag
-            )
-            mejores_por_categoria.append({
-                'producto': producto,
-                'categoria': categoria
-            })
-            break
-
-        if candidato_elegido is None:
-            log.info("  Sin candidatos validos: todos descartados por duplicacion o similitud de titulo")
-
-    # Agrupar variantes del mismo producto antes de la selección global
-    mejores_por_categoria = agrupar_variantes(mejores_por_categoria)
-
-    # De entre las mejores ofertas de cada categoria, seleccionar la de mayor descuento
-    if not mejores_por_categoria:
-        log.info("")
-        log.info("=" * 60)
-        log.info("RESULTADO: No hay ofertas nuevas para publicar en este ciclo")
-        log.info("=" * 60)
-        return 0
-
-    # Ordenar por descuento y marca prioritaria, seleccionar la mejor
-    mejores_por_categoria.sort(
-        key=lambda x: (x['producto']['descuento'], obtener_prioridad_marca(x['producto']['titulo'])),
-        reverse=True
+def load_reserva_candidatos():
+    """Carga la reserva de candidatos por categoria del ultimo scrapeo."""
+    return _load_reserva_candidatos_core(RESERVA_CANDIDATOS_FILE)
+
+
+def save_reserva_candidatos(reserva):
+    """Guarda la reserva de candidatos por categoria."""
+    return _save_reserva_candidatos_core(reserva, RESERVA_CANDIDATOS_FILE)
+
+
+def config_canal():
+    """Configuración del canal para el pipeline (se lee en cada ciclo: respeta --dev, --por-ciclo...)."""
+    return ConfigCanal(
+        nombre="BUSCADOR DE OFERTAS DE BEBE",
+        categorias=CATEGORIAS_BEBE,
+        token=_effective_token(),
+        chat_id=_effective_chat_id(),
+        variables_credenciales=("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"),
+        obtener_pagina=obtener_pagina,
+        extraer=extraer_productos_busqueda,
+        prefiltro=prefiltrar_tarjetas_con_oferta,
+        procesos_parseo=PROCESOS_PARSEO,
+        send_photo=send_telegram_photo,
+        send_message=send_telegram_message,
+        format_mensaje=format_telegram_message,
+        load_posted_deals=load_posted_deals,
+        save_posted_deals=save_posted_deals,
+        load_reserva=load_reserva_candidatos,
+        save_reserva=save_reserva_candidatos,
+        fichero_historial=os.path.basename(POSTED_BEBE_DEALS_FILE),
+        prioridad=prioridad_producto,
+        titulo_similar=titulo_similar_a_recientes,
+        agrupar_variantes=agrupar_variantes,
+        dev_mode=DEV_MODE,
+        categorias_verificar_titulos=CATEGORIAS_VERIFICAR_TITULOS,
+        umbral_similitud=UMBRAL_SIMILITUD_TITULOS,
+        categorias_limite_semanal=CATEGORIAS_LIMITE_SEMANAL,
+        # Panales y toallitas son compra recurrente: pueden repetir categoria
+        categorias_excluidas_repeticion=["Panales", "Toallitas"],
+        ofertas_por_ciclo=OFERTAS_POR_CICLO,
+        pausa_entre_publicaciones=PAUSA_ENTRE_PUBLICACIONES,
     )
 
-    log.info("")
-    log.info("--- Seleccion global (ranking de mejores por categoria) ---")
-    for i, entrada in enumerate(mejores_por_categoria, 1):
-        p = entrada['producto']
-        cat = entrada['categoria']['nombre']
-        marca_flag = " [marca prio]" if obtener_prioridad_marca(p['titulo']) else ""
-        en_ultimas = " [cat. reciente]" if cat in ultimas_categorias else ""
-        log.info(
-            "  %d. [%s] %s... | %.0f%% dto | cat: %s%s%s",
-            i, p['asin'], p['titulo'][:40], p['descuento'], cat, marca_flag, en_ultimas
-        )
-
-    # Evitar repetir categorias de las ultimas 4 publicaciones, excepto algunas
-    mejor_oferta = None
-    categorias_excluidas_repeticion = ["Panales", "Toallitas"]
-
-    for oferta in mejores_por_categoria:
-        nombre_categoria = oferta['categoria']['nombre']
-        if nombre_categoria not in ultimas_categorias or nombre_categoria in categorias_excluidas_repeticion:
-            mejor_oferta = oferta
-            break
-
-    if mejor_oferta is None:
-        log.info(
-            "Todas las categorias candidatas estan en el historial reciente [%s], "
-            "publicando la mejor disponible igualmente",
-            ", ".join(ultimas_categorias)
-        )
-        mejor_oferta = mejores_por_categoria[0]
-    elif mejor_oferta != mejores_por_categoria[0]:
-        primera_cat = mejores_por_categoria[0]['categoria']['nombre']
-        log.info(
-            "Anti-repeticion: la #1 global (%s) fue descartada porque su categoria '%s' "
-            "aparece en las recientes [%s]. Se elige la siguiente valida.",
-            mejores_por_categoria[0]['producto']['titulo'][:35],
-            primera_cat,
-            ", ".join(ultimas_categorias)
-        )
-
-    producto = mejor_oferta['producto']
-    categoria = mejor_oferta['categoria']
-
-    log.info("")
-    log.info(">>> OFERTA SELECCIONADA PARA PUBLICAR:")
-    log.info("    Titulo:    %s", producto['titulo'])
-    log.info("    Categoria: %s | Descuento: %.0f%%", categoria['nombre'], producto['descuento'])
-    log.info("    Precio:    %s (antes: %s)", producto['precio'], producto.get('precio_anterior', 'N/A'))
-    log.info("    ASIN:      %s | Valoraciones: %d | Ventas: %d",
-             producto['asin'], producto['valoraciones'], producto['ventas'])
-    log.info("    URL:       %s", producto['url'])
-
-    # Formatear mensaje
-    mensaje = format_telegram_message(producto, categoria)
-
-    # Enviar a Telegram (con foto si disponible)
-    if producto['imagen']:
-        log.debug("    Enviando con foto: %s", producto['imagen'])
-        exito = send_telegram_photo(producto['imagen'], mensaje)
-    else:
-        log.debug("    Enviando sin foto (no disponible)")
-        exito = send_telegram_message(mensaje)
-
-    ofertas_publicadas = 0
-    if exito:
-        posted_deals[producto['asin']] = datetime.now().isoformat()
-        # Guardar también ASINs de variantes agrupadas para evitar republicarlas
-        for variante in producto.get('variantes_adicionales', []):
-            posted_deals[variante['asin']] = datetime.now().isoformat()
-        # Añadir categoria al inicio de la lista y mantener solo las ultimas 4
-        ultimas_categorias.insert(0, categoria['nombre'])
-        ultimas_categorias = ultimas_categorias[:4]
-        log.debug("Historial de categorias actualizado: %s", ", ".join(ultimas_categorias))
-
-        # Si es categoria con verificacion de titulos, guardar el titulo
-        if categoria['nombre'] in CATEGORIAS_VERIFICAR_TITULOS:
-            ultimos_titulos.insert(0, producto['titulo'])
-            ultimos_titulos = ultimos_titulos[:4]
-            log.debug("Titulo guardado en anti-similitud (total: %d)", len(ultimos_titulos))
-
-        # Si es categoria con limite semanal, guardar el timestamp
-        if categoria['nombre'] in CATEGORIAS_LIMITE_SEMANAL:
-            categorias_semanales[categoria['nombre']] = datetime.now().isoformat()
-            log.debug("Timestamp de limite semanal actualizado para categoria '%s'", categoria['nombre'])
-
-        ofertas_publicadas = 1
-    else:
-        log.error("Fallo al enviar a Telegram, no se guarda el ASIN en el historial")
 
-    # Guardar ofertas publicadas, ultimas categorias y titulos
-    # En DEV_MODE no se escribe para no contaminar el historial de produccion
-    if DEV_MODE:
-        log.info("DEV_MODE: historial no guardado (posted_bebe_deals.json sin cambios)")
-    else:
-        save_posted_deals(posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales)
-
-    log.info("")
-    log.info("=" * 60)
-    log.info("FIN - %s oferta publicada en Telegram", ofertas_publicadas)
-    log.info("=" * 60)
-
-    return ofertas_publicadas
+def buscar_y_publicar_ofertas():
+    """
+    Busca la mejor oferta de cada categoria y publica las de mayor descuento
+    de entre todas (hasta OFERTAS_POR_CICLO).
+    """
+    return ejecutar_ciclo(config_canal())
 
 
 def main(modo_continuo=False):
@@ -414,10 +224,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Buscador de ofertas de bebe en Amazon.es')
     parser.add_argument('--dev', action='store_true', help='Modo desarrollo: publica en canal de pruebas y no modifica el JSON de produccion')
     parser.add_argument('--continuo', '-c', action='store_true', help='Ejecuta en bucle cada 15 minutos')
+    parser.add_argument('--por-ciclo', type=int, default=None, metavar='N',
+                        help=f'Ofertas a publicar por ciclo (default {OFERTAS_POR_CICLO})')
     args = parser.parse_args()
 
     if args.dev:
         globals()['DEV_MODE'] = True
         log.info("CLI: DEV_MODE activado (canal de pruebas, JSON de prod intacto)")
+    if args.por_ciclo is not None:
+        globals()['OFERTAS_POR_CICLO'] = max(1, args.por_ciclo)
+        log.info("CLI: hasta %d ofertas por ciclo", OFERTAS_POR_CICLO)
 
     main(modo_continuo=args.continuo)
@@ -7,6 +7,8 @@ Sirven como red de seguridad para refactors.
 
 import json
 import os
+import random
+import sqlite3
 import sys
 import textwrap
 from datetime import datetime, timedelta
@@ -20,6 +22,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 
 import bebe.amazon_bebe_ofertas as bot
 import shared.amazon_ofertas_core as core
+from shared import estado, precios, similitud
+from shared.producto import Producto
 
 
 # ---------------------------------------------------------------------------
@@ -44,6 +48,14 @@ def make_producto(**kwargs):
     return defaults
 
 
+@pytest.fixture(autouse=True)
+def reserva_temporal(tmp_path, monkeypatch):
+    """Cada test usa su propia reserva de candidatos (nunca el fichero real del canal)."""
+    ruta = tmp_path / 'reserva.json'
+    monkeypatch.setattr(bot, 'RESERVA_CANDIDATOS_FILE', str(ruta))
+    return ruta
+
+
 def make_categoria(**kwargs):
     """Crea una categoría con valores por defecto."""
     defaults = {'nombre': 'Panales', 'emoji': '🧷', 'url': '/s?k=panales'}
@@ -135,17 +147,17 @@ class TestTitulosSimilares:
 
 class TestTituloSimilarARecientes:
     def test_sin_recientes_devuelve_false(self):
-        assert bot.titulo_similar_a_recientes("Chupete Suavinex", []) is False
+        assert core.titulo_similar_a_recientes("Chupete Suavinex", []) is False
 
     def test_detecta_similar_entre_recientes(self):
         recientes = ["Chupete Suavinex silicona talla 1"]
-        assert bot.titulo_similar_a_recientes(
+        assert core.titulo_similar_a_recientes(
             "Chupete Suavinex silicona talla 2", recientes
         ) is True
 
     def test_no_detecta_diferente(self):
         recientes = ["Pañales Dodot talla 3 × 60 unidades"]
-        assert bot.titulo_similar_a_recientes(
+        assert core.titulo_similar_a_recientes(
             "Biberón Chicco anticólico 150ml", recientes
         ) is False
 
@@ -155,7 +167,7 @@ class TestTituloSimilarARecientes:
             "Biberón Chicco 150ml",
             "Chupete Suavinex silicona talla 1",
         ]
-        assert bot.titulo_similar_a_recientes(
+        assert core.titulo_similar_a_recientes(
             "Chupete Suavinex silicona talla 2", recientes
         ) is True
 
@@ -181,6 +193,30 @@ class TestObtenerPrioridadMarca:
         assert bot.obtener_prioridad_marca("DODOT PANALES") == 1
         assert bot.obtener_prioridad_marca("dodot panales") == 1
 
+    def test_marca_en_titulo_devuelve_la_marca_de_la_lista(self):
+        assert core.marca_en_titulo("Crema BABY SEBAMED 50ml", bot.MARCAS_PRIORITARIAS) == "baby sebamed"
+        assert core.marca_en_titulo("Biberón genérico", bot.MARCAS_PRIORITARIAS) is None
+
+    def test_lista_de_marcas_vacia(self):
+        assert core.obtener_prioridad_marca("Pañales Dodot", []) == 0
+
+    def test_prioridad_se_calcula_una_vez_por_producto(self, monkeypatch):
+        llamadas = []
+        original = core.marca_en_titulo
+        monkeypatch.setattr(core, 'marca_en_titulo', lambda t, m: llamadas.append(t) or original(t, m))
+        producto = make_producto(titulo="Pañales Dodot Sensitive T3")
+        assert bot.prioridad_producto(producto) == 1
+        assert bot.prioridad_producto(producto) == 1
+        assert llamadas == ["Pañales Dodot Sensitive T3"]
+        assert producto['marca'] == "dodot"
+
+    def test_cambiar_titulo_invalida_la_marca_anotada(self):
+        producto = Producto(asin="B001", titulo="Pañales Dodot T3")
+        assert bot.prioridad_producto(producto) == 1
+        producto['titulo'] = "Pañales genéricos T3"
+        assert 'prioridad_marca' not in producto
+        assert bot.prioridad_producto(producto) == 0
+
 
 # ---------------------------------------------------------------------------
 # format_telegram_message
@@ -343,6 +379,480 @@ class TestSavePostedDeals:
         assert 'Tronas' in semanales
 
 
+# ---------------------------------------------------------------------------
+# Backend SQLite del historial (shared.estado)
+# ---------------------------------------------------------------------------
+
+def _estado_completo(ahora):
+    deals = core.OfertasPublicadas(
+        {'B001': ahora.isoformat(), 'B002': (ahora - timedelta(hours=1)).isoformat()},
+        {'panales dodot': ahora.isoformat()},
+    )
+    titulos = core.HistorialTitulos(['Pañales Dodot T3', 'Toallitas Mustela'],
+                                    [ahora.isoformat(), (ahora - timedelta(days=1)).isoformat()])
+    return deals, ['Panales', 'Toallitas'], titulos, {'Tronas': ahora.isoformat()}
+
+
+class TestEstadoSQLite:
+    def test_ida_y_vuelta(self, tmp_path):
+        sqlite = estado.EstadoSQLite(str(tmp_path / 'deals.sqlite3'))
+        guardado = _estado_completo(datetime.now())
+        sqlite.guardar(*guardado)
+        deals, cats, titulos, semanales = sqlite.cargar()
+        assert deals == guardado[0]
+        assert deals.firmas_variantes == guardado[0].firmas_variantes
+        assert cats == ['Panales', 'Toallitas']
+        assert titulos == ['Pañales Dodot T3', 'Toallitas Mustela']
+        assert titulos.fechas == guardado[2].fechas
+        assert semanales == guardado[3]
+
+    def test_carga_solo_la_ventana(self, tmp_path):
+        ahora = datetime.now()
+        sqlite = estado.EstadoSQLite(str(tmp_path / 'deals.sqlite3'))
+        sqlite.guardar(
+            {'BNUEVO': ahora.isoformat(), 'BVIEJO': (ahora - timedelta(hours=50)).isoformat()},
+            ultimos_titulos=core.HistorialTitulos(['Viejo'], [(ahora - timedelta(days=31)).isoformat()]),
+        )
+        deals, _, titulos, _ = sqlite.cargar(horas_ventana=48)
+        assert list(deals) == ['BNUEVO']
+        assert titulos == []
+
+    def test_guardar_solo_inserta_lo_nuevo(self, tmp_path):
+        ruta = tmp_path / 'deals.sqlite3'
+        sqlite = estado.EstadoSQLite(str(ruta))
+        ts = datetime.now().isoformat()
+        sqlite.guardar({'B001': ts})
+        deals = sqlite.cargar()[0]
+        deals['B002'] = ts
+        sqlite.guardar(deals)
+        sqlite.guardar(deals)
+        con = sqlite3.connect(str(ruta))
+        assert con.execute('SELECT asin FROM publicaciones ORDER BY asin').fetchall() == [('B001',), ('B002',)]
+        assert con.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+        con.close()
+
+    def test_guardar_borra_las_filas_caducadas(self, tmp_path):
+        ruta = tmp_path / 'deals.sqlite3'
+        sqlite = estado.EstadoSQLite(str(ruta), dias_retencion=7)
+        ahora = datetime.now()
+        viejo = (ahora - timedelta(days=8)).isoformat()
+        deals = core.OfertasPublicadas({'BVIEJO': viejo, 'BNUEVO': ahora.isoformat()}, {'firma vieja': viejo})
+        sqlite.guardar(deals, ultimos_titulos=core.HistorialTitulos(['Viejo'], [viejo]))
+        # Un ciclo posterior ya no los pasa (fuera de ventana), pero tampoco quedan en la base
+        sqlite.guardar(sqlite.cargar(horas_ventana=24 * 30)[0])
+        con = sqlite3.connect(str(ruta))
+        assert con.execute('SELECT asin FROM publicaciones').fetchall() == [('BNUEVO',)]
+        assert con.execute('SELECT COUNT(*) FROM firmas_variantes').fetchone() == (0,)
+        assert con.execute('SELECT COUNT(*) FROM titulos').fetchone() == (0,)
+        con.close()
+
+    def test_migra_el_json_la_primera_vez(self, tmp_path):
+        ruta_json = str(tmp_path / 'deals.json')
+        guardado = _estado_completo(datetime.now())
+        core.save_posted_deals(*guardado[:1], ruta_json, *guardado[1:])
+        deals, cats, titulos, semanales = estado.load_posted_deals(ruta_json, backend='sqlite')
+        assert (tmp_path / 'deals.sqlite3').exists()
+        assert deals == guardado[0] and cats == guardado[1] and titulos == guardado[2] and semanales == guardado[3]
+        assert json.loads(open(ruta_json).read())['B001'] == guardado[0]['B001']  # el JSON no se toca
+
+    def test_migrar_de_sqlite_a_json(self, tmp_path):
+        ruta_sqlite = str(tmp_path / 'deals.sqlite3')
+        guardado = _estado_completo(datetime.now())
+        estado.EstadoSQLite(ruta_sqlite).guardar(*guardado)
+        estado.main(['migrar', ruta_sqlite, str(tmp_path / 'deals.json')])
+        deals, cats, titulos, _ = core.load_posted_deals(str(tmp_path / 'deals.json'))
+        assert deals == guardado[0] and cats == guardado[1] and titulos == guardado[2]
+
+    def test_backend_desconocido(self, tmp_path):
+        with pytest.raises(ValueError, match="Backend de estado desconocido"):
+            estado.abrir_estado(str(tmp_path / 'deals.json'), 'csv')
+
+    def test_canal_con_backend_sqlite(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(estado, 'BACKEND_ESTADO', 'sqlite')
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(tmp_path / 'deals.json'))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'CATEGORIAS_BEBE', [make_categoria()])
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: "<html>mock</html>")
+        monkeypatch.setattr(bot, 'extraer_productos_busqueda', lambda html: [make_producto(asin='BUNICO')])
+        monkeypatch.setattr(bot, 'send_telegram_photo', lambda url, msg: True)
+
+        assert bot.buscar_y_publicar_ofertas() == 1
+        assert bot.buscar_y_publicar_ofertas() == 0  # ya publicado segun la base SQLite
+        assert (tmp_path / 'deals.sqlite3').exists()
+        assert not (tmp_path / 'deals.json').exists()
+
+
+# ---------------------------------------------------------------------------
+# Diario append-only del historial (shared.estado)
+# ---------------------------------------------------------------------------
+
+def _lineas(ruta):
+    return [json.loads(linea) for linea in ruta.read_text(encoding='utf-8').splitlines()]
+
+
+class TestEstadoDiario:
+    def test_ida_y_vuelta(self, tmp_path):
+        diario = estado.EstadoDiario(str(tmp_path / 'deals.jsonl'))
+        guardado = _estado_completo(datetime.now())
+        diario.guardar(*guardado)
+        deals, cats, titulos, semanales = diario.cargar()
+        assert deals == guardado[0]
+        assert deals.firmas_variantes == guardado[0].firmas_variantes
+        assert cats == guardado[1]
+        assert titulos == guardado[2] and titulos.fechas == guardado[2].fechas
+        assert semanales == guardado[3]
+
+    def test_guardar_solo_anade_lo_nuevo(self, tmp_path):
+        ruta = tmp_path / 'deals.jsonl'
+        diario = estado.EstadoDiario(str(ruta))
+        diario.guardar(*_estado_completo(datetime.now()))
+        n_lineas = len(_lineas(ruta))
+
+        deals, cats, titulos, semanales = diario.cargar()
+        diario.guardar(deals, cats, titulos, semanales)
+        assert len(_lineas(ruta)) == n_lineas
+
+        deals['B003'] = datetime.now().isoformat()
+        diario.guardar(deals, ['Chupetes'] + cats, titulos, semanales)
+        assert [e['tipo'] for e in _lineas(ruta)[n_lineas:]] == ['publicacion', 'ultimas_categorias']
+
+    def test_compacta_al_guardar_al_pasar_el_umbral_de_caducadas(self, tmp_path, caplog):
+        ruta = tmp_path / 'deals.jsonl'
+        ahora = datetime.now()
+        dias = estado.DIAS_RETENCION_DIARIO
+        viejas = {f'BVIEJO{i}': (ahora - timedelta(days=dias, hours=1 + i)).isoformat() for i in range(5)}
+        estado.EstadoDiario(str(ruta), max_caducadas=6).guardar({**viejas, 'BNUEVO': ahora.isoformat()})
+        assert len(_lineas(ruta)) == 6  # por debajo del umbral: no se toca
+
+        with caplog.at_level('INFO'):
+            estado.EstadoDiario(str(ruta), max_caducadas=5).guardar({'BNUEVO': ahora.isoformat()})
+        assert _lineas(ruta) == [{'tipo': 'publicacion', 'asin': 'BNUEVO', 'fecha': ahora.isoformat()}]
+        assert "5 lineas caducadas eliminadas" in caplog.text
+
+    def test_cargar_con_ventana_corta_no_borra_nada(self, tmp_path):
+        ruta = tmp_path / 'deals.jsonl'
+        ahora = datetime.now()
+        # Fuera de la ventana de 48h pero dentro de la retencion del diario
+        anteriores = {f'BANTES{i}': (ahora - timedelta(hours=60 + i)).isoformat() for i in range(5)}
+        estado.EstadoDiario(str(ruta)).guardar({**anteriores, 'BNUEVO': ahora.isoformat()})
+
+        assert list(estado.EstadoDiario(str(ruta), max_caducadas=0).cargar(horas_ventana=1)[0]) == ['BNUEVO']
+        assert len(_lineas(ruta)) == 6
+        # Guardar lo cargado con ventana corta tampoco pierde las anteriores
+        estado.EstadoDiario(str(ruta), max_caducadas=0).guardar({'BNUEVO': ahora.isoformat()})
+        assert len(estado.EstadoDiario(str(ruta)).cargar(horas_ventana=96)[0]) == 6
+
+    def test_ignora_una_linea_a_medias(self, tmp_path):
+        ruta = tmp_path / 'deals.jsonl'
+        diario = estado.EstadoDiario(str(ruta))
+        diario.guardar({'B001': datetime.now().isoformat()})
+        with open(ruta, 'a', encoding='utf-8') as f:
+            f.write('{"tipo": "publicacion", "asin": "B0')
+        assert list(diario.cargar()[0]) == ['B001']
+
+    def test_guardar_tras_una_linea_a_medias_no_pierde_la_nueva(self, tmp_path):
+        ruta = tmp_path / 'deals.jsonl'
+        diario = estado.EstadoDiario(str(ruta))
+        ts = datetime.now().isoformat()
+        diario.guardar({'B001': ts})
+        with open(ruta, 'a', encoding='utf-8') as f:
+            f.write('{"tipo": "publicacion", "asin": "B0')
+        diario.guardar({'B001': ts, 'B002': ts})
+        assert sorted(diario.cargar()[0]) == ['B001', 'B002']
+        assert ruta.read_text(encoding='utf-8').endswith('\n')
+
+    def test_migra_el_json_la_primera_vez(self, tmp_path):
+        ruta_json = str(tmp_path / 'deals.json')
+        guardado = _estado_completo(datetime.now())
+        core.save_posted_deals(*guardado[:1], ruta_json, *guardado[1:])
+        deals, cats, titulos, semanales = estado.load_posted_deals(ruta_json, backend='diario')
+        assert (tmp_path / 'deals.jsonl').exists()
+        assert deals == guardado[0] and cats == guardado[1] and titulos == guardado[2] and semanales == guardado[3]
+
+    def test_canal_con_diario(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(estado, 'BACKEND_ESTADO', 'diario')
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(tmp_path / 'deals.json'))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'CATEGORIAS_BEBE', [make_categoria()])
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: "<html>mock</html>")
+        monkeypatch.setattr(bot, 'extraer_productos_busqueda', lambda html: [
+            make_producto(asin='BPRIMERO', titulo='Pañales Dodot T3', descuento=40.0),
+            make_producto(asin='BSEGUNDO', titulo='Toallitas WaterWipes sin perfume', descuento=30.0),
+        ])
+        monkeypatch.setattr(bot, 'send_telegram_photo', lambda url, msg: True)
+
+        assert bot.buscar_y_publicar_ofertas() == 1
+        n_lineas = len(_lineas(tmp_path / 'deals.jsonl'))
+        assert bot.buscar_y_publicar_ofertas() == 1  # BPRIMERO ya publicado segun el diario
+        nuevas = _lineas(tmp_path / 'deals.jsonl')[n_lineas:]
+        assert {'tipo': 'publicacion', 'asin': 'BSEGUNDO', 'fecha': nuevas[0]['fecha']} in nuevas
+        assert not any(e.get('asin') == 'BPRIMERO' for e in nuevas)
+
+
+# ---------------------------------------------------------------------------
+# HistorialTitulos — anti-titulo-similar de ventana larga (MinHash/LSH)
+# ---------------------------------------------------------------------------
+
+_PALABRAS_SINTETICAS = [
+    "chupete", "silicona", "anatomico", "nocturno", "biberon", "anticolicos",
+    "mordedor", "sonajero", "peluche", "musical", "cuna", "movil", "manta",
+    "suave", "algodon", "organico", "estuche", "cadena", "clip", "luminoso",
+]
+
+
+def _titulos_aleatorios(n, semilla):
+    rnd = random.Random(semilla)
+    return [" ".join(rnd.sample(_PALABRAS_SINTETICAS, 5)) for _ in range(n)]
+
+
+class TestHistorialTitulos:
+    def test_carga_descarta_titulos_fuera_de_ventana(self, tmp_path, monkeypatch):
+        ahora = datetime.now()
+        data = {
+            '_ultimos_titulos': ['Chupete reciente', 'Chupete antiguo'],
+            '_fechas_titulos': [(ahora - timedelta(days=2)).isoformat(), (ahora - timedelta(days=40)).isoformat()],
+        }
+        f = tmp_path / 'deals.json'
+        f.write_text(json.dumps(data))
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(f))
+        _, _, titulos, _ = bot.load_posted_deals()
+        assert titulos == ['Chupete reciente']
+
+    def test_formato_anterior_sin_fechas_conserva_todos(self, tmp_path, monkeypatch):
+        f = tmp_path / 'deals.json'
+        f.write_text(json.dumps({'_ultimos_titulos': ['A uno', 'B dos']}))
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(f))
+        _, _, titulos, _ = bot.load_posted_deals()
+        assert titulos == ['A uno', 'B dos']
+        assert len(titulos.fechas) == 2
+
+    def test_guarda_fechas_de_titulos(self, tmp_path, monkeypatch):
+        f = tmp_path / 'deals.json'
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(f))
+        historial = core.registrar_titulo_publicado([], 'Chupete silicona anatomico')
+        bot.save_posted_deals({}, ultimos_titulos=historial)
+        data = json.loads(f.read_text())
+        assert data['_ultimos_titulos'] == ['Chupete silicona anatomico']
+        assert len(data['_fechas_titulos']) == 1
+
+    def test_registrar_no_recorta_a_cuatro(self):
+        historial = []
+        for i in range(10):
+            historial = core.registrar_titulo_publicado(historial, f"Titulo distinto{'x' * i}")
+        assert len(historial) == 10
+        assert historial[0] == "Titulo distinto" + "x" * 9
+
+    def test_detecta_similar_publicado_hace_semanas(self):
+        historial = core.HistorialTitulos(
+            ["Chupete silicona anatomico nocturno"] + _titulos_aleatorios(500, semilla=1),
+        )
+        assert core.titulo_similar_a_recientes("Chupete silicona anatomico luminoso", historial)
+
+    def test_mismo_resultado_que_comparacion_exacta(self):
+        historial_lista = _titulos_aleatorios(300, semilla=2)
+        historial = core.HistorialTitulos(historial_lista)
+        for consulta in _titulos_aleatorios(100, semilla=3):
+            assert historial.similar(consulta) == core.titulo_similar_a_recientes(consulta, historial_lista)
+
+    def test_indice_no_compara_contra_todo_el_historial(self):
+        indice = core.IndiceLSH()
+        for i, titulo in enumerate(_titulos_aleatorios(2000, semilla=4)):
+            indice.agregar(i, core.tokenizar_titulo(titulo))
+        candidatos = indice.candidatos(core.tokenizar_titulo("Cuna movil musical peluche suave"))
+        assert len(candidatos) < len(indice)
+
+    def test_historial_indexado_solo_compara_candidatos_lsh(self, monkeypatch):
+        titulos = _titulos_aleatorios(20, semilla=7)
+        historial = core.HistorialTitulos(_titulos_aleatorios(300, semilla=8))
+        esperado = [historial.similar(t) for t in titulos]
+        comparaciones = []
+        original = similitud.jaccard
+
+        def contar(a, b):
+            comparaciones.append(1)
+            return original(a, b)
+
+        monkeypatch.setattr(similitud, 'jaccard', contar)
+        resultado = [core.titulo_similar_a_recientes(t, historial) for t in titulos]
+        assert len(comparaciones) < len(titulos) * len(historial)
+        assert resultado == esperado
+
+
+# ---------------------------------------------------------------------------
+# Firmas de variante de lo publicado — anti-variante contra el historial
+# ---------------------------------------------------------------------------
+
+class TestVariantesPublicadas:
+    def test_firma_ignora_palabras_de_variante(self):
+        assert core.firma_publicacion("Chupete silicona rosa") == core.firma_publicacion("Chupete silicona azul")
+        assert core.firma_publicacion("Chupete silicona rosa") != core.firma_publicacion("Chupete latex rosa")
+
+    def test_firma_vacia_si_solo_hay_palabras_de_variante(self):
+        assert core.firma_publicacion("Rosa azul") is None
+
+    def test_detecta_variante_publicada(self):
+        publicadas = core.registrar_variante_publicada({}, "Chupete silicona rosa")
+        assert core.variante_ya_publicada(publicadas, "Chupete silicona verde")
+        assert not core.variante_ya_publicada(publicadas, "Biberon anticolicos verde")
+
+    def test_dict_plano_sin_firmas(self):
+        assert core.variante_ya_publicada({'B001': datetime.now().isoformat()}, "Chupete silicona") is False
+
+    def test_roundtrip_y_ventana(self, tmp_path, monkeypatch):
+        f = tmp_path / 'deals.json'
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(f))
+        antigua = (datetime.now() - timedelta(hours=72)).isoformat()
+        publicadas = core.registrar_variante_publicada({'B001': datetime.now().isoformat()}, "Chupete silicona rosa")
+        publicadas = core.registrar_variante_publicada(publicadas, "Biberon cristal", fecha=antigua)
+        bot.save_posted_deals(publicadas)
+        deals, _, _, _ = bot.load_posted_deals()
+        assert list(deals) == ['B001']
+        assert core.variante_ya_publicada(deals, "Chupete silicona azul")
+        assert not core.variante_ya_publicada(deals, "Biberon cristal")
+
+    def test_canal_descarta_variante_de_lo_publicado(self, monkeypatch, tmp_path):
+        deals_file = tmp_path / 'deals.json'
+        deals_file.write_text(json.dumps({
+            '_firmas_variantes': {core.firma_publicacion("Crema culete proteccion rosa"): datetime.now().isoformat()}
+        }))
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(deals_file))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: "<html>mock</html>")
+        monkeypatch.setattr(bot, 'extraer_productos_busqueda', lambda html: [
+            make_producto(asin='BVARIANTE', titulo='Crema culete proteccion azul', descuento=60.0),
+            make_producto(asin='BOTRO', titulo='Toallitas agua sensibles', descuento=20.0),
+        ])
+        publicados = []
+        monkeypatch.setattr(bot, 'send_telegram_photo', lambda url, msg: publicados.append(msg) or True)
+
+        assert bot.buscar_y_publicar_ofertas() == 1
+        data = json.loads(deals_file.read_text())
+        assert 'BOTRO' in data and 'BVARIANTE' not in data
+        assert core.firma_publicacion('Toallitas agua sensibles') in data['_firmas_variantes']
+
+
+# ---------------------------------------------------------------------------
+# Reserva de candidatos — fallback cuando falla la página de una categoría
+# ---------------------------------------------------------------------------
+
+class TestReservaCandidatos:
+    def test_guarda_los_primeros_con_fecha_y_puntuacion(self):
+        reserva = {}
+        candidatos = [make_producto(asin=f'B{i}', puntuacion=(30.0 - i, 0)) for i in range(5)]
+        core.actualizar_reserva(reserva, 'Panales', candidatos, fecha='2026-01-01T10:00:00', maximo=3)
+        assert [c['asin'] for c in reserva['Panales']] == ['B0', 'B1', 'B2']
+        assert reserva['Panales'][0]['fecha'] == '2026-01-01T10:00:00'
+        assert reserva['Panales'][0]['precio'] == '12,99€'
+        assert reserva['Panales'][0]['puntuacion'] == (30.0, 0)
+
+    def test_solo_devuelve_candidatos_frescos(self):
+        ahora = datetime.now()
+        reserva = {}
+        core.actualizar_reserva(reserva, 'Panales', [make_producto(asin='BNUEVO')], fecha=ahora.isoformat())
+        core.actualizar_reserva(reserva, 'Toallitas', [make_producto(asin='BVIEJO')],
+                                fecha=(ahora - timedelta(hours=7)).isoformat())
+        assert [o['asin'] for o in core.candidatos_de_reserva(reserva, 'Panales', 6, ahora)] == ['BNUEVO']
+        assert core.candidatos_de_reserva(reserva, 'Toallitas', 6, ahora) == []
+        assert core.candidatos_de_reserva(reserva, 'Chupetes', 6, ahora) == []
+
+    def test_ida_y_vuelta_por_json(self, tmp_path):
+        ruta = str(tmp_path / 'reserva.json')
+        reserva = {}
+        core.actualizar_reserva(reserva, 'Panales', [make_producto()],
+                                clave_orden=lambda p: (p['descuento'], 1, p['valoraciones'], p['ventas']))
+        core.save_reserva_candidatos(reserva, ruta)
+        guardada = core.load_reserva_candidatos(ruta)
+        assert guardada['Panales'][0]['puntuacion'] == [27.8, 1, 1500, 500]
+        oferta, = core.candidatos_de_reserva(guardada, 'Panales')
+        assert oferta['descuento'] == 27.8
+        assert oferta['tiene_oferta'] is True
+
+    def test_se_guarda_compacta_y_solo_si_cambia(self, tmp_path):
+        ruta = tmp_path / 'reserva.json'
+        reserva = {}
+        core.actualizar_reserva(reserva, 'Panales', [make_producto(titulo='Pañales talla 4')])
+        assert core.save_reserva_candidatos(reserva, str(ruta)) is True
+        assert '\n' not in ruta.read_text(encoding='utf-8')
+        assert core.save_reserva_candidatos(reserva, str(ruta)) is False
+        core.actualizar_reserva(reserva, 'Panales', [make_producto(asin='BOTRO')])
+        assert core.save_reserva_candidatos(reserva, str(ruta)) is True
+
+    def test_fichero_corrupto_es_reserva_vacia(self, tmp_path):
+        ruta = tmp_path / 'reserva.json'
+        ruta.write_text('{no es json')
+        assert core.load_reserva_candidatos(str(ruta)) == {}
+
+    def test_publica_desde_la_reserva_si_fallan_las_paginas(self, monkeypatch, tmp_path, reserva_temporal):
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(tmp_path / 'deals.json'))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'CATEGORIAS_BEBE', [make_categoria()])
+        monkeypatch.setattr(bot, 'extraer_productos_busqueda', lambda html: [
+            make_producto(asin='BPRIMERO', titulo='Pañales Dodot T3', descuento=40.0),
+            make_producto(asin='BSEGUNDO', titulo='Toallitas WaterWipes sin perfume', descuento=30.0),
+        ])
+        publicados = []
+        monkeypatch.setattr(bot, 'send_telegram_photo', lambda url, msg: publicados.append(msg) or True)
+
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: "<html>mock</html>")
+        assert bot.buscar_y_publicar_ofertas() == 1
+        assert [c['asin'] for c in json.loads(reserva_temporal.read_text())['Panales']] == ['BPRIMERO', 'BSEGUNDO']
+
+        # Siguiente ciclo: la pagina falla, se publica el segundo de la reserva sin pedir nada mas
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: None)
+        assert bot.buscar_y_publicar_ofertas() == 1
+        assert 'WaterWipes' in publicados[-1]
+
+    def test_pagina_de_captcha_usa_la_reserva(self, monkeypatch, tmp_path, reserva_temporal):
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(tmp_path / 'deals.json'))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'CATEGORIAS_BEBE', [make_categoria()])
+        monkeypatch.setattr(bot, 'send_telegram_photo', lambda url, msg: True)
+        reserva = {}
+        core.actualizar_reserva(reserva, 'Panales', [make_producto(asin='BRESERVA')])
+        core.save_reserva_candidatos(reserva, str(reserva_temporal))
+
+        # HTTP 200 pero sin ninguna tarjeta de resultado
+        captcha = "<html><body><form action='/errors/validateCaptcha'>Introduce los caracteres</form></body></html>"
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: captcha)
+        assert bot.buscar_y_publicar_ofertas() == 1
+        assert 'BRESERVA' in json.loads((tmp_path / 'deals.json').read_text())
+
+    def test_pagina_sin_descuentos_no_usa_la_reserva(self, monkeypatch, tmp_path, reserva_temporal):
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(tmp_path / 'deals.json'))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'CATEGORIAS_BEBE', [make_categoria()])
+        reserva = {}
+        core.actualizar_reserva(reserva, 'Panales', [make_producto(asin='BRESERVA')])
+        core.save_reserva_candidatos(reserva, str(reserva_temporal))
+
+        # La pagina llega bien, solo que hoy no hay nada rebajado
+        sin_descuento = (
+            '<html><body><div data-component-type="s-search-result" data-asin="B001">'
+            '<h2><a><span>Pañales Dodot T3</span></a></h2>'
+            '<span class="a-price"><span class="a-offscreen">12,99€</span></span></div></body></html>'
+        )
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: sin_descuento)
+        assert bot.buscar_y_publicar_ofertas() == 0
+
+    def test_reserva_caducada_no_se_usa(self, monkeypatch, tmp_path, reserva_temporal):
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(tmp_path / 'deals.json'))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'CATEGORIAS_BEBE', [make_categoria()])
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: None)
+        reserva = {}
+        core.actualizar_reserva(reserva, 'Panales', [make_producto()],
+                                fecha=(datetime.now() - timedelta(hours=core.HORAS_FRESCURA_RESERVA + 1)).isoformat())
+        core.save_reserva_candidatos(reserva, str(reserva_temporal))
+        assert bot.buscar_y_publicar_ofertas() == 0
+
+
 # ---------------------------------------------------------------------------
 # extraer_productos_busqueda
 # ---------------------------------------------------------------------------
@@ -464,6 +974,174 @@ class TestExtraerProductosBusqueda:
         assert len(productos) == 5
 
 
+# ---------------------------------------------------------------------------
+# Producto — registro compacto con acceso tipo dict
+# ---------------------------------------------------------------------------
+
+class TestPrecios:
+    @pytest.mark.parametrize("texto,esperado", [
+        ("19,99€", 1999),
+        ("19,99 €", 1999),
+        ("€19,99", 1999),
+        ("1.299,99 €", 129999),
+        ("1.299 €", 129900),
+        ("19.99", 1999),
+        ("1\xa0299,99\xa0€", 129999),
+        ("12,99 € - 19,99 €", 1299),
+        ("N/A", None),
+        ("", None),
+        (None, None),
+    ])
+    def test_precio_a_centimos(self, texto, esperado):
+        assert precios.precio_a_centimos(texto) == esperado
+
+    def test_rango_devuelve_minimo_y_maximo(self):
+        assert precios.rango_precio_centimos("12,99 € – 19,99 €") == (1299, 1999)
+
+    def test_descuento_con_separador_de_millares(self):
+        html = _html_con_producto(precio_actual="999,99 €", precio_anterior="1.299,99 €")
+        productos = bot.extraer_productos_busqueda(html)
+        assert abs(productos[0]['descuento'] - 23.08) < 0.01
+
+    def test_format_con_separador_de_millares(self):
+        p = {'titulo': 'Cochecito', 'precio': '999,99 €', 'precio_anterior': '1.299,99 €',
+             'url': 'https://www.amazon.es/dp/B001'}
+        msg = bot.format_telegram_message(p, make_categoria())
+        assert "(-23%)" in msg
+
+
+class TestProducto:
+    def _producto(self, **kwargs):
+        datos = dict(asin='B001', titulo='Toallitas WaterWipes', precio='12,99€', precio_anterior='17,99€')
+        datos.update(kwargs)
+        return Producto(**datos)
+
+    def test_precios_en_centimos(self):
+        p = self._producto()
+        assert p['precio_cent'] == 1299
+        assert p['precio_anterior_cent'] == 1799
+
+    def test_descuento_calculado_una_vez(self):
+        p = self._producto(precio='10,00€', precio_anterior='20,00€')
+        assert abs(p['descuento'] - 50.0) < 0.01
+        assert p['tiene_oferta'] is True
+
+    def test_sin_precio_anterior(self):
+        p = self._producto(precio_anterior=None)
+        assert p['descuento'] == 0
+        assert p['tiene_oferta'] is False
+
+    def test_usa_slots(self):
+        p = self._producto()
+        assert not hasattr(p, '__dict__')
+
+    def test_acceso_tipo_dict(self):
+        p = self._producto()
+        assert p.get('variantes_adicionales', []) == []
+        assert 'variantes_adicionales' not in p
+        p['variantes_adicionales'] = [{'asin': 'B002'}]
+        assert 'variantes_adicionales' in p
+        assert dict(p)['asin'] == 'B001'
+
+    def test_clave_desconocida_lanza_keyerror(self):
+        p = self._producto()
+        with pytest.raises(KeyError):
+            p['no_existe']
+        assert p.get('no_existe', 'x') == 'x'
+
+    def test_admite_claves_extra_como_un_dict(self):
+        p = self._producto()
+        p['origen'] = 'busqueda'
+        assert p['origen'] == 'busqueda'
+        assert 'origen' in p
+        assert dict(p)['origen'] == 'busqueda'
+        assert json.loads(json.dumps(dict(p)))['origen'] == 'busqueda'
+        copia = p.copy()
+        copia['origen'] = 'reserva'
+        assert p['origen'] == 'busqueda'
+        del p['origen']
+        assert 'origen' not in p
+        assert len(p) == len(dict(p))
+
+    def test_copy_no_muta_original(self):
+        p = self._producto()
+        copia = p.copy()
+        copia['variantes_adicionales'] = []
+        assert 'variantes_adicionales' not in p
+        assert copia['asin'] == p['asin']
+
+    def test_cambiar_precio_recalcula_centimos(self):
+        p = self._producto()
+        p['precio'] = '9,99€'
+        assert p['precio_cent'] == 999
+
+    def test_extraccion_devuelve_producto_con_tokens(self):
+        productos = bot.extraer_productos_busqueda(_html_con_producto(titulo="Toallitas WaterWipes Originales"))
+        assert isinstance(productos[0], Producto)
+        assert 'waterwipes' in productos[0]['tokens_titulo']
+
+
+class TestLimiteMemoriaParseo:
+    def test_pagina_que_supera_el_limite_no_se_parsea(self, monkeypatch):
+        llamadas = []
+        monkeypatch.setattr(core, '_extraer_productos_html', lambda html: llamadas.append(html) or [])
+        html = _html_con_producto() + " " * 100_000
+        assert core.extraer_productos_busqueda(html, max_memoria_mb=1) == []
+        assert llamadas == []
+
+    def test_limite_cero_desactiva_el_control(self):
+        html = _html_con_producto() + " " * 100_000
+        assert len(core.extraer_productos_busqueda(html, max_memoria_mb=0)) == 1
+
+    def test_limite_no_numerico_en_el_entorno_usa_el_defecto(self, monkeypatch, caplog):
+        monkeypatch.setenv('OFERTAS_MAX_MEMORIA_PAGINA_MB', '256MB')
+        with caplog.at_level('WARNING'):
+            valor = core._entero_de_entorno('OFERTAS_MAX_MEMORIA_PAGINA_MB', core.MAX_MEMORIA_PAGINA_MB_DEFECTO)
+        assert valor == 256
+        assert "no es un numero entero" in caplog.text
+        monkeypatch.setenv('OFERTAS_MAX_MEMORIA_PAGINA_MB', '64')
+        assert core._entero_de_entorno('OFERTAS_MAX_MEMORIA_PAGINA_MB', 256) == 64
+
+    def test_mide_memoria_pico_con_tracemalloc(self, caplog):
+        import tracemalloc
+        with caplog.at_level('INFO'):
+            productos = core.extraer_productos_busqueda(_html_con_producto(), medir_memoria=True)
+        assert len(productos) == 1
+        assert "Memoria pico del parseo" in caplog.text
+        assert not tracemalloc.is_tracing()
+
+    def test_arbol_se_destruye_tras_extraer(self, monkeypatch):
+        destruidos = []
+        original = core.BeautifulSoup.decompose
+        monkeypatch.setattr(core.BeautifulSoup, 'decompose', lambda self: destruidos.append(self) or original(self))
+        core.extraer_productos_busqueda(_html_con_producto())
+        assert len(destruidos) == 1
+
+
+class TestEtapaParseo:
+    def test_sin_procesos_parsea_en_el_momento(self):
+        with core.EtapaParseo(0) as etapa:
+            futuro = etapa.enviar(_html_con_producto(asin="B001SYNC"))
+            assert futuro.done()
+        assert futuro.result()[0]['asin'] == "B001SYNC"
+
+    def test_pool_de_procesos_devuelve_productos(self):
+        with core.EtapaParseo(2) as etapa:
+            futuros = [etapa.enviar(_html_con_producto(asin=f"B00POOL{i}")) for i in range(3)]
+        asins = [f.result()[0]['asin'] for f in futuros]
+        assert asins == ["B00POOL0", "B00POOL1", "B00POOL2"]
+        assert isinstance(futuros[0].result()[0], Producto)
+
+    def test_error_del_extractor_queda_en_el_futuro(self):
+        def extractor_roto(html):
+            raise ValueError("html roto")
+
+        with core.EtapaParseo(0, extractor=extractor_roto) as etapa:
+            futuro = etapa.enviar("<html></html>")
+        with pytest.raises(ValueError):
+            futuro.result()
+
+
 # ---------------------------------------------------------------------------
 # buscar_y_publicar_ofertas — lógica de selección (sin red)
 # ---------------------------------------------------------------------------
@@ -638,6 +1316,32 @@ class TestBuscarYPublicarOfertas:
         )
         assert not any(tronas_url in u for u in categorias_scrapeadas)
 
+    def test_publica_varias_por_ciclo_y_guarda_cada_una(self, monkeypatch, tmp_path):
+        """Con OFERTAS_POR_CICLO=3 se publican las 3 mejores de categorias distintas en un solo scrapeo."""
+        deals_file = tmp_path / 'deals.json'
+        monkeypatch.setattr(bot, 'POSTED_BEBE_DEALS_FILE', str(deals_file))
+        monkeypatch.setattr(bot, 'TELEGRAM_BOT_TOKEN', 'mock_token')
+        monkeypatch.setattr(bot, 'TELEGRAM_CHAT_ID', 'mock_chat_id')
+        monkeypatch.setattr(bot, 'OFERTAS_POR_CICLO', 3)
+        monkeypatch.setattr(bot, 'PAUSA_ENTRE_PUBLICACIONES', 0)
+        titulos = ['Cuna colecho', 'Mochila portabebe', 'Termometro digital', 'Saco de dormir',
+                   'Hamaca balancin', 'Cambiador plegable', 'Vigilabebes audio', 'Silla paseo',
+                   'Esterilizador vapor', 'Cojin lactancia', 'Trona plegable', 'Vaso antigoteo']
+        urls = [core.BASE_URL + c['url'] for c in bot.CATEGORIAS_BEBE]
+        monkeypatch.setattr(bot, 'obtener_pagina', lambda url: url)
+        monkeypatch.setattr(bot, 'extraer_productos_busqueda', lambda url: [make_producto(
+            asin=f'B{urls.index(url):03d}', titulo=titulos[urls.index(url)], descuento=30.0,
+        )])
+        enviados = []
+        # El segundo envio falla: no cuenta ni se guarda, el ciclo sigue con el tercero
+        monkeypatch.setattr(bot, 'send_telegram_photo', lambda url, msg: enviados.append(msg) or len(enviados) != 2)
+
+        assert bot.buscar_y_publicar_ofertas() == 2
+        assert len(enviados) == 3
+        data = json.loads(deals_file.read_text())
+        assert len(data['_ultimas_categorias']) == 2
+        assert len([k for k in data if not k.startswith('_')]) == 2
+
 
 # ---------------------------------------------------------------------------
 # son_variantes - Detecta variantes de productos
@@ -11,7 +11,6 @@ import sys
 import logging
 import html
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 
 # Add project root to path so shared/ is importable
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,20 +18,27 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from shared.amazon_ofertas_core import (
     setup_logging,
     BASE_URL,
-    PARTNER_TAG,
     obtener_pagina,
     extraer_productos_busqueda,
+    es_texto_prereserva,
     normalizar_titulo,
     titulos_similares,
     titulo_similar_a_recientes,
     agrupar_variantes,
     format_telegram_message,
+    prefiltrar_tarjetas_con_oferta,
     obtener_prioridad_marca as _obtener_prioridad_marca_core,
+    anotar_marca,
     send_telegram_message as _send_telegram_message_core,
     send_telegram_photo as _send_telegram_photo_core,
+    load_reserva_candidatos as _load_reserva_candidatos_core,
+    save_reserva_candidatos as _save_reserva_candidatos_core,
+)
+from shared.estado import (
     load_posted_deals as _load_posted_deals_core,
     save_posted_deals as _save_posted_deals_core,
 )
+from shared.pipeline import ConfigCanal, ejecutar_ciclo
 
 _LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ofertas_ps.log")
 setup_logging(_LOG_FILE)
@@ -53,6 +59,11 @@ DEV_MODE = False
 # Archivo para guardar ofertas ya publicadas
 POSTED_PS_DEALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "posted_ps_deals.json")
 
+# Reserva de candidatos del ultimo scrapeo (si falla la pagina de una categoria
+# se publica desde aqui, sin peticiones extra, mientras sean recientes)
+RESERVA_CANDIDATOS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reserva_ps_candidatos.json")
+
+
 # Archivo para guardar preórdenes ya publicadas (ventana separada de 48h)
 POSTED_PS_PRERESERVAS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "posted_ps_prereservas.json")
 
@@ -74,6 +85,10 @@ def _effective_chat_id():
 # (para evitar publicar el mismo tipo de producto repetidamente)
 CATEGORIAS_VERIFICAR_TITULOS = ["Juegos PS5", "Juegos PS4"]
 
+# Umbral de similitud (Jaccard de palabras) a partir del cual un titulo
+# cuenta como repetido de uno reciente
+UMBRAL_SIMILITUD_TITULOS = 0.5
+
 # Categorias que solo se publican una vez por semana (no aplica en PS)
 CATEGORIAS_LIMITE_SEMANAL = []
 
@@ -83,6 +98,17 @@ LIMITE_ACCESORIOS_DIAS = 3
 # Límite global de 7 días entre publicaciones (videojuegos o accesorios)
 LIMITE_GLOBAL_DIAS = 7
 
+# Ofertas a publicar por ciclo (las mejores que cumplen anti-repeticion,
+# límites y diversidad); con 1 se comporta como siempre
+OFERTAS_POR_CICLO = 1
+
+# Segundos entre publicaciones del mismo ciclo (límite de mensajes de Telegram)
+PAUSA_ENTRE_PUBLICACIONES = 5
+
+# Procesos para parsear paginas en paralelo mientras se descargan las siguientes
+# (0 = parseo en el proceso principal, como siempre)
+PROCESOS_PARSEO = 0
+
 # Marcas prioritarias (se prefieren cuando hay igualdad de descuento)
 MARCAS_PRIORITARIAS = ["sony", "playstation", "nacon", "thrustmaster", "razer", "hyperx"]
 
@@ -116,6 +142,11 @@ def obtener_prioridad_marca(titulo):
     return _obtener_prioridad_marca_core(titulo, MARCAS_PRIORITARIAS)
 
 
+def prioridad_producto(producto):
+    """Prioridad de marca del producto: se calcula la primera vez y queda guardada en el registro."""
+    return anotar_marca(producto, MARCAS_PRIORITARIAS)
+
+
 def send_telegram_message(message):
     """Envia un mensaje al canal de Telegram de PS."""
     return _send_telegram_message_core(message, _effective_token(), _effective_chat_id())
@@ -128,27 +159,37 @@ def send_telegram_photo(photo_url, caption):
 
 def load_posted_deals():
     """
-    Carga las ofertas publicadas (ultimas 4 dias/96h) desde un archivo JSON.
+    Carga las ofertas publicadas (ultimas 4 dias/96h) del historial (JSON, SQLite o diario, ver shared.estado).
     Retorna tupla: (dict_ofertas, ultimas_categorias, ultimos_titulos, categorias_semanales)
     """
     return _load_posted_deals_core(POSTED_PS_DEALS_FILE, horas_ventana=96)
 
 
 def save_posted_deals(deals_dict, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
-    """Guarda el diccionario de ofertas publicadas en un archivo JSON."""
+    """Guarda el diccionario de ofertas publicadas en el historial (JSON, SQLite o diario)."""
     return _save_posted_deals_core(deals_dict, POSTED_PS_DEALS_FILE, ultimas_categorias, ultimos_titulos, categorias_semanales)
 
 
+def load_reserva_candidatos():
+    """Carga la reserva de candidatos por categoria del ultimo scrapeo."""
+    return _load_reserva_candidatos_core(RESERVA_CANDIDATOS_FILE)
+
+
+def save_reserva_candidatos(reserva):
+    """Guarda la reserva de candidatos por categoria."""
+    return _save_reserva_candidatos_core(reserva, RESERVA_CANDIDATOS_FILE)
+
+
 def load_posted_prereservas():
     """
-    Carga las preórdenes publicadas (ultimas 48h) desde un archivo JSON.
+    Carga las preórdenes publicadas (ultimas 48h) del historial (JSON, SQLite o diario).
     Retorna: dict de ASINs -> timestamps
     """
     return _load_posted_deals_core(POSTED_PS_PRERESERVAS_FILE, horas_ventana=LIMITE_PRERESERVAS_HORAS)[0]
 
 
 def save_posted_prereservas(deals_dict):
-    """Guarda el diccionario de preórdenes publicadas en un archivo JSON."""
+    """Guarda el diccionario de preórdenes publicadas en el historial (JSON, SQLite o diario)."""
     return _save_posted_deals_core(deals_dict, POSTED_PS_PRERESERVAS_FILE)
 
 
@@ -159,42 +200,16 @@ def _es_prereserva_item(item_html):
     - Disponibilidad futura: "disponible el", "próximamente", "próxima semana"
     - Preorden: "preventa", "pre-orden", "preorder", "reservar"
     - Fechas futuras: referencias a meses (febrero, marzo, etc.) o años (2026, 2027)
+
+    extraer_productos_busqueda ya calcula esta señal ('es_prereserva') al
+    recorrer cada item; esta función se mantiene para items sueltos.
     """
     try:
         texto = item_html.get_text(strip=True).lower()
     except (AttributeError, TypeError):
         return False
 
-    # Indicadores de preorden/próximo lanzamiento
-    indicadores_preorden = [
-        'disponible el ',
-        'disponible a partir',
-        'próximamente',
-        'próxima',
-        'pronto disponible',
-        'preventa',
-        'pre-orden',
-        'preorden',
-        'preorder',
-        'reservar',
-        'reserva',
-        'en reserva',
-        'fecha de lanzamiento',
-        'lanzamiento',
-        'nuevo lanzamiento',
-    ]
-
-    # Si contiene indicador de preorden, es preorden
-    if any(ind in texto for ind in indicadores_preorden):
-        # Pero filtrar falsos positivos como "sin bono de reserva"
-        if 'sin bono' in texto or 'no recomendada' in texto:
-            # Aquí estamos en el título/descripción normal, probablemente falso positivo
-            # Solo aceptar si hay un indicador fuerte adicional
-            if not any(ind in texto for ind in ['disponible el', 'próximamente', 'pronto disponible', 'fecha de lanzamiento']):
-                return False
-        return True
-
-    return False
+    return es_texto_prereserva(texto)
 
 
 def format_prereserva_message(producto, categoria):
@@ -213,321 +228,103 @@ def format_prereserva_message(producto, categoria):
     return message
 
 
-def buscar_y_publicar_ofertas():
-    """
-    Busca la mejor oferta de cada categoria y publica la de mayor descuento.
-    Prioriza siempre videojuegos sobre accesorios.
-    """
-    if not _effective_token() or not _effective_chat_id():
-        if DEV_MODE:
-            log.error(
-                "DEV_MODE activo pero credenciales dev no configuradas. "
-                "Establece DEV_TELEGRAM_PS_BOT_TOKEN y DEV_TELEGRAM_PS_CHAT_ID."
-            )
-        else:
-            log.error(
-                "Credenciales de Telegram no configuradas. "
-                "Establece las variables de entorno TELEGRAM_PS_BOT_TOKEN y TELEGRAM_PS_CHAT_ID."
-            )
-        return 0
-
-    log.info("=" * 60)
-    if DEV_MODE:
-        log.info("INICIO [DEV MODE] - BUSCADOR DE OFERTAS PS4/PS5 | Amazon.es -> Telegram (canal de pruebas)")
-    else:
-        log.info("INICIO - BUSCADOR DE OFERTAS PS4/PS5 | Amazon.es -> Telegram")
-    log.info("Tag de afiliado: %s | Hora: %s", PARTNER_TAG, datetime.now().strftime('%d/%m/%Y %H:%M'))
-    log.info("=" * 60)
-
-    # Cargar ofertas ya publicadas (ultimas 48h), ultimas categorias y titulos
-    # En DEV_MODE se ignora el historial para no contaminar el JSON de produccion
-    if DEV_MODE:
-        posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales = {}, [], [], {}
-        log.info("DEV_MODE: historial de publicaciones ignorado (posted_ps_deals.json no se leerá ni escribirá)")
-    else:
-        posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales = load_posted_deals()
-    posted_asins = set(posted_deals.keys())
-
-    if ultimas_categorias:
-        log.info(
-            "Anti-repeticion de categoria: se evitaran las ultimas %d categorias [%s]",
-            len(ultimas_categorias), ", ".join(ultimas_categorias)
-        )
-    if ultimos_titulos:
-        log.info(
-            "Anti-titulo-similar activo para categorias %s (%d titulos recientes guardados)",
-            ", ".join(CATEGORIAS_VERIFICAR_TITULOS), len(ultimos_titulos)
-        )
-
-    now = datetime.now()
-    una_semana = timedelta(days=7)
+def _accesorios_bloqueados(estado):
+    """Anota en el estado si se publicó un accesorio en los últimos LIMITE_ACCESORIOS_DIAS días."""
+    estado.extra['accesorios_bloqueados'] = False
+    ultima_pub_accesorio_str = estado.categorias_semanales.get("_accesorios_ultima_pub")
+    if not ultima_pub_accesorio_str:
+        return
     tres_dias = timedelta(days=LIMITE_ACCESORIOS_DIAS)
-    siete_dias = timedelta(days=LIMITE_GLOBAL_DIAS)
-
-
-    # Verificar si se publicó un accesorio en los últimos 3 días
-    accesorios_bloqueados = False
-    ultima_pub_accesorio_str = categorias_semanales.get("_accesorios_ultima_pub")
-    if ultima_pub_accesorio_str:
-        try:
-            ultima_pub_accesorio = datetime.fromisoformat(ultima_pub_accesorio_str)
-            tiempo_transcurrido = now - ultima_pub_accesorio
-            if tiempo_transcurrido < tres_dias:
-                accesorios_bloqueados = True
-                dias_restantes = (tres_dias - tiempo_transcurrido).days + 1
-                log.info(
-                    "Límite de 3 días para accesorios: última publicación de accesorio el %s (hace %d días, faltan ~%d días)",
-                    ultima_pub_accesorio.strftime('%d/%m %H:%M'), tiempo_transcurrido.days, dias_restantes
-                )
-        except (ValueError, TypeError):
-            pass
-
-    # Recopilar la mejor oferta de cada categoria
-    mejores_por_categoria = []
-    mejores_videojuegos = []  # Separar videojuegos para priorizarlos
-
-    for categoria in CATEGORIAS_PS:
-        log.info("")
-        log.info("--- Categoria: %s ---", categoria['nombre'])
-
-        # Verificar límite de 3 días para accesorios
-        if accesorios_bloqueados and categoria['tipo'] == 'accesorio':
-            log.info("  SALTADA por límite de 3 días para accesorios")
-            continue
-
-        # Verificar limite semanal para ciertas categorias
-        if categoria['nombre'] in CATEGORIAS_LIMITE_SEMANAL:
-            ultima_pub_str = categorias_semanales.get(categoria['nombre'])
-            if ultima_pub_str:
-                try:
-                    ultima_pub = datetime.fromisoformat(ultima_pub_str)
-                    tiempo_transcurrido = now - ultima_pub
-                    if tiempo_transcurrido < una_semana:
-                        dias_restantes = (una_semana - tiempo_transcurrido).days + 1
-                        log.info(
-                            "  SALTADA por limite semanal: ultima publicacion el %s (hace %d dias, faltan ~%d dias)",
-                            ultima_pub.strftime('%d/%m %H:%M'), tiempo_transcurrido.days, dias_restantes
-                        )
-                        continue
-                    else:
-                        log.debug(
-                            "  Limite semanal OK: ultima publicacion hace %d dias (supera los 7 requeridos)",
-                            tiempo_transcurrido.days
-                        )
-                except (ValueError, TypeError):
-                    pass
-
-        url = BASE_URL + categoria['url']
-        html_content = obtener_pagina(url)
-
-        if not html_content:
-            log.warning("  No se pudo obtener la pagina, saltando categoria")
-            continue
-
-        productos = extraer_productos_busqueda(html_content)
-        ofertas = [p for p in productos if p['tiene_oferta']]
-        sin_oferta = len(productos) - len(ofertas)
+    try:
+        ultima_pub_accesorio = datetime.fromisoformat(ultima_pub_accesorio_str)
+    except (ValueError, TypeError):
+        return
+    tiempo_transcurrido = estado.ahora - ultima_pub_accesorio
+    if tiempo_transcurrido < tres_dias:
+        estado.extra['accesorios_bloqueados'] = True
+        dias_restantes = (tres_dias - tiempo_transcurrido).days + 1
         log.info(
-            "  Scraped: %d productos (%d con oferta, %d sin descuento)",
-            len(productos), len(ofertas), sin_oferta
+            "Límite de 3 días para accesorios: última publicación de accesorio el %s (hace %d días, faltan ~%d días)",
+            ultima_pub_accesorio.strftime('%d/%m %H:%M'), tiempo_transcurrido.days, dias_restantes
         )
 
-        if not ofertas:
-            log.info("  No hay productos con descuento en esta categoria")
-            continue
-
-        # Ordenar ofertas: primero por mayor descuento, luego marca prioritaria, luego valoraciones, luego ventas
-        ofertas_ordenadas = sorted(
-            ofertas,
-            key=lambda x: (x['descuento'], obtener_prioridad_marca(x['titulo']), x['valoraciones'], x['ventas']),
-            reverse=True
-        )
 
-        # Log de los top candidatos antes de filtrar
-        log.debug("  Top candidatos antes de filtros anti-duplicacion:")
-        for i, p in enumerate(ofertas_ordenadas[:5], 1):
-            marca_flag = " [MARCA PRIO]" if obtener_prioridad_marca(p['titulo']) else ""
-            log.debug(
-                "    %d. [%s] %s | %.0f%% dto | %d vals | %d ventas%s",
-                i, p['asin'], p['titulo'][:50], p['descuento'],
-                p['valoraciones'], p['ventas'], marca_flag
-            )
-
-        # Buscar la mejor oferta no publicada en esta categoria
-        verificar_titulos = categoria['nombre'] in CATEGORIAS_VERIFICAR_TITULOS
-        candidato_elegido = None
-
-        for producto in ofertas_ordenadas:
-            asin = producto['asin']
-            titulo_corto = producto['titulo'][:45]
+def _saltar_accesorio(categoria, estado):
+    if estado.extra.get('accesorios_bloqueados') and categoria['tipo'] == 'accesorio':
+        log.info("  SALTADA por límite de 3 días para accesorios")
+        return True
+    return False
 
-            if asin in posted_asins:
-                log.info(
-                    "  DESCARTADO [ya publicado en <48h] %s... (%.0f%% dto, ASIN: %s)",
-                    titulo_corto, producto['descuento'], asin
-                )
-                continue
 
-            if verificar_titulos and titulo_similar_a_recientes(producto['titulo'], ultimos_titulos):
-                log.info(
-                    "  DESCARTADO [titulo similar a reciente] %s... (%.0f%% dto)",
-                    titulo_corto, producto['descuento']
-                )
-                continue
-
-            candidato_elegido = producto
-            marca_flag = " [marca prioritaria]" if obtener_prioridad_marca(producto['titulo']) else ""
-            log.info(
-                "  ELEGIDO para categoria: %s... (%.0f%% dto, %d valoraciones, ASIN: %s)%s",
-                titulo_corto, producto['descuento'], producto['valoraciones'], asin, marca_flag
-            )
-
-            # Separar videojuegos de accesorios para priorizar videojuegos
-            entrada = {
-                'producto': producto,
-                'categoria': categoria
-            }
-            if categoria['tipo'] == 'videojuego':
-                mejores_videojuegos.append(entrada)
-            else:
-                mejores_por_categoria.append(entrada)
-            break
-
-        if candidato_elegido is None:
-            log.info("  Sin candidatos validos: todos descartados por duplicacion o similitud de titulo")
-
-    # Priorizar videojuegos: agregar los videojuegos ordenados antes que accesorios
-    # Combinar: primero videojuegos ordenados por descuento, luego accesorios
-    mejores_videojuegos.sort(
-        key=lambda x: (x['producto']['descuento'], obtener_prioridad_marca(x['producto']['titulo'])),
+def _videojuegos_primero(entradas):
+    """Prioriza videojuegos: primero los videojuegos ordenados por descuento y marca, luego accesorios."""
+    videojuegos = [e for e in entradas if e['categoria']['tipo'] == 'videojuego']
+    accesorios = [e for e in entradas if e['categoria']['tipo'] != 'videojuego']
+    videojuegos.sort(
+        key=lambda x: (x['producto']['descuento'], prioridad_producto(x['producto'])),
         reverse=True
     )
-    mejores_por_categoria = mejores_videojuegos + mejores_por_categoria
-
-    # Agrupar variantes (ej: FIFA 26 PS4 + FIFA 26 PS5 → un solo grupo)
-    mejores_por_categoria = agrupar_variantes(mejores_por_categoria)
+    return videojuegos + accesorios
 
-    # De entre las mejores ofertas, seleccionar la de mayor descuento
-    if not mejores_por_categoria:
-        log.info("")
-        log.info("=" * 60)
-        log.info("RESULTADO: No hay ofertas nuevas para publicar en este ciclo")
-        log.info("=" * 60)
-        return 0
 
-    # Ordenar por descuento y marca prioritaria, seleccionar la mejor
-    mejores_por_categoria.sort(
-        key=lambda x: (x['producto']['descuento'], obtener_prioridad_marca(x['producto']['titulo'])),
-        reverse=True
+def _un_accesorio_por_ciclo(entrada, elegidas):
+    """Un solo accesorio por ciclo: tras publicarlo empieza el límite de 3 días."""
+    return entrada['categoria']['tipo'] != 'accesorio' or all(
+        e['categoria']['tipo'] != 'accesorio' for e in elegidas
     )
 
-    log.info("")
-    log.info("--- Seleccion global (ranking de mejores por categoria) ---")
-    for i, entrada in enumerate(mejores_por_categoria, 1):
-        p = entrada['producto']
-        cat = entrada['categoria']['nombre']
-        tipo_cat = entrada['categoria']['tipo']
-        marca_flag = " [marca prio]" if obtener_prioridad_marca(p['titulo']) else ""
-        en_ultimas = " [cat. reciente]" if cat in ultimas_categorias else ""
-        log.info(
-            "  %d. [%s] %s... | %.0f%% dto | cat: %s (%s)%s%s",
-            i, p['asin'], p['titulo'][:40], p['descuento'], cat, tipo_cat, marca_flag, en_ultimas
-        )
-
-    # Evitar repetir categorias de las ultimas 4 publicaciones
-    mejor_oferta = None
-    categorias_excluidas_repeticion = []  # En PS no excluimos ninguna categoria de repeticion
 
-    for oferta in mejores_por_categoria:
-        nombre_categoria = oferta['categoria']['nombre']
-        if nombre_categoria not in ultimas_categorias or nombre_categoria in categorias_excluidas_repeticion:
-            mejor_oferta = oferta
-            break
-
-    if mejor_oferta is None:
-        log.info(
-            "Todas las categorias candidatas estan en el historial reciente [%s], "
-            "publicando la mejor disponible igualmente",
-            ", ".join(ultimas_categorias)
-        )
-        mejor_oferta = mejores_por_categoria[0]
-    elif mejor_oferta != mejores_por_categoria[0]:
-        primera_cat = mejores_por_categoria[0]['categoria']['nombre']
-        log.info(
-            "Anti-repeticion: la #1 global (%s) fue descartada porque su categoria '%s' "
-            "aparece en las recientes [%s]. Se elige la siguiente valida.",
-            mejores_por_categoria[0]['producto']['titulo'][:35],
-            primera_cat,
-            ", ".join(ultimas_categorias)
-        )
-
-    producto = mejor_oferta['producto']
-    categoria = mejor_oferta['categoria']
-
-    log.info("")
-    log.info(">>> OFERTA SELECCIONADA PARA PUBLICAR:")
-    log.info("    Titulo:    %s", producto['titulo'])
-    log.info("    Categoria: %s | Descuento: %.0f%%", categoria['nombre'], producto['descuento'])
-    log.info("    Precio:    %s (antes: %s)", producto['precio'], producto.get('precio_anterior', 'N/A'))
-    log.info("    ASIN:      %s | Valoraciones: %d | Ventas: %d",
-             producto['asin'], producto['valoraciones'], producto['ventas'])
-    log.info("    URL:       %s", producto['url'])
-
-    # Formatear mensaje
-    mensaje = format_telegram_message(producto, categoria)
-
-    # Enviar a Telegram (con foto si disponible)
-    if producto['imagen']:
-        log.debug("    Enviando con foto: %s", producto['imagen'])
-        exito = send_telegram_photo(producto['imagen'], mensaje)
-    else:
-        log.debug("    Enviando sin foto (no disponible)")
-        exito = send_telegram_message(mensaje)
-
-    ofertas_publicadas = 0
-    if exito:
-        posted_deals[producto['asin']] = datetime.now().isoformat()
-        # Guardar también ASINs de variantes agrupadas para evitar republicarlas
-        for variante in producto.get('variantes_adicionales', []):
-            posted_deals[variante['asin']] = datetime.now().isoformat()
-        # Añadir categoria al inicio de la lista y mantener solo las ultimas 4
-        ultimas_categorias.insert(0, categoria['nombre'])
-        ultimas_categorias = ultimas_categorias[:4]
-        log.debug("Historial de categorias actualizado: %s", ", ".join(ultimas_categorias))
-
-        # Si es categoria con verificacion de titulos, guardar el titulo
-        if categoria['nombre'] in CATEGORIAS_VERIFICAR_TITULOS:
-            ultimos_titulos.insert(0, producto['titulo'])
-            ultimos_titulos = ultimos_titulos[:4]
-            log.debug("Titulo guardado en anti-similitud (total: %d)", len(ultimos_titulos))
-
-        # Si es categoria con limite semanal, guardar el timestamp
-        if categoria['nombre'] in CATEGORIAS_LIMITE_SEMANAL:
-            categorias_semanales[categoria['nombre']] = datetime.now().isoformat()
-            log.debug("Timestamp de limite semanal actualizado para categoria '%s'", categoria['nombre'])
-
-        # Si es un accesorio, guardar el timestamp de última publicación de accesorio
-        if categoria['tipo'] == 'accesorio':
-            categorias_semanales["_accesorios_ultima_pub"] = datetime.now().isoformat()
-            log.debug("Timestamp de límite de 3 días para accesorios actualizado")
-
-        ofertas_publicadas = 1
-    else:
-        log.error("Fallo al enviar a Telegram, no se guarda el ASIN en el historial")
-
-    # Guardar ofertas publicadas, ultimas categorias y titulos
-    # En DEV_MODE no se escribe para no contaminar el historial de produccion
-    if DEV_MODE:
-        log.info("DEV_MODE: historial no guardado (posted_ps_deals.json sin cambios)")
-    else:
-        save_posted_deals(posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales)
+def _registrar_accesorio(entrada, estado):
+    # Si es un accesorio, guardar el timestamp de última publicación de accesorio
+    if entrada['categoria']['tipo'] == 'accesorio':
+        estado.categorias_semanales["_accesorios_ultima_pub"] = datetime.now().isoformat()
+        log.debug("Timestamp de límite de 3 días para accesorios actualizado")
+
+
+def config_canal():
+    """Configuración del canal para el pipeline (se lee en cada ciclo: respeta --dev, --por-ciclo...)."""
+    return ConfigCanal(
+        nombre="BUSCADOR DE OFERTAS PS4/PS5",
+        categorias=CATEGORIAS_PS,
+        token=_effective_token(),
+        chat_id=_effective_chat_id(),
+        variables_credenciales=("TELEGRAM_PS_BOT_TOKEN", "TELEGRAM_PS_CHAT_ID"),
+        obtener_pagina=obtener_pagina,
+        extraer=extraer_productos_busqueda,
+        prefiltro=prefiltrar_tarjetas_con_oferta,
+        procesos_parseo=PROCESOS_PARSEO,
+        send_photo=send_telegram_photo,
+        send_message=send_telegram_message,
+        format_mensaje=format_telegram_message,
+        load_posted_deals=load_posted_deals,
+        save_posted_deals=save_posted_deals,
+        load_reserva=load_reserva_candidatos,
+        save_reserva=save_reserva_candidatos,
+        fichero_historial=os.path.basename(POSTED_PS_DEALS_FILE),
+        prioridad=prioridad_producto,
+        titulo_similar=titulo_similar_a_recientes,
+        agrupar_variantes=agrupar_variantes,
+        dev_mode=DEV_MODE,
+        categorias_verificar_titulos=CATEGORIAS_VERIFICAR_TITULOS,
+        umbral_similitud=UMBRAL_SIMILITUD_TITULOS,
+        categorias_limite_semanal=CATEGORIAS_LIMITE_SEMANAL,
+        categorias_excluidas_repeticion=[],  # En PS no excluimos ninguna categoria de repeticion
+        ofertas_por_ciclo=OFERTAS_POR_CICLO,
+        pausa_entre_publicaciones=PAUSA_ENTRE_PUBLICACIONES,
+        al_cargar_estado=_accesorios_bloqueados,
+        saltar_categoria=_saltar_accesorio,
+        ordenar_ganadores=_videojuegos_primero,
+        admitir=_un_accesorio_por_ciclo,
+        al_publicar=_registrar_accesorio,
+    )
 
-    log.info("")
-    log.info("=" * 60)
-    log.info("FIN - %s oferta publicada en Telegram", ofertas_publicadas)
-    log.info("=" * 60)
 
-    return ofertas_publicadas
+def buscar_y_publicar_ofertas():
+    """
+    Busca la mejor oferta de cada categoria y publica las de mayor descuento
+    (hasta OFERTAS_POR_CICLO). Prioriza siempre videojuegos sobre accesorios.
+    """
+    return ejecutar_ciclo(config_canal())
 
 
 def buscar_prereservas_ps():
@@ -562,29 +359,24 @@ def buscar_prereservas_ps():
             log.warning("  No se pudo obtener la página, saltando")
             continue
 
-        soup = BeautifulSoup(html_content, 'html.parser')
-        items = soup.select('[data-component-type="s-search-result"]')
+        # Un solo recorrido del HTML: cada producto ya trae su señal 'es_prereserva'.
+        # Sin prefiltro de ofertas: las preórdenes casi nunca tienen precio tachado.
+        productos = extraer_productos_busqueda(html_content)
+        del html_content
 
-        log.info("  Encontrados %d items, verificando si son preórdenes...", len(items))
+        log.info("  Encontrados %d items, verificando si son preórdenes...", len(productos))
         items_descartados = 0
-        for item in items[:20]:
-            asin = item.get('data-asin', '')
-            if not asin or asin in posted_prereservas_asins:
+        for producto in productos:
+            asin = producto['asin']
+            if asin in posted_prereservas_asins:
                 continue
-            if not _es_prereserva_item(item):
+            if not producto.get('es_prereserva'):
                 items_descartados += 1
-                # DEBUG: mostrar texto del item para investigar por qué se descarta
-                texto_item = item.get_text(strip=True)[:100]
-                log.debug("    [DESCARTADO] ASIN %s: %s...", asin, texto_item)
+                log.debug("    [DESCARTADO] ASIN %s: %s...", asin, producto['titulo'][:100])
                 continue
 
-            # Extraer datos básicos del producto del item individual
-            # Convertir el item BeautifulSoup a string para que extraer_productos_busqueda lo procese
-            productos = extraer_productos_busqueda(str(item))
-            if productos:
-                producto = productos[0]
-                candidatos.append({'producto': producto, 'categoria': categoria})
-                log.info("    [PREORDEN] %s (ASIN: %s)", producto['titulo'][:50], asin)
+            candidatos.append({'producto': producto, 'categoria': categoria})
+            log.info("    [PREORDEN] %s (ASIN: %s)", producto['titulo'][:50], asin)
 
         if items_descartados > 0:
             log.info("  %d items descartados por no tener señales de preorden", items_descartados)
@@ -670,10 +462,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Buscador de ofertas PS4/PS5 en Amazon.es')
     parser.add_argument('--dev', action='store_true', help='Modo desarrollo: publica en canal de pruebas y no modifica el JSON de produccion')
     parser.add_argument('--continuo', '-c', action='store_true', help='Ejecuta en bucle cada 15 minutos')
+    parser.add_argument('--por-ciclo', type=int, default=None, metavar='N',
+                        help=f'Ofertas a publicar por ciclo (default {OFERTAS_POR_CICLO})')
     args = parser.parse_args()
 
     if args.dev:
         globals()['DEV_MODE'] = True
         log.info("CLI: DEV_MODE activado (canal de pruebas, JSON de prod intacto)")
+    if args.por_ciclo is not None:
+        globals()['OFERTAS_POR_CICLO'] = max(1, args.por_ciclo)
+        log.info("CLI: hasta %d ofertas por ciclo", OFERTAS_POR_CICLO)
 
     main(modo_continuo=args.continuo)
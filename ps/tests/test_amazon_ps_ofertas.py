@@ -20,12 +20,21 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 
 import ps.amazon_ps_ofertas as bot
 import shared.amazon_ofertas_core as core
+from shared import pipeline, simulador
 
 
 # ---------------------------------------------------------------------------
 # Helpers de fixtures
 # ---------------------------------------------------------------------------
 
+@pytest.fixture(autouse=True)
+def reserva_temporal(tmp_path, monkeypatch):
+    """Cada test usa su propia reserva de candidatos (nunca el fichero real del canal)."""
+    ruta = tmp_path / 'reserva.json'
+    monkeypatch.setattr(bot, 'RESERVA_CANDIDATOS_FILE', str(ruta))
+    return ruta
+
+
 def make_producto(**kwargs):
     """Crea un producto con valores por defecto, sobreescribibles."""
     defaults = {
@@ -93,6 +102,37 @@ class TestNormalizarTitulo:
         result = bot.normalizar_titulo("de para con sin el la los las")
         assert result == set()
 
+    def test_devuelve_copia_mutable_del_cache(self):
+        result = bot.normalizar_titulo("Mando DualSense PS5")
+        result.add('otra')
+        assert 'otra' not in bot.normalizar_titulo("Mando DualSense PS5")
+
+
+class TestTokenizarTitulo:
+    def test_devuelve_frozenset_igual_a_normalizar(self):
+        titulo = "Juego de PS5 Elden Ring para la consola"
+        result = core.tokenizar_titulo(titulo)
+        assert isinstance(result, frozenset)
+        assert result == bot.normalizar_titulo(titulo)
+
+    def test_memoiza_por_titulo(self):
+        core.tokenizar_titulo.cache_clear()
+        core.tokenizar_titulo("Mando DualSense PS5 blanco")
+        core.tokenizar_titulo("Mando DualSense PS5 blanco")
+        info = core.tokenizar_titulo.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+
+    def test_cache_acotado(self):
+        assert core.tokenizar_titulo.cache_info().maxsize == core.TAMANO_CACHE_TOKENS
+
+    def test_candidatos_contra_historial_tokeniza_cada_titulo_una_vez(self):
+        core.tokenizar_titulo.cache_clear()
+        historial = [f"Juego PS5 Titulo{i} Edicion" for i in range(20)]
+        candidatos = [f"Mando PS5 Modelo{i}" for i in range(5)]
+        for candidato in candidatos:
+            core.titulo_similar_a_recientes(candidato, historial)
+        assert core.tokenizar_titulo.cache_info().misses == len(candidatos) + len(historial)
+
 
 # ---------------------------------------------------------------------------
 # titulos_similares
@@ -138,17 +178,17 @@ class TestTitulosSimilares:
 
 class TestTituloSimilarARecientes:
     def test_sin_recientes_devuelve_false(self):
-        assert bot.titulo_similar_a_recientes("Juego PS5 Elden Ring", []) is False
+        assert core.titulo_similar_a_recientes("Juego PS5 Elden Ring", []) is False
 
     def test_detecta_similar_entre_recientes(self):
         recientes = ["Juego PS5 The Last of Us Part II"]
-        assert bot.titulo_similar_a_recientes(
+        assert core.titulo_similar_a_recientes(
             "Juego PS5 The Last of Us Part I", recientes
         ) is True
 
     def test_no_detecta_diferente(self):
         recientes = ["Juego PS5 Elden Ring Standard Edition"]
-        assert bot.titulo_similar_a_recientes(
+        assert core.titulo_similar_a_recientes(
             "Mando DualSense PS5 rojo", recientes
         ) is False
 
@@ -158,7 +198,7 @@ class TestTituloSimilarARecientes:
             "Mando DualSense PS5 blanco",
             "Juego PS4 Red Dead Redemption 2",
         ]
-        assert bot.titulo_similar_a_recientes(
+        assert core.titulo_similar_a_recientes(
             "Juego PS5 Elden Ring Deluxe", recientes
         ) is True
 
@@ -447,6 +487,121 @@ class TestExtraerProductosBusqueda:
         assert len(productos) == 0
 
 
+# ---------------------------------------------------------------------------
+# prefiltrar_tarjetas_con_oferta — pre-pasada sobre el HTML crudo
+# ---------------------------------------------------------------------------
+
+def _tarjeta(asin, con_oferta):
+    tachado = (
+        '<span class="a-price" data-a-strike="true"><span class="a-offscreen">49,99€</span></span>'
+        if con_oferta else ''
+    )
+    return (
+        f'<div data-component-type="s-search-result" data-asin="{asin}">'
+        f'<h2><a><span>Juego {asin}</span></a></h2>'
+        f'<span class="a-price"><span class="a-offscreen">29,99€</span></span>{tachado}'
+        f'</div>'
+    )
+
+
+class TestPrefiltroOfertas:
+    def test_conserva_solo_tarjetas_con_precio_tachado(self):
+        html = "<html><body>" + _tarjeta("B001", True) + _tarjeta("B002", False) + _tarjeta("B003", True) + "</body></html>"
+        filtrado, descartadas = core.prefiltrar_tarjetas_con_oferta(html)
+        assert descartadas == 1
+        productos = bot.extraer_productos_busqueda(filtrado)
+        assert [p['asin'] for p in productos] == ["B001", "B003"]
+
+    def test_sin_ofertas_devuelve_vacio(self):
+        html = "<html><body>" + _tarjeta("B001", False) + _tarjeta("B002", False) + "</body></html>"
+        assert core.prefiltrar_tarjetas_con_oferta(html) == ('', 2)
+
+    def test_sin_tarjetas_devuelve_html_original(self):
+        html = "<html><body><p>Otra maqueta</p></body></html>"
+        assert core.prefiltrar_tarjetas_con_oferta(html) == (html, 0)
+
+    def test_respeta_limite_de_items(self):
+        # La oferta en la tarjeta 3 queda fuera si solo se miran 2 tarjetas
+        html = "<html><body>" + _tarjeta("B001", False) + _tarjeta("B002", False) + _tarjeta("B003", True) + "</body></html>"
+        assert core.prefiltrar_tarjetas_con_oferta(html, max_items=2) == ('', 2)
+
+    def test_etapa_no_parsea_pagina_sin_ofertas(self):
+        llamadas = []
+        etapa = core.EtapaParseo(0, extractor=lambda html: llamadas.append(html) or [],
+                                 prefiltro=core.prefiltrar_tarjetas_con_oferta)
+        with etapa:
+            futuro = etapa.enviar("<html><body>" + _tarjeta("B001", False) + "</body></html>")
+        assert futuro.result() == []
+        assert futuro.result().tarjetas_descartadas == 1
+        assert llamadas == []
+
+    def test_etapa_anota_las_tarjetas_descartadas(self):
+        etapa = core.EtapaParseo(0, prefiltro=core.prefiltrar_tarjetas_con_oferta)
+        with etapa:
+            futuro = etapa.enviar(
+                "<html><body>" + _tarjeta("B001", True) + _tarjeta("B002", False) + _tarjeta("B003", False) + "</body></html>"
+            )
+        productos = futuro.result()
+        assert [p['asin'] for p in productos] == ["B001"]
+        assert productos.tarjetas_descartadas == 2
+
+
+# ---------------------------------------------------------------------------
+# Cadenas de selectores y sus estadisticas
+# ---------------------------------------------------------------------------
+
+class TestEstadisticasSelectores:
+    def test_cuenta_aciertos_del_primer_selector(self):
+        productos = bot.extraer_productos_busqueda(_html_con_producto())
+        est = productos.estadisticas
+        assert est.items == 1
+        assert est.aciertos[('titulo', 'h2 a span')] == 1
+        assert est.intentos[('titulo', 'h2 span')] == 0
+
+    def test_pasa_al_siguiente_selector_de_la_cadena(self):
+        html = _html_con_producto().replace("<h2><a><span>", "<h2><span>").replace("</span></a></h2>", "</span></h2>")
+        productos = bot.extraer_productos_busqueda(html)
+        est = productos.estadisticas
+        assert productos[0]['titulo'].startswith("Juego PS5")
+        assert est.fallos('titulo', 'h2 a span') == 1
+        assert est.aciertos[('titulo', 'h2 span')] == 1
+
+    def test_campo_opcional_ausente_no_es_cambio_de_maqueta(self):
+        productos = bot.extraer_productos_busqueda("<html><body>" + _tarjeta("B001", False) + "</body></html>")
+        est = productos.estadisticas
+        assert est.sin_match['precio_anterior'] == 1
+        assert est.campos_sin_match() == ['imagen']
+
+    def test_avisa_si_un_campo_no_coincide_en_ningun_item(self, caplog):
+        html = _html_con_producto().replace("<h2><a><span>", "<h3><span>").replace("</span></a></h2>", "</span></h3>")
+        productos = bot.extraer_productos_busqueda(html)
+        assert 'titulo' in productos.estadisticas.campos_sin_match()
+        with caplog.at_level("WARNING"):
+            productos.estadisticas.registrar_en_log()
+        assert "posible cambio de maqueta" in caplog.text
+
+    def test_cuenta_items_con_error(self):
+        html = _html_con_producto().replace('data-asin="B001EXAMPLE"', '')
+        est = bot.extraer_productos_busqueda(html).estadisticas
+        assert est.items_con_error == 0  # sin ASIN se omite, no es error
+        with patch.object(core, 'Producto', side_effect=ValueError("roto")):
+            est = bot.extraer_productos_busqueda(_html_con_producto()).estadisticas
+        assert est.items_con_error == 1
+        assert est.errores['ValueError'] == 1
+
+    def test_etapa_acumula_estadisticas_de_todas_las_paginas(self):
+        with core.EtapaParseo(0) as etapa:
+            etapa.enviar(_html_con_producto(asin="B001")).result()
+            etapa.enviar(_html_con_producto(asin="B002")).result()
+        assert etapa.estadisticas.items == 2
+        assert etapa.estadisticas.aciertos[('precio', '.a-price .a-offscreen')] == 2
+
+    def test_etapa_ignora_extractores_sin_estadisticas(self):
+        with core.EtapaParseo(0, extractor=lambda html: []) as etapa:
+            assert etapa.enviar("<html>mock</html>").result() == []
+        assert etapa.estadisticas.items == 0
+
+
 # ---------------------------------------------------------------------------
 # Integracion: buscar_y_publicar_ofertas
 # ---------------------------------------------------------------------------
@@ -513,6 +668,165 @@ class TestBuscarYPublicarOfertasIntegracion:
             mock_save.assert_not_called()
 
 
+# ---------------------------------------------------------------------------
+# Pipeline por etapas (shared.pipeline)
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def canal_sin_red(monkeypatch):
+    """Canal PS con credenciales falsas, estado vacio y una pagina por categoria."""
+    monkeypatch.setattr(bot, '_effective_token', lambda: 'fake_token')
+    monkeypatch.setattr(bot, '_effective_chat_id', lambda: 'fake_chat_id')
+    monkeypatch.setattr(bot, 'load_posted_deals', lambda: ({}, [], [], {}))
+    monkeypatch.setattr(bot, 'save_posted_deals', MagicMock())
+    monkeypatch.setattr(bot, 'obtener_pagina', lambda url: _html_con_producto(asin='B0' + url[-6:]))
+    monkeypatch.setattr(bot, 'CATEGORIAS_PS', [
+        make_categoria(nombre='Juegos PS5', url='/s?k=juegos+ps5'),
+        make_categoria(nombre='Mandos PS5', url='/s?k=mandos+ps5', tipo='accesorio'),
+    ])
+    envios = MagicMock(return_value=True)
+    monkeypatch.setattr(bot, 'send_telegram_photo', envios)
+    return envios
+
+
+class TestPipeline:
+    def test_etapa_sustituida(self, canal_sin_red):
+        """Se puede cambiar una etapa: aqui publicar solo cuenta, sin enviar nada."""
+        def publicar_en_seco(flujo, canal, estado):
+            return list(flujo)
+
+        publicadas = pipeline.ejecutar_ciclo(bot.config_canal(), etapas={'publicar': publicar_en_seco})
+        assert publicadas == 1
+        canal_sin_red.assert_not_called()
+        bot.save_posted_deals.assert_not_called()
+
+    def test_etapa_desconocida(self, canal_sin_red):
+        with pytest.raises(ValueError, match="enviar"):
+            pipeline.ejecutar_ciclo(bot.config_canal(), etapas={'enviar': lambda f, c, e: f})
+
+    def test_parsear_emite_cada_pagina_en_cuanto_esta(self, canal_sin_red):
+        """La categoria ya parseada sale antes de que se descargue la siguiente."""
+        pedidas = []
+
+        def paginas():
+            for categoria in bot.CATEGORIAS_PS:
+                pedidas.append(categoria['nombre'])
+                yield categoria, _html_con_producto()
+
+        flujo = pipeline.parsear(paginas(), bot.config_canal(), None)
+        categoria, productos = next(flujo)
+        assert categoria['nombre'] == 'Juegos PS5' and len(productos) == 1
+        assert pedidas == ['Juegos PS5']
+        assert [c['nombre'] for c, _ in flujo] == ['Mandos PS5']
+
+    def test_pagina_que_falla_al_parsear_va_a_la_reserva(self, canal_sin_red, monkeypatch):
+        def extraer(html_content):
+            raise ValueError("maqueta rota")
+
+        monkeypatch.setattr(bot, 'extraer_productos_busqueda', extraer)
+        estado = pipeline.EstadoCiclo({}, [], [], {}, {})
+        canal = bot.config_canal()
+        flujo = pipeline.filtrar(pipeline.parsear(pipeline.descargar(None, canal, estado), canal, estado), canal, estado)
+        assert list(flujo) == []
+        assert [c['nombre'] for c in estado.categorias_sin_pagina] == ['Juegos PS5', 'Mandos PS5']
+
+    def test_tiempos_por_etapa(self):
+        tiempos = pipeline.TiemposEtapas()
+        flujo = tiempos.medir('b', tiempos.medir('a', iter([1, 2])))
+        assert list(tiempos.acumulado) == ['a', 'b']
+        assert list(flujo) == [1, 2]
+        tiempos.acumulado = {'a': 1.0, 'b': 1.5, 'c': 4.0}
+        assert tiempos.propios() == {'a': 1.0, 'b': 0.5, 'c': 2.5}
+
+
+# ---------------------------------------------------------------------------
+# repartir_ofertas_por_categoria — dedupe de ASINs entre categorías
+# ---------------------------------------------------------------------------
+
+def _clave_descuento(p):
+    return (p['descuento'], p['valoraciones'])
+
+
+class TestRepartirOfertasPorCategoria:
+    def test_asin_queda_en_la_categoria_donde_rankea_mejor(self):
+        mandos = make_categoria(nombre='Mandos PS5', tipo='accesorio')
+        accesorios = make_categoria(nombre='Accesorios PS5', tipo='accesorio')
+        dualsense = make_producto(asin='BDUAL', titulo='Mando DualSense', descuento=30.0)
+        resultado = core.repartir_ofertas_por_categoria([
+            (mandos, [make_producto(asin='BMANDO', descuento=40.0), dualsense]),
+            (accesorios, [dict(dualsense), make_producto(asin='BBASE', descuento=10.0)]),
+        ], _clave_descuento)
+        asins = {cat['nombre']: [p['asin'] for p in ofertas] for cat, ofertas in resultado}
+        assert asins == {'Mandos PS5': ['BMANDO'], 'Accesorios PS5': ['BDUAL', 'BBASE']}
+
+    def test_empate_de_puesto_se_queda_en_la_primera_categoria(self):
+        cat1, cat2 = make_categoria(nombre='A'), make_categoria(nombre='B')
+        resultado = core.repartir_ofertas_por_categoria([
+            (cat1, [make_producto(asin='B001')]),
+            (cat2, [make_producto(asin='B001')]),
+        ], _clave_descuento)
+        assert [len(ofertas) for _, ofertas in resultado] == [1, 0]
+
+    def test_ordena_por_la_clave_descendente(self):
+        resultado = core.repartir_ofertas_por_categoria([
+            (make_categoria(), [make_producto(asin='B1', descuento=10.0), make_producto(asin='B2', descuento=50.0)]),
+        ], _clave_descuento)
+        assert [p['asin'] for p in resultado[0][1]] == ['B2', 'B1']
+
+    def test_clave_se_calcula_una_vez_por_asin(self):
+        llamadas = []
+
+        def clave(p):
+            llamadas.append(p['asin'])
+            return _clave_descuento(p)
+
+        core.repartir_ofertas_por_categoria([
+            (make_categoria(nombre='A'), [make_producto(asin='B001'), make_producto(asin='B002')]),
+            (make_categoria(nombre='B'), [make_producto(asin='B001')]),
+        ], clave)
+        assert sorted(llamadas) == ['B001', 'B002']
+
+    @patch('ps.amazon_ps_ofertas._effective_chat_id', return_value='fake_chat_id')
+    @patch('ps.amazon_ps_ofertas._effective_token', return_value='fake_token')
+    @patch('ps.amazon_ps_ofertas.send_telegram_photo', return_value=True)
+    @patch('ps.amazon_ps_ofertas.obtener_pagina')
+    @patch('ps.amazon_ps_ofertas.load_posted_deals', return_value=({}, [], [], {}))
+    @patch('ps.amazon_ps_ofertas.save_posted_deals')
+    def test_canal_no_agrupa_el_mismo_asin_dos_veces(self, mock_save, mock_load, mock_pagina, *_):
+        mock_pagina.return_value = _html_con_producto(asin="BDUALSENSE", titulo="Mando DualSense Blanco")
+        entradas = []
+        original = bot.agrupar_variantes
+
+        def espia(mejores):
+            entradas.extend(e['producto']['asin'] for e in mejores)
+            return original(mejores)
+
+        with patch.object(bot, 'agrupar_variantes', espia):
+            assert bot.buscar_y_publicar_ofertas() == 1
+        assert entradas == ['BDUALSENSE']
+
+
+# ---------------------------------------------------------------------------
+# repartir_ofertas_por_categoria — orden estable con empates
+# ---------------------------------------------------------------------------
+
+def _ofertas_con_empates():
+    # Descuentos repetidos a propósito: a igual puntuación manda el orden original
+    return [
+        make_producto(asin=f'B{i:03d}', descuento=float(d), valoraciones=v)
+        for i, (d, v) in enumerate([(30, 10), (50, 5), (30, 10), (70, 1), (50, 5), (10, 99), (30, 20)])
+    ]
+
+
+class TestOrdenConEmpates:
+    def test_orden_igual_que_sorted_descendente_con_empates(self):
+        ofertas = _ofertas_con_empates()
+        esperado = sorted(ofertas, key=_clave_descuento, reverse=True)
+        resultado = core.repartir_ofertas_por_categoria([(make_categoria(), ofertas)], _clave_descuento)
+        assert resultado[0][1] == esperado
+        assert [p['asin'] for p in esperado][:2] == ['B003', 'B001']
+
+
 # ---------------------------------------------------------------------------
 # Prioridad de Videojuegos
 # ---------------------------------------------------------------------------
@@ -702,6 +1016,50 @@ class TestAgruparVariantes:
         resultado = core.agrupar_variantes([entrada1, entrada2])
         assert resultado[0]['categoria']['nombre'] == 'Juegos PS5'
 
+    def test_titulos_solo_de_variante_se_agrupan_si_comparten_palabra(self):
+        """Firma base vacía: se comparan por parejas (deben compartir alguna palabra)."""
+        entradas = [
+            {'producto': make_producto(asin='B001', titulo='Rojo Mini'), 'categoria': make_categoria()},
+            {'producto': make_producto(asin='B002', titulo='Azul Mini'), 'categoria': make_categoria()},
+            {'producto': make_producto(asin='B003', titulo='Verde Maxi'), 'categoria': make_categoria()},
+        ]
+        resultado = core.agrupar_variantes(entradas)
+        grupos = sorted(
+            sorted([r['producto']['asin']] + [v['asin'] for v in r['producto'].get('variantes_adicionales', [])])
+            for r in resultado
+        )
+        assert grupos == [['B001', 'B002'], ['B003']]
+
+    def test_mismos_grupos_que_comparar_todas_las_parejas(self):
+        """El índice por firma da los mismos grupos que son_variantes sobre todas las parejas."""
+        titulos = [
+            'Mando DualSense Rojo', 'Mando DualSense Azul', 'Mando DualSense',
+            'Mando DualSense Edge Negro', 'Mando DualSense Edge Blanco',
+            'FIFA 26 PS5', 'FIFA 26 PS4', 'Rojo', 'Rojo Azul', 'Verde',
+            'Auriculares Pulse Gris', 'Auriculares Pulse Elite',
+        ]
+        entradas = [
+            {'producto': make_producto(asin=f'B{i:03d}', titulo=t), 'categoria': make_categoria()}
+            for i, t in enumerate(titulos)
+        ]
+        # Referencia: componentes conexos de son_variantes sobre todas las parejas
+        grupo_de = list(range(len(titulos)))
+        for i in range(len(titulos)):
+            for j in range(i + 1, len(titulos)):
+                if core.son_variantes(titulos[i], titulos[j]):
+                    viejo, nuevo = grupo_de[j], grupo_de[i]
+                    grupo_de = [nuevo if g == viejo else g for g in grupo_de]
+        esperado = sorted(
+            sorted(f'B{i:03d}' for i in range(len(titulos)) if grupo_de[i] == g)
+            for g in set(grupo_de)
+        )
+        resultado = core.agrupar_variantes(entradas)
+        grupos = sorted(
+            sorted([r['producto']['asin']] + [v['asin'] for v in r['producto'].get('variantes_adicionales', [])])
+            for r in resultado
+        )
+        assert grupos == esperado
+
 
 # ---------------------------------------------------------------------------
 # format_telegram_message con variantes
@@ -822,6 +1180,125 @@ class TestFormatTelegramMessageConVariantes:
         assert '60€' in mensaje
         assert '65€' in mensaje
 
+    def test_agrupar_guarda_la_etiqueta_de_cada_variante(self):
+        """agrupar_variantes calcula la etiqueta (plataforma o color) al agrupar."""
+        entradas = [
+            {'producto': make_producto(asin='B001', titulo='FIFA 26 PS5', descuento=43), 'categoria': make_categoria()},
+            {'producto': make_producto(asin='B002', titulo='FIFA 26 PS4', descuento=40), 'categoria': make_categoria()},
+            {'producto': make_producto(asin='B003', titulo='Mando DualSense Blanco', descuento=30), 'categoria': make_categoria()},
+            {'producto': make_producto(asin='B004', titulo='Mando DualSense Rojo', descuento=20), 'categoria': make_categoria()},
+        ]
+        resultado = core.agrupar_variantes(entradas)
+        etiquetas = {
+            v['asin']: v['etiqueta'] for r in resultado for v in r['producto'].get('variantes_adicionales', [])
+        }
+        assert etiquetas == {'B002': 'PS4', 'B004': 'ROJO'}
+
+    def test_formato_usa_la_etiqueta_sin_recalcularla(self, monkeypatch):
+        """Con etiqueta precalculada, el formateo no vuelve a tokenizar ni buscar plataformas."""
+        monkeypatch.setattr(core, 'etiqueta_variante', MagicMock(side_effect=AssertionError("no debe llamarse")))
+        producto = make_producto(
+            titulo='Mando DualSense Blanco',
+            variantes_adicionales=[{
+                'asin': 'B002', 'titulo': 'Mando DualSense Rojo', 'url': 'https://amazon.es/dp/B002',
+                'precio': '60€', 'descuento': 20, 'etiqueta': 'ROJO',
+            }]
+        )
+        mensaje = core.format_telegram_message(producto, make_categoria())
+        assert '(ROJO)' in mensaje
+
+    def test_etiqueta_variante_es_la_primera_palabra_distinta(self):
+        base = core.tokenizar_titulo('Mochila cambiador')
+        assert core.etiqueta_variante('Mochila cambiador gris mini', base) == 'GRIS'
+        assert core.etiqueta_variante('Mochila cambiador', base) == ''
+
+
+# ---------------------------------------------------------------------------
+# Varias ofertas por ciclo
+# ---------------------------------------------------------------------------
+
+def _entrada(asin, titulo, nombre_cat, tipo='videojuego', descuento=40.0, marca=None):
+    producto = make_producto(asin=asin, titulo=titulo, descuento=descuento)
+    if marca is not None:
+        producto['marca'] = marca
+    return {'producto': producto, 'categoria': make_categoria(nombre=nombre_cat, tipo=tipo)}
+
+
+class TestSeleccionarOfertasCiclo:
+    def test_elige_hasta_n_saltando_categorias_recientes(self):
+        ranking_global = [
+            _entrada('B1', 'Elden Ring', 'Juegos PS5', descuento=70),
+            _entrada('B2', 'Gran Turismo 7', 'Juegos PS4', descuento=60),
+            _entrada('B3', 'Tarjeta PSN 20 euros', 'Tarjetas PSN', tipo='accesorio', descuento=50),
+        ]
+        elegidas = core.seleccionar_ofertas_ciclo(ranking_global, 2, ['Juegos PS5'])
+        assert [e['producto']['asin'] for e in elegidas] == ['B2', 'B3']
+
+    def test_sin_categorias_validas_publica_la_primera(self):
+        ranking_global = [_entrada('B1', 'Elden Ring', 'Juegos PS5')]
+        elegidas = core.seleccionar_ofertas_ciclo(ranking_global, 3, ['Juegos PS5'])
+        assert [e['producto']['asin'] for e in elegidas] == ['B1']
+
+    def test_respaldo_respeta_admitir(self):
+        ranking_global = [
+            _entrada('B1', 'Mando DualSense Blanco', 'Mandos PS5', tipo='accesorio'),
+            _entrada('B2', 'Elden Ring', 'Juegos PS5'),
+        ]
+        sin_accesorios = lambda entrada, elegidas: entrada['categoria']['tipo'] != 'accesorio'
+        elegidas = core.seleccionar_ofertas_ciclo(
+            ranking_global, 2, ['Mandos PS5', 'Juegos PS5'], admitir=sin_accesorios
+        )
+        assert [e['producto']['asin'] for e in elegidas] == ['B2']
+        assert core.seleccionar_ofertas_ciclo(ranking_global[:1], 2, ['Mandos PS5'], admitir=sin_accesorios) == []
+
+    def test_diversidad_misma_marca_o_titulo_similar(self):
+        ranking_global = [
+            _entrada('B1', 'Mando DualSense Blanco', 'Mandos PS5', tipo='accesorio', marca='sony'),
+            _entrada('B2', 'Auriculares Pulse 3D', 'Auriculares gaming', tipo='accesorio', marca='sony'),
+            _entrada('B3', 'Mando DualSense Blanco Edge', 'Accesorios PS5', tipo='accesorio'),
+            _entrada('B4', 'Tarjeta PSN 20 euros', 'Tarjetas PSN', tipo='accesorio'),
+        ]
+        elegidas = core.seleccionar_ofertas_ciclo(ranking_global, 3, [])
+        assert [e['producto']['asin'] for e in elegidas] == ['B1', 'B4']
+
+    def test_admitir_aplica_restricciones_del_canal(self):
+        ranking_global = [
+            _entrada('B1', 'Tarjeta PSN 20 euros', 'Tarjetas PSN', tipo='accesorio'),
+            _entrada('B2', 'Mando DualSense Blanco', 'Mandos PS5', tipo='accesorio'),
+            _entrada('B3', 'Elden Ring', 'Juegos PS5'),
+        ]
+        solo_un_accesorio = lambda entrada, elegidas: entrada['categoria']['tipo'] != 'accesorio' or not elegidas
+        elegidas = core.seleccionar_ofertas_ciclo(ranking_global, 3, [], admitir=solo_un_accesorio)
+        assert [e['producto']['asin'] for e in elegidas] == ['B1', 'B3']
+
+    @patch('ps.amazon_ps_ofertas._effective_chat_id', return_value='fake_chat_id')
+    @patch('ps.amazon_ps_ofertas._effective_token', return_value='fake_token')
+    @patch('ps.amazon_ps_ofertas.send_telegram_photo', return_value=True)
+    @patch('ps.amazon_ps_ofertas.obtener_pagina')
+    @patch('ps.amazon_ps_ofertas.load_posted_deals', return_value=({}, [], [], {}))
+    @patch('ps.amazon_ps_ofertas.save_posted_deals')
+    def test_canal_publica_varias_con_un_solo_accesorio(self, mock_save, mock_load, mock_pagina, mock_foto, *_):
+        titulos = {
+            'juegos+ps5': 'Juego PS5 Elden Ring', 'juegos+ps4': 'Juego PS4 Gran Turismo 7',
+            'dualsense': 'Mando DualSense Blanco', 'dualshock': 'Mando DualShock Negro',
+            'auriculares': 'Auriculares gaming Pulse', 'psn': 'Tarjeta PSN 20 euros',
+            'accesorios+ps5': 'Base de carga doble', 'accesorios+ps4': 'Soporte vertical ventilador',
+        }
+
+        def pagina(url):
+            clave = next(k for k in titulos if k in url)
+            return _html_con_producto(asin=f"B{list(titulos).index(clave):03d}", titulo=titulos[clave])
+
+        mock_pagina.side_effect = pagina
+        with patch.object(bot, 'OFERTAS_POR_CICLO', 4), patch.object(bot, 'PAUSA_ENTRE_PUBLICACIONES', 0):
+            assert bot.buscar_y_publicar_ofertas() == 3
+
+        posted, ultimas_categorias, _, categorias_semanales = mock_save.call_args[0]
+        assert len(posted) == 3
+        assert len(set(ultimas_categorias)) == 3
+        assert sum(cat in ('Juegos PS5', 'Juegos PS4') for cat in ultimas_categorias) == 2
+        assert '_accesorios_ultima_pub' in categorias_semanales
+
 
 # ---------------------------------------------------------------------------
 # Límite global de 7 días entre publicaciones
@@ -989,6 +1466,72 @@ class TestEsPrereservaItem:
         assert bot._es_prereserva_item(None) is False
 
 
+class TestExtraerSenalPrereserva:
+    """extraer_productos_busqueda marca las preórdenes en el mismo recorrido."""
+
+    def test_marca_prereserva_en_extraccion(self):
+        html = textwrap.dedent("""
+        <html><body>
+        <div data-component-type="s-search-result" data-asin="B001PRE">
+          <h2><a><span>FIFA 26 PS5</span></a></h2>
+          <span>Disponible el 15 de marzo 2026</span>
+        </div>
+        </body></html>
+        """)
+        productos = bot.extraer_productos_busqueda(html)
+        assert productos[0]['es_prereserva'] is True
+
+    def test_producto_normal_no_es_prereserva(self):
+        html = _html_con_producto(titulo="Juego PS5 Elden Ring")
+        productos = bot.extraer_productos_busqueda(html)
+        assert productos[0]['es_prereserva'] is False
+
+    def test_falso_positivo_sin_indicador_fuerte(self):
+        assert core.es_texto_prereserva("juego ps5 sin bono de reserva") is False
+
+    def test_falso_positivo_con_indicador_fuerte(self):
+        assert core.es_texto_prereserva("sin bono de reserva, disponible el 3 de abril") is True
+
+
+def _es_prereserva_multipasada(texto):
+    if not any(ind in texto for ind in core.INDICADORES_PREORDEN):
+        return False
+    if any(fp in texto for fp in core.FALSOS_POSITIVOS_PREORDEN):
+        return any(ind in texto for ind in core.INDICADORES_PREORDEN_FUERTES)
+    return True
+
+
+class TestClasesPrereserva:
+    """Clases de indicador encontradas en el texto (preorden, fuerte, falso positivo)."""
+
+    def test_sin_indicadores_devuelve_vacio(self):
+        assert core.clases_prereserva("juego ps5 envío gratis") == frozenset()
+
+    def test_detecta_clase_fuerte_y_preorden(self):
+        clases = core.clases_prereserva("próximamente en ps5")
+        assert clases == {core.CLASE_PREORDEN, core.CLASE_PREORDEN_FUERTE}
+
+    def test_detecta_falso_positivo(self):
+        clases = core.clases_prereserva("sin bono de reserva")
+        assert core.CLASE_FALSO_POSITIVO in clases
+        assert core.CLASE_PREORDEN in clases
+
+    def test_coincidencias_solapadas(self):
+        # 'en reserva' contiene 'reserva'; 'disponible el ' incluye el fuerte 'disponible el'
+        assert core.clases_prereserva("disponible el 3") == {core.CLASE_PREORDEN, core.CLASE_PREORDEN_FUERTE}
+        assert core.clases_prereserva("en reserva") == {core.CLASE_PREORDEN}
+
+    def test_listas_reducidas_dan_la_misma_respuesta(self):
+        # Quitar los patrones que contienen a otro no cambia ninguna decision
+        for patron in core.INDICADORES_PREORDEN + core.INDICADORES_PREORDEN_FUERTES + core.FALSOS_POSITIVOS_PREORDEN:
+            for texto in (patron, f"juego {patron} ps5", f"sin bono {patron}"):
+                assert core.es_texto_prereserva(texto) == _es_prereserva_multipasada(texto)
+
+    def test_indicador_fuerte_sin_espacio_no_es_preorden(self):
+        # 'disponible el' al final (sin espacio) solo es fuerte, no preorden
+        assert core.es_texto_prereserva("disponible el") is False
+
+
 class TestFormatPrereservaMessage:
     def test_contiene_emoji_categoria(self):
         """El mensaje contiene el emoji de la categoría."""
@@ -1189,3 +1732,105 @@ class TestBuscarPrereservasPS:
         # Sin candidatos de preorden, debe retornar 0
         assert resultado == 0
         mock_foto.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# Simulador offline sobre capturas
+# ---------------------------------------------------------------------------
+
+def _pagina_captura(*productos):
+    """Página de búsqueda con (asin, titulo, precio, precio_anterior) por tarjeta."""
+    tarjetas = "".join(
+        f'<div data-component-type="s-search-result" data-asin="{asin}">'
+        f'<h2><a><span>{titulo}</span></a></h2>'
+        f'<span class="a-price"><span class="a-offscreen">{precio}</span></span>'
+        f'<span class="a-price a-text-price" data-a-strike="true"><span class="a-offscreen">{antes}</span></span>'
+        f'<img class="s-image" src="https://example.com/{asin}.jpg" />'
+        f'</div>'
+        for asin, titulo, precio, antes in productos
+    )
+    return f"<html><body>{tarjetas}</body></html>"
+
+
+def _grabar_captura(directorio, nombre, paginas):
+    """paginas: dict nombre_categoria -> html."""
+    carpeta = directorio / nombre
+    carpeta.mkdir(parents=True)
+    for categoria, html_pagina in paginas.items():
+        (carpeta / simulador.nombre_captura(categoria)).write_text(html_pagina, encoding='utf-8')
+
+
+@pytest.fixture
+def capturas(tmp_path):
+    directorio = tmp_path / 'capturas'
+    _grabar_captura(directorio, '001', {
+        'Juegos PS5': _pagina_captura(
+            ('B0SIMJ001', 'Astro Bot Edicion Estandar', '29,99€', '69,99€'),
+            ('B0SIMJ002', 'Gran Turismo 7 Standard', '39,99€', '79,99€'),
+        ),
+        'Mandos PS5': _pagina_captura(('B0SIMM001', 'Mando DualSense Blanco', '49,99€', '74,99€')),
+        'Auriculares gaming': _pagina_captura(('B0SIMA001', 'Auriculares Pulse 3D', '69,99€', '99,99€')),
+    })
+    # Segunda captura: la pagina de Mandos PS5 no se pudo descargar
+    _grabar_captura(directorio, '002', {
+        'Juegos PS5': _pagina_captura(('B0SIMJ003', 'Spider-Man 2 Deluxe', '34,99€', '79,99€')),
+        'Auriculares gaming': _pagina_captura(('B0SIMA001', 'Auriculares Pulse 3D', '69,99€', '99,99€')),
+    })
+    return directorio
+
+
+class TestSimulador:
+    INICIO = datetime(2026, 10, 1, 9, 0)
+
+    def test_nombre_captura(self):
+        assert simulador.nombre_captura('Juegos PS5') == 'juegos_ps5.html'
+        assert simulador.nombre_captura('Próximos PS5') == 'proximos_ps5.html'
+
+    def test_reloj_virtual_y_estado_en_memoria(self, capturas):
+        """Cada ciclo va a su hora virtual y lo publicado se recuerda entre ciclos."""
+        publicaciones = simulador.simular('ps', capturas, ciclos=4, inicio=self.INICIO)
+
+        ofertas = [p for p in publicaciones if p['tipo'] == 'oferta']
+        assert [p['fecha'] for p in ofertas] == [self.INICIO + timedelta(hours=h) for h in range(len(ofertas))]
+        asins = [p['asin'] for p in ofertas]
+        assert len(asins) == len(set(asins))
+        # El primer ciclo publica la mayor rebaja (Astro Bot, 57%)
+        assert ofertas[0]['asin'] == 'B0SIMJ001'
+
+    def test_no_toca_ficheros_ni_deja_parches(self, capturas, reserva_temporal):
+        antes = os.path.getmtime(bot.POSTED_PS_DEALS_FILE)
+        envio_original = bot.send_telegram_photo
+        simulador.simular('ps', capturas, ciclos=2, inicio=self.INICIO, config={'LIMITE_ACCESORIOS_DIAS': 0})
+
+        assert os.path.getmtime(bot.POSTED_PS_DEALS_FILE) == antes
+        assert not reserva_temporal.exists()
+        assert bot.send_telegram_photo is envio_original
+        assert bot.LIMITE_ACCESORIOS_DIAS == 3
+        assert core.datetime is datetime
+
+    def test_config_cambia_las_reglas(self, capturas):
+        """Con el limite de accesorios a 0 dias se publican accesorios en ciclos seguidos."""
+        def accesorios(config):
+            publicaciones = simulador.simular('ps', capturas, ciclos=6, inicio=self.INICIO, config=config)
+            return [p for p in publicaciones if p['categoria'] in ('Mandos PS5', 'Auriculares gaming')]
+
+        assert len(accesorios({})) == 1
+        assert len(accesorios({'LIMITE_ACCESORIOS_DIAS': 0})) == 2
+
+    def test_pausa_entre_publicaciones_adelanta_el_reloj(self, capturas):
+        publicaciones = simulador.simular(
+            'ps', capturas, ciclos=1, inicio=self.INICIO, config={'OFERTAS_POR_CICLO': 2}
+        )
+        assert len(publicaciones) == 2
+        assert publicaciones[1]['fecha'] - publicaciones[0]['fecha'] == timedelta(
+            seconds=bot.PAUSA_ENTRE_PUBLICACIONES
+        )
+
+    def test_parametro_desconocido(self, capturas):
+        with pytest.raises(ValueError, match="NO_EXISTE"):
+            simulador.simular('ps', capturas, config={'NO_EXISTE': 1})
+
+    def test_informe(self, capturas):
+        texto = simulador.informe(simulador.simular('ps', capturas, ciclos=2, inicio=self.INICIO))
+        assert "01/10 09:00" in texto
+        assert "Publicadas: 2 oferta(s)" in texto
@@ -15,8 +15,16 @@ import html
 import logging
 import logging.handlers
 import sys
+import tracemalloc
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime, timedelta
 
+from shared.precios import precio_a_centimos, calcular_descuento
+from shared.producto import Producto
+from shared.selectores import EstadisticasSelectores, ListaProductos
+from shared.similitud import IndiceLSH, jaccard
+
 # --- Configuracion de Logging ---
 
 def setup_logging(log_file):
@@ -81,15 +89,34 @@ session = requests.Session()
 log = logging.getLogger(__name__)
 
 
-def load_posted_deals(filepath, horas_ventana=48):
+class OfertasPublicadas(dict):
+    """
+    ASIN -> fecha ISO de publicacion, con la firma de variante de cada
+    producto publicado en la misma ventana (.firmas_variantes: firma -> fecha)
+    para descartar variantes de color/plataforma de lo ya publicado.
+    """
+
+    def __init__(self, ofertas=(), firmas_variantes=None):
+        super().__init__(ofertas)
+        self.firmas_variantes = dict(firmas_variantes or {})
+
+
+# Dias que se recuerdan los titulos publicados para el anti-titulo-similar
+DIAS_VENTANA_TITULOS = 30
+
+
+def load_posted_deals(filepath, horas_ventana=48, dias_ventana_titulos=DIAS_VENTANA_TITULOS):
     """
     Carga las ofertas publicadas desde un archivo JSON, filtrando por ventana de tiempo.
 
     Args:
         filepath: Ruta al archivo JSON de ofertas publicadas
         horas_ventana: Número de horas a considerar como "reciente" (default 48)
+        dias_ventana_titulos: Días que se conservan los títulos publicados (default 30)
 
     Retorna tupla: (dict_ofertas, ultimas_categorias, ultimos_titulos, categorias_semanales)
+    dict_ofertas es un OfertasPublicadas (ASIN -> fecha, con las firmas de variante).
+    ultimos_titulos es un HistorialTitulos (lista de títulos, el más reciente primero).
     """
     if not os.path.exists(filepath):
         log.info("No existe historial previo de ofertas publicadas, empezando desde cero")
@@ -102,9 +129,19 @@ def load_posted_deals(filepath, horas_ventana=48):
             log.warning("El archivo de historial esta corrupto, ignorando y empezando desde cero")
             return {}, [], [], {}
 
+    return posted_deals_desde_datos(data, horas_ventana, dias_ventana_titulos)
+
+
+def posted_deals_desde_datos(data, horas_ventana=48, dias_ventana_titulos=DIAS_VENTANA_TITULOS):
+    """
+    Estado de ofertas publicadas a partir del contenido ya leído del JSON
+    (lo que escribe datos_posted_deals), filtrando por ventana de tiempo.
+    Retorna la misma tupla que load_posted_deals.
+    """
     if not isinstance(data, dict):
         log.warning("Formato de historial inesperado, ignorando y empezando desde cero")
         return {}, [], [], {}
+    data = dict(data)
 
     # Extraer ultimas categorias publicadas (lista de hasta 4)
     ultimas_categorias = data.pop('_ultimas_categorias', [])
@@ -113,17 +150,32 @@ def load_posted_deals(filepath, horas_ventana=48):
         ultima_cat = data.pop('_ultima_categoria', None)
         ultimas_categorias = [ultima_cat] if ultima_cat else []
 
-    # Extraer ultimos titulos publicados (para verificacion de similitud)
-    ultimos_titulos = data.pop('_ultimos_titulos', [])
+    # Extraer titulos publicados en la ventana (para verificacion de similitud)
+    ultimos_titulos = HistorialTitulos.desde_estado(
+        data.pop('_ultimos_titulos', []),
+        data.pop('_fechas_titulos', None),
+        datetime.now() - timedelta(days=dias_ventana_titulos),
+    )
 
     # Extraer timestamps de ultima publicacion de categorias con limite semanal
     categorias_semanales = data.pop('_categorias_semanales', {})
 
-    recent_deals = {}
+    # Extraer firmas de variante de los productos publicados
+    firmas_variantes = data.pop('_firmas_variantes', {})
+
+    recent_deals = OfertasPublicadas()
     expired_count = 0
     now = datetime.now()
     cutoff_time = now - timedelta(hours=horas_ventana)
 
+    if isinstance(firmas_variantes, dict):
+        for firma, timestamp_str in firmas_variantes.items():
+            try:
+                if datetime.fromisoformat(timestamp_str) > cutoff_time:
+                    recent_deals.firmas_variantes[firma] = timestamp_str
+            except (ValueError, TypeError):
+                continue
+
     for deal_id, timestamp_str in data.items():
         try:
             post_time = datetime.fromisoformat(timestamp_str)
@@ -156,30 +208,143 @@ def load_posted_deals(filepath, horas_ventana=48):
 
 def save_posted_deals(deals_dict, filepath, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
     """Guarda el diccionario de ofertas publicadas en un archivo JSON."""
-    data = deals_dict.copy()
+    data = datos_posted_deals(deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales)
+    with open(filepath, 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+def datos_posted_deals(deals_dict, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
+    """Contenido del JSON de ofertas publicadas (lo que lee posted_deals_desde_datos)."""
+    data = dict(deals_dict)
+    firmas_variantes = getattr(deals_dict, 'firmas_variantes', None)
+    if firmas_variantes:
+        data['_firmas_variantes'] = firmas_variantes
     if ultimas_categorias:
         data['_ultimas_categorias'] = ultimas_categorias
     if ultimos_titulos:
-        data['_ultimos_titulos'] = ultimos_titulos
+        data['_ultimos_titulos'] = list(ultimos_titulos)
+        fechas = getattr(ultimos_titulos, 'fechas', None)
+        if fechas:
+            data['_fechas_titulos'] = fechas
     if categorias_semanales:
         data['_categorias_semanales'] = categorias_semanales
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=4)
+    return data
+
+
+# Reserva de candidatos: los mejores de cada categoria en el ultimo scrapeo,
+# para publicar algo aunque la pagina de la categoria falle en el siguiente
+MAX_RESERVA_POR_CATEGORIA = 10
+HORAS_FRESCURA_RESERVA = 6
+_CAMPOS_RESERVA = (
+    'asin', 'titulo', 'precio', 'precio_anterior', 'descuento',
+    'valoraciones', 'ventas', 'imagen', 'url',
+)
+
+
+def load_reserva_candidatos(filepath):
+    """
+    Carga la reserva de candidatos: dict nombre_categoria -> lista de
+    candidatos (mejor primero), cada uno con sus datos, 'fecha' y 'puntuacion'.
+    Un fichero inexistente o corrupto es una reserva vacia.
+    """
+    if not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, OSError):
+        log.warning("La reserva de candidatos esta corrupta, se ignora")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_reserva_candidatos(reserva, filepath):
+    """
+    Guarda la reserva de candidatos en un archivo JSON compacto. Si el
+    contenido no cambia no se reescribe el fichero. Retorna True si se escribio.
+    """
+    contenido = json.dumps(reserva, ensure_ascii=False, separators=(',', ':'))
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            if f.read() == contenido:
+                return False
+    except OSError:
+        pass
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(contenido)
+    return True
+
+
+def actualizar_reserva(reserva, nombre_categoria, candidatos, fecha=None, maximo=MAX_RESERVA_POR_CATEGORIA,
+                       clave_orden=None):
+    """
+    Sustituye los candidatos de la categoria por los primeros `maximo` de
+    `candidatos` (en orden de ranking), con fecha de scrapeo y puntuacion
+    (la clave_orden con la que se ordenaron; sin ella, la 'puntuacion' que
+    traiga el candidato).
+    """
+    fecha = fecha or datetime.now().isoformat()
+    reserva[nombre_categoria] = [
+        {
+            **{campo: candidato.get(campo) for campo in _CAMPOS_RESERVA},
+            'puntuacion': clave_orden(candidato) if clave_orden else candidato.get('puntuacion'),
+            'fecha': fecha,
+        }
+        for candidato in list(candidatos)[:maximo]
+    ]
+
+
+def candidatos_de_reserva(reserva, nombre_categoria, horas_frescura=HORAS_FRESCURA_RESERVA, ahora=None):
+    """
+    Candidatos guardados de la categoria con menos de horas_frescura horas,
+    como ofertas listas para rankear. La puntuacion guardada es informativa:
+    al ordenar se calcula de nuevo con sus datos, junto con las ofertas del
+    ciclo.
+    """
+    limite = (ahora or datetime.now()) - timedelta(hours=horas_frescura)
+    ofertas = []
+    for candidato in reserva.get(nombre_categoria, []):
+        try:
+            if datetime.fromisoformat(candidato['fecha']) < limite:
+                continue
+        except (KeyError, ValueError, TypeError):
+            continue
+        oferta = {campo: candidato.get(campo) for campo in _CAMPOS_RESERVA}
+        oferta['tiene_oferta'] = True
+        ofertas.append(oferta)
+    return ofertas
+
+
+# Palabras comunes que no aportan para comparar titulos
+PALABRAS_IGNORAR = frozenset({
+    'de', 'para', 'con', 'sin', 'el', 'la', 'los', 'las', 'un', 'una',
+    'unos', 'unas', 'y', 'o', 'a', 'en', 'del', 'al', 'bebe', 'bebé',
+    'pack', 'set', 'unidades', 'meses', 'años', 'mese', 'ano',
+})
+
+# Solo palabras alfabeticas (las cifras y modelos como 'PS5' quedan fuera)
+_REGEX_PALABRAS_TITULO = re.compile(r'\b[a-záéíóúñü]+\b')
+
+# Titulos distintos que se recuerdan tokenizados (candidatos + historial de varios ciclos)
+TAMANO_CACHE_TOKENS = 4096
+
+
+@lru_cache(maxsize=TAMANO_CACHE_TOKENS)
+def tokenizar_titulo(titulo):
+    """
+    Palabras clave de un titulo como frozenset: minusculas, sin palabras
+    comunes ni de 2 letras o menos.
+
+    Memoizado por titulo: el mismo titulo (candidato, historial, variante)
+    se tokeniza una sola vez en todo el pipeline.
+    """
+    palabras = _REGEX_PALABRAS_TITULO.findall(titulo.lower())
+    return frozenset(p for p in palabras if len(p) > 2 and p not in PALABRAS_IGNORAR)
 
 
 def normalizar_titulo(titulo):
     """Normaliza un titulo para comparacion: minusculas, sin palabras comunes."""
-    palabras_ignorar = {
-        'de', 'para', 'con', 'sin', 'el', 'la', 'los', 'las', 'un', 'una',
-        'unos', 'unas', 'y', 'o', 'a', 'en', 'del', 'al', 'bebe', 'bebé',
-        'pack', 'set', 'unidades', 'meses', 'años', 'mese', 'ano',
-    }
-    titulo_lower = titulo.lower()
-    # Extraer solo palabras alfanumericas
-    palabras = re.findall(r'\b[a-záéíóúñü]+\b', titulo_lower)
-    # Filtrar palabras comunes y muy cortas
-    palabras_clave = [p for p in palabras if p not in palabras_ignorar and len(p) > 2]
-    return set(palabras_clave)
+    return set(tokenizar_titulo(titulo))
 
 
 def titulos_similares(titulo1, titulo2, umbral=0.5):
@@ -187,27 +352,81 @@ def titulos_similares(titulo1, titulo2, umbral=0.5):
     Compara dos titulos y determina si son similares.
     Retorna True si comparten mas del umbral (50%) de palabras clave.
     """
-    palabras1 = normalizar_titulo(titulo1)
-    palabras2 = normalizar_titulo(titulo2)
+    palabras1 = tokenizar_titulo(titulo1)
+    palabras2 = tokenizar_titulo(titulo2)
 
     if not palabras1 or not palabras2:
         return False
-
     # Calcular similitud: palabras en comun / total de palabras unicas
-    comunes = palabras1 & palabras2
-    total = palabras1 | palabras2
+    return jaccard(palabras1, palabras2) >= umbral
 
-    if not total:
-        return False
 
-    similitud = len(comunes) / len(total)
-    return similitud >= umbral
+class HistorialTitulos(list):
+    """
+    Titulos publicados en la ventana de DIAS_VENTANA_TITULOS, el mas reciente
+    primero, con su fecha (.fechas, en paralelo) y un indice LSH para saber si
+    un titulo se parece a alguno sin compararlo con todos.
+
+    Es una lista de titulos para que el codigo que la trata como tal siga
+    funcionando; los titulos nuevos se añaden con agregar() para que el
+    indice y las fechas no se desincronicen.
+    """
+
+    def __init__(self, titulos=(), fechas=None):
+        super().__init__(titulos)
+        ahora = datetime.now().isoformat()
+        self.fechas = list(fechas) if fechas is not None else [ahora] * len(self)
+        self._indice = IndiceLSH()
+        for titulo in self:
+            self._indice.agregar(titulo, tokenizar_titulo(titulo))
+
+    @classmethod
+    def desde_estado(cls, titulos, fechas, limite):
+        """
+        Construye el historial desde el fichero de estado descartando los
+        titulos anteriores a `limite`. Sin fechas (formato anterior) se
+        conservan todos y cuentan como publicados ahora.
+        """
+        if not isinstance(titulos, list):
+            return cls()
+        if not isinstance(fechas, list) or len(fechas) != len(titulos):
+            return cls(titulos)
+        vigentes = []
+        for titulo, fecha in zip(titulos, fechas):
+            try:
+                if datetime.fromisoformat(fecha) > limite:
+                    vigentes.append((titulo, fecha))
+            except (ValueError, TypeError):
+                continue
+        return cls([t for t, _ in vigentes], [f for _, f in vigentes])
+
+    def agregar(self, titulo, fecha=None):
+        self.insert(0, titulo)
+        self.fechas.insert(0, fecha or datetime.now().isoformat())
+        self._indice.agregar(titulo, tokenizar_titulo(titulo))
+
+    def similar(self, titulo, umbral=0.5):
+        """True si el titulo se parece (Jaccard >= umbral, verificado exacto) a alguno del historial."""
+        return self._indice.hay_similar(tokenizar_titulo(titulo), umbral)
 
 
-def titulo_similar_a_recientes(titulo, ultimos_titulos):
+def registrar_titulo_publicado(ultimos_titulos, titulo):
+    """Añade un titulo publicado al historial (convierte listas planas) y retorna el historial."""
+    if not isinstance(ultimos_titulos, HistorialTitulos):
+        ultimos_titulos = HistorialTitulos(ultimos_titulos)
+    ultimos_titulos.agregar(titulo)
+    return ultimos_titulos
+
+
+def titulo_similar_a_recientes(titulo, ultimos_titulos, umbral=0.5):
     """Verifica si un titulo es similar a alguno de los titulos recientes."""
+    if isinstance(ultimos_titulos, HistorialTitulos):
+        return ultimos_titulos.similar(titulo, umbral)
+    palabras = tokenizar_titulo(titulo)
+    if not palabras:
+        return False
     for titulo_reciente in ultimos_titulos:
-        if titulos_similares(titulo, titulo_reciente):
+        if jaccard(palabras, tokenizar_titulo(titulo_reciente)) >= umbral:
             return True
     return False
 
@@ -222,18 +441,20 @@ PALABRAS_VARIANTE = {
 }
 
 
-def son_variantes(titulo1, titulo2):
+def tokens_producto(producto):
     """
-    Determina si dos productos son variantes del mismo producto base.
-    Dos productos son variantes si sus títulos normalizados comparten
-    una base común y solo difieren en palabras de variante (colores, etc.).
-
-    Nota: identificadores de plataforma como PS4/PS5 son automáticamente
-    invisibles porque el regex de normalizar_titulo extrae solo letras.
+    Palabras clave del título de un producto. Reutiliza las precalculadas en
+    la extracción (Producto['tokens_titulo']) y solo normaliza si faltan
+    (ej: productos como dict planos).
     """
-    palabras1 = normalizar_titulo(titulo1)
-    palabras2 = normalizar_titulo(titulo2)
+    tokens = producto.get('tokens_titulo')
+    if tokens is None:
+        tokens = tokenizar_titulo(producto['titulo'])
+    return tokens
 
+
+def _son_variantes_tokens(palabras1, palabras2):
+    """son_variantes sobre conjuntos de palabras ya normalizados."""
     if not palabras1 or not palabras2:
         return False
 
@@ -247,6 +468,135 @@ def son_variantes(titulo1, titulo2):
     return solo_en_1.issubset(PALABRAS_VARIANTE) and solo_en_2.issubset(PALABRAS_VARIANTE)
 
 
+def son_variantes(titulo1, titulo2):
+    """
+    Determina si dos productos son variantes del mismo producto base.
+    Dos productos son variantes si sus títulos normalizados comparten
+    una base común y solo difieren en palabras de variante (colores, etc.).
+
+    Nota: identificadores de plataforma como PS4/PS5 son automáticamente
+    invisibles porque el regex de tokenizar_titulo extrae solo letras.
+    """
+    return _son_variantes_tokens(tokenizar_titulo(titulo1), tokenizar_titulo(titulo2))
+
+
+def firma_publicacion(titulo):
+    """
+    Firma de variante de un titulo como texto compacto (palabras clave sin las
+    de variante, ordenadas). None si el titulo solo tiene palabras de variante.
+    """
+    firma = firma_variante(tokenizar_titulo(titulo))
+    return " ".join(sorted(firma)) if firma else None
+
+
+def variante_ya_publicada(posted_deals, titulo):
+    """True si ya se publico (en la ventana) una variante de este titulo: una consulta al dict de firmas."""
+    firmas = getattr(posted_deals, 'firmas_variantes', None)
+    if not firmas:
+        return False
+    firma = firma_publicacion(titulo)
+    return firma is not None and firma in firmas
+
+
+def registrar_variante_publicada(posted_deals, titulo, fecha=None):
+    """Guarda la firma de variante de un titulo publicado (convierte dicts planos) y retorna el historial."""
+    if not isinstance(posted_deals, OfertasPublicadas):
+        posted_deals = OfertasPublicadas(posted_deals)
+    firma = firma_publicacion(titulo)
+    if firma is not None:
+        posted_deals.firmas_variantes[firma] = fecha or datetime.now().isoformat()
+    return posted_deals
+
+
+def repartir_ofertas_por_categoria(ofertas_por_categoria, clave_orden):
+    """
+    Ordena las ofertas de cada categoria y deja cada ASIN solo en la categoria
+    donde queda mejor posicionado (mismo puesto: la primera en el orden dado).
+
+    Args:
+        ofertas_por_categoria: lista de (categoria, ofertas)
+        clave_orden: clave de ordenacion (descendente) de una oferta; se
+            calcula una sola vez por ASIN aunque aparezca en varias busquedas
+
+    Retorna lista de (categoria, ofertas_ordenadas) en el mismo orden de entrada.
+    """
+    claves = {}
+    ordenadas = []
+    for categoria, ofertas in ofertas_por_categoria:
+        for oferta in ofertas:
+            if oferta['asin'] not in claves:
+                claves[oferta['asin']] = clave_orden(oferta)
+        ordenadas.append((categoria, sorted(ofertas, key=lambda o: claves[o['asin']], reverse=True)))
+
+    # Mejor (puesto, indice de categoria) de cada ASIN
+    mejor_puesto = {}
+    for idx_cat, (_, ofertas) in enumerate(ordenadas):
+        for puesto, oferta in enumerate(ofertas):
+            actual = mejor_puesto.get(oferta['asin'])
+            if actual is None or (puesto, idx_cat) < actual:
+                mejor_puesto[oferta['asin']] = (puesto, idx_cat)
+
+    resultado = []
+    repetidos = 0
+    for idx_cat, (categoria, ofertas) in enumerate(ordenadas):
+        propias = []
+        for puesto, oferta in enumerate(ofertas):
+            if mejor_puesto[oferta['asin']] == (puesto, idx_cat):
+                propias.append(oferta)
+            else:
+                repetidos += 1
+                log.debug(
+                    "  ASIN %s repetido en '%s': compite en '%s'",
+                    oferta['asin'], categoria['nombre'], ordenadas[mejor_puesto[oferta['asin']][1]][0]['nombre']
+                )
+        resultado.append((categoria, propias))
+
+    if repetidos:
+        log.info("ASINs repetidos entre categorias: %d descartados (cada uno compite en su mejor categoria)", repetidos)
+    return resultado
+
+
+def firma_variante(palabras):
+    """
+    Firma base de un conjunto de palabras clave: sin las palabras de variante.
+    Dos titulos son variantes (ver _son_variantes_tokens) si y solo si tienen
+    la misma firma no vacia, o ambas vacias y comparten alguna palabra.
+    """
+    return frozenset(palabras) - PALABRAS_VARIANTE
+
+
+# Identificadores de plataforma/modelo: 1-3 letras seguidas de cifras (PS5, PS4, GEN2...)
+_REGEX_PLATAFORMA = re.compile(r'\b([a-záéíóúñü]{1,3}\d+)\b', re.IGNORECASE)
+
+
+def etiqueta_variante(titulo, palabras_representante, palabras=None):
+    """
+    Identificador que diferencia una variante de su representante (ej: 'PS4',
+    'AZUL'): la primera plataforma del titulo o, si no hay, la primera palabra
+    clave que no esta en el representante. '' si no se encuentra ninguna.
+    """
+    plataforma = _REGEX_PLATAFORMA.search(titulo)
+    if plataforma:
+        return plataforma.group(1).upper()
+
+    if palabras is None:
+        palabras = tokenizar_titulo(titulo)
+    diferencia = palabras - palabras_representante
+    if diferencia:
+        for palabra in _REGEX_PALABRAS_TITULO.findall(titulo.lower()):
+            if palabra in diferencia:
+                return palabra.upper()
+    return ""
+
+
+def _unir_variantes(unir, entradas, i, j):
+    unir(i, j)
+    log.info(
+        "Variantes detectadas: '%s' ↔ '%s'",
+        entradas[i]['producto']['titulo'][:40], entradas[j]['producto']['titulo'][:40]
+    )
+
+
 def agrupar_variantes(mejores_por_categoria):
     """
     Agrupa productos variantes en la lista de mejores por categoría.
@@ -254,7 +604,8 @@ def agrupar_variantes(mejores_por_categoria):
     Input/Output: lista de dicts {'producto': ..., 'categoria': ...}
     El representante es el de mayor descuento (desempate: valoraciones).
     El dict del representante recibe 'variantes_adicionales': lista de
-    {asin, titulo, url, precio, precio_anterior, descuento}.
+    {asin, titulo, url, precio, precio_anterior, descuento, etiqueta}, donde
+    etiqueta es lo que diferencia la variante (ej: 'PS4', 'AZUL'; ver etiqueta_variante).
     Se usa .copy() para no mutar el dict original.
     """
     if not mejores_por_categoria:
@@ -274,16 +625,29 @@ def agrupar_variantes(mejores_por_categoria):
         if px != py:
             padre[px] = py
 
-    for i in range(n):
-        t_i = mejores_por_categoria[i]['producto']['titulo']
-        for j in range(i + 1, n):
-            t_j = mejores_por_categoria[j]['producto']['titulo']
-            if son_variantes(t_i, t_j):
-                unir(i, j)
-                log.info(
-                    "Variantes detectadas: '%s' ↔ '%s'",
-                    t_i[:40], t_j[:40]
-                )
+    # Palabras clave de cada producto, calculadas una vez (no una vez por pareja)
+    tokens = [tokens_producto(entrada['producto']) for entrada in mejores_por_categoria]
+
+    # Indice por firma base (palabras clave sin las de variante): dos titulos
+    # son variantes solo si tienen la misma firma, asi que basta con unir los
+    # de cada bloque en lugar de comparar todas las parejas.
+    bloques = {}
+    for i, palabras in enumerate(tokens):
+        if palabras:
+            bloques.setdefault(firma_variante(palabras), []).append(i)
+
+    for firma, indices in bloques.items():
+        if not firma:
+            # Titulos solo con palabras de variante: ahi si hay que comparar
+            # (deben compartir al menos una palabra); son casos raros y pocos.
+            for a, i in enumerate(indices):
+                for j in indices[a + 1:]:
+                    if _son_variantes_tokens(tokens[i], tokens[j]):
+                        _unir_variantes(unir, mejores_por_categoria, i, j)
+            continue
+        primero = indices[0]
+        for j in indices[1:]:
+            _unir_variantes(unir, mejores_por_categoria, primero, j)
 
     grupos = {}
     for i in range(n):
@@ -315,6 +679,9 @@ def agrupar_variantes(mejores_por_categoria):
                 'precio': mejores_por_categoria[k]['producto']['precio'],
                 'precio_anterior': mejores_por_categoria[k]['producto'].get('precio_anterior'),
                 'descuento': mejores_por_categoria[k]['producto']['descuento'],
+                'etiqueta': etiqueta_variante(
+                    mejores_por_categoria[k]['producto']['titulo'], tokens[idx_rep], tokens[k]
+                ),
             }
             for k in indices_ord[1:]
         ]
@@ -330,17 +697,102 @@ def agrupar_variantes(mejores_por_categoria):
     return resultado
 
 
+def _misma_familia(producto, otro):
+    """True si dos ofertas del mismo ciclo son de la misma marca prioritaria o tienen titulos similares."""
+    marca = producto.get('marca')
+    if marca and marca == otro.get('marca'):
+        return True
+    return titulos_similares(producto['titulo'], otro['titulo'])
+
+
+def seleccionar_ofertas_ciclo(ranking_global, n, ultimas_categorias,
+                              categorias_excluidas_repeticion=(), admitir=None):
+    """
+    Elige hasta n ofertas del ranking global (de mejor a peor, una por
+    categoria) para publicarlas en el mismo ciclo.
+
+    - Anti-repeticion: se saltan las categorias de ultimas_categorias (salvo
+      las de categorias_excluidas_repeticion) y cada elegida cuenta como
+      reciente para las siguientes. Si ninguna pasa, se publica la mejor que
+      admita el canal aunque su categoria sea reciente (como con una sola
+      publicacion por ciclo).
+    - Diversidad: dentro del ciclo no se repite marca prioritaria ni se
+      eligen dos titulos similares.
+    - admitir(entrada, elegidas): restricciones propias del canal (ej: un solo
+      accesorio por ciclo); None admite todas.
+
+    Retorna la lista de entradas elegidas, en orden de publicacion.
+    """
+    recientes = list(ultimas_categorias)
+    elegidas = []
+    for entrada in ranking_global:
+        if len(elegidas) >= n:
+            break
+        nombre = entrada['categoria']['nombre']
+        if nombre in recientes and nombre not in categorias_excluidas_repeticion:
+            continue
+        if admitir is not None and not admitir(entrada, elegidas):
+            continue
+        if any(_misma_familia(entrada['producto'], e['producto']) for e in elegidas):
+            log.info(
+                "  Diversidad: %s... no se publica en este ciclo (misma marca o titulo similar a otra elegida)",
+                entrada['producto']['titulo'][:35]
+            )
+            continue
+        elegidas.append(entrada)
+        recientes.insert(0, nombre)
+
+    if not elegidas:
+        # El respaldo tambien pasa por las restricciones propias del canal
+        respaldo = next(
+            (e for e in ranking_global if admitir is None or admitir(e, elegidas)), None
+        )
+        if respaldo is not None:
+            elegidas.append(respaldo)
+    return elegidas
+
+
+@lru_cache(maxsize=16)
+def _compilar_marcas(marcas):
+    """
+    Un solo regex para todas las marcas (las mas largas primero, sin distinguir
+    mayusculas) y el mapa de texto encontrado -> marca tal como esta en la lista.
+    """
+    ordenadas = sorted(marcas, key=len, reverse=True)
+    regex = re.compile('|'.join(re.escape(m) for m in ordenadas), re.IGNORECASE) if ordenadas else None
+    return regex, {m.lower(): m for m in ordenadas}
+
+
+def marca_en_titulo(titulo, marcas):
+    """Retorna la marca de la lista que aparece en el titulo (o None)."""
+    regex, por_texto = _compilar_marcas(tuple(marcas))
+    if regex is None:
+        return None
+    match = regex.search(titulo)
+    return por_texto[match.group().lower()] if match else None
+
+
 def obtener_prioridad_marca(titulo, marcas):
     """
     Extrae la marca del titulo y retorna su prioridad según la lista de marcas.
     - 1: marca prioritaria encontrada
     - 0: sin marca prioritaria
     """
-    titulo_lower = titulo.lower()
-    for marca in marcas:
-        if marca.lower() in titulo_lower:
-            return 1
-    return 0
+    return 1 if marca_en_titulo(titulo, marcas) else 0
+
+
+def anotar_marca(producto, marcas):
+    """
+    Calcula una sola vez la marca prioritaria del producto y la guarda en el
+    registro ('marca', 'prioridad_marca'); las siguientes llamadas solo leen.
+    Retorna la prioridad.
+    """
+    prioridad = producto.get('prioridad_marca')
+    if prioridad is None:
+        marca = marca_en_titulo(producto['titulo'], marcas)
+        producto['marca'] = marca
+        producto['prioridad_marca'] = prioridad = 1 if marca else 0
+    return prioridad
 
 
 def send_telegram_message(message, token, chat_id):
@@ -399,13 +851,16 @@ def format_telegram_message(producto, categoria):
     # Calcular descuento si hay precio anterior
     descuento_texto = ""
     if precio_anterior:
-        try:
-            precio_num = float(precio.replace('€', '').replace(',', '.').strip())
-            precio_ant_num = float(precio_anterior.replace('€', '').replace(',', '.').strip())
-            descuento = ((precio_ant_num - precio_num) / precio_ant_num) * 100
+        # Reutilizar los céntimos ya parseados en la extracción si están disponibles
+        precio_cent = producto.get('precio_cent')
+        if precio_cent is None:
+            precio_cent = precio_a_centimos(precio)
+        precio_ant_cent = producto.get('precio_anterior_cent')
+        if precio_ant_cent is None:
+            precio_ant_cent = precio_a_centimos(precio_anterior)
+        if precio_cent is not None and precio_ant_cent:
+            descuento = calcular_descuento(precio_cent, precio_ant_cent)
             descuento_texto = f" (-{descuento:.0f}%)"
-        except:
-            descuento_texto = ""
 
     variantes = producto.get('variantes_adicionales', [])
 
@@ -414,27 +869,6 @@ def format_telegram_message(producto, categoria):
 
     # Si hay variantes, mostrar todas las opciones de forma paralela
     if variantes:
-        # Función auxiliar para extraer identificador de variante (ej: 'PS5', 'Azul')
-        def extraer_variante_id(titulo_completo, titulo_base):
-            """
-            Extrae identificador que diferencia las variantes.
-            Busca plataformas (PS5, PS4, etc.) o colores no presentes en la base.
-            """
-            # Buscar primero palabras con patrón PSX, GenX, etc. (letra+números)
-            # Usar patrón más específico: 1-2 letras seguidas de números
-            palabras_plataforma = re.findall(r'\b([a-záéíóúñü]{1,3}\d+)\b', titulo_completo, re.IGNORECASE)
-            if palabras_plataforma:
-                return palabras_plataforma[0].upper()
-
-            # Fallback: extraer palabras del título que no estén en la base
-            palabras_base = normalizar_titulo(titulo_base)
-            palabras_completo = normalizar_titulo(titulo_completo)
-            diferencia = palabras_completo - palabras_base
-            if diferencia:
-                return list(diferencia)[0].upper()
-
-            return ""
-
         # Producto principal
         if precio_anterior:
             message += f"💰 <a href=\"{url}\"><b>{precio}</b></a> <s>{precio_anterior}</s>{descuento_texto}\n"
@@ -444,14 +878,16 @@ def format_telegram_message(producto, categoria):
         # Variantes adicionales (todas con link y su identificador)
         for variante in variantes:
             var_url = html.escape(variante['url'])
-            var_titulo = variante['titulo']
             var_precio = variante.get('precio', '')
             var_precio_anterior = variante.get('precio_anterior')
             var_desc = variante.get('descuento', 0)
             var_desc_texto = f" (-{int(var_desc)}%)" if var_desc else ""
 
-            # Extraer identificador de esta variante
-            var_id_label = extraer_variante_id(var_titulo, titulo)
+            # Identificador de esta variante: lo calcula agrupar_variantes; solo
+            # se calcula aqui para variantes construidas a mano
+            var_id_label = variante.get('etiqueta')
+            if var_id_label is None:
+                var_id_label = etiqueta_variante(variante['titulo'], tokenizar_titulo(producto['titulo']))
             var_id_texto = f" ({var_id_label})" if var_id_label else ""
 
             if var_precio_anterior:
@@ -495,45 +931,267 @@ def obtener_pagina(url, reintentos=3):
                 return None
 
 
-def extraer_productos_busqueda(html_content):
-    """Extrae productos de una pagina de busqueda de Amazon."""
-    productos = []
+# Indicadores de preorden/próximo lanzamiento en el texto de un resultado de búsqueda
+INDICADORES_PREORDEN = [
+    'disponible el ',
+    'disponible a partir',
+    'próximamente',
+    'próxima',
+    'pronto disponible',
+    'preventa',
+    'pre-orden',
+    'preorden',
+    'preorder',
+    'reservar',
+    'reserva',
+    'en reserva',
+    'fecha de lanzamiento',
+    'lanzamiento',
+    'nuevo lanzamiento',
+]
+
+# Indicadores fuertes: siguen valiendo aunque haya un marcador de falso positivo
+INDICADORES_PREORDEN_FUERTES = ['disponible el', 'próximamente', 'pronto disponible', 'fecha de lanzamiento']
+
+# Marcadores de falso positivo (ej: "sin bono de reserva")
+FALSOS_POSITIVOS_PREORDEN = ['sin bono', 'no recomendada']
+
+
+# Clases de señal que devuelve clases_prereserva()
+CLASE_PREORDEN = 'preorden'
+CLASE_PREORDEN_FUERTE = 'fuerte'
+CLASE_FALSO_POSITIVO = 'falso_positivo'
+
+
+def _patrones_minimos(patrones):
+    """
+    Quita los patrones que contienen a otro de la lista (ej: 'en reserva'
+    contiene 'reserva'): para saber si aparece alguno basta con los demás.
+    """
+    return tuple(p for p in patrones if not any(otro != p and otro in p for otro in patrones))
+
+
+# Listas reducidas para la deteccion (misma respuesta, menos busquedas por item)
+_PREORDEN_MINIMOS = _patrones_minimos(INDICADORES_PREORDEN)
+_PREORDEN_FUERTES_MINIMOS = _patrones_minimos(INDICADORES_PREORDEN_FUERTES)
+_FALSOS_POSITIVOS_MINIMOS = _patrones_minimos(FALSOS_POSITIVOS_PREORDEN)
+
+
+def _contiene_alguno(texto, patrones):
+    # map sobre el metodo de str: la busqueda y el bucle quedan en C, sin generador
+    return any(map(texto.__contains__, patrones))
+
+
+def clases_prereserva(texto):
+    """
+    Clases de indicador presentes en el texto (ya en minúsculas), como
+    frozenset de CLASE_PREORDEN, CLASE_PREORDEN_FUERTE y CLASE_FALSO_POSITIVO.
+    Para decidir solo si es preorden, es_texto_prereserva es más rápido.
+    """
+    return frozenset(
+        clase for clase, patrones in (
+            (CLASE_PREORDEN, _PREORDEN_MINIMOS),
+            (CLASE_PREORDEN_FUERTE, _PREORDEN_FUERTES_MINIMOS),
+            (CLASE_FALSO_POSITIVO, _FALSOS_POSITIVOS_MINIMOS),
+        )
+        if _contiene_alguno(texto, patrones)
+    )
+
+
+def es_texto_prereserva(texto):
+    """
+    Determina si el texto de un item (ya en minúsculas) tiene señales de preorden.
+    Si aparece un marcador de falso positivo, solo se acepta con un indicador fuerte.
+
+    No es un emparejador compilado de una sola pasada: hace una busqueda de
+    subcadena por patron (str.__contains__, en C) sobre listas reducidas y se
+    para en la primera respuesta segura. La mayoria de items no tiene ningun
+    indicador y sale tras la primera lista. Un regex con todos los patrones
+    combinados resulto mas lento en CPython.
+    """
+    if not _contiene_alguno(texto, _PREORDEN_MINIMOS):
+        return False
+    if _contiene_alguno(texto, _FALSOS_POSITIVOS_MINIMOS):
+        # Aquí estamos en el título/descripción normal, probablemente falso positivo
+        return _contiene_alguno(texto, _PREORDEN_FUERTES_MINIMOS)
+    return True
+
+
+# Numero de resultados de busqueda que se procesan por pagina
+MAX_ITEMS_PAGINA = 20
+
+# Marcas en el HTML crudo que usa el prefiltro de ofertas
+_MARCA_TARJETA = 'data-component-type="s-search-result"'
+_MARCA_PRECIO_TACHADO = 'data-a-strike="true"'
+
+
+def prefiltrar_tarjetas_con_oferta(html_content, max_items=MAX_ITEMS_PAGINA):
+    """
+    Pre-pasada sobre el HTML crudo, sin construir el DOM: corta la pagina en
+    las fronteras de tarjeta de resultado y conserva solo las tarjetas con
+    precio tachado (data-a-strike="true"). Solo se miran las primeras
+    max_items tarjetas, igual que extraer_productos_busqueda.
+
+    No aplicar en la ruta de preórdenes, que necesita tarjetas sin descuento.
+
+    Retorna (html, tarjetas descartadas), donde html es:
+        - el HTML reducido a las tarjetas con oferta
+        - '' si hay tarjetas pero ninguna con oferta (no hace falta parsear)
+        - el HTML original si no se reconoce ninguna tarjeta (no se puede
+          prefiltrar con seguridad; el parser decide)
+    """
+    # Inicio de cada tarjeta: el '<' de la etiqueta que lleva la marca.
+    # Se busca una mas de max_items para saber donde acaba la ultima.
+    inicios = []
+    pos = html_content.find(_MARCA_TARJETA)
+    while pos != -1 and len(inicios) <= max_items:
+        inicios.append(html_content.rfind('<', 0, pos))
+        pos = html_content.find(_MARCA_TARJETA, pos + len(_MARCA_TARJETA))
+
+    if not inicios:
+        return html_content, 0
+
+    n_tarjetas = min(len(inicios), max_items)
+    fragmentos = []
+    for i in range(n_tarjetas):
+        fin = inicios[i + 1] if i + 1 < len(inicios) else len(html_content)
+        if html_content.find(_MARCA_PRECIO_TACHADO, inicios[i], fin) != -1:
+            fragmentos.append(html_content[inicios[i]:fin])
+
+    log.debug(
+        "  Prefiltro: %d de %d tarjetas con precio tachado", len(fragmentos), n_tarjetas
+    )
+    descartadas = n_tarjetas - len(fragmentos)
+    if not fragmentos:
+        return '', descartadas
+    return '<html><body>' + ''.join(fragmentos) + '</body></html>', descartadas
+
+
+# --- Limites de memoria del parseo ---
+MAX_MEMORIA_PAGINA_MB_DEFECTO = 256
+
+
+def _entero_de_entorno(nombre, defecto):
+    """Entero de una variable de entorno; un valor no numerico avisa y usa el defecto."""
+    valor = os.getenv(nombre)
+    if valor is None or not valor.strip():
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        log.warning("%s=%r no es un numero entero, se usa %d", nombre, valor, defecto)
+        return defecto
+
+
+# Memoria pico maxima estimada por pagina (MB); 0 = sin limite.
+# Se leen del entorno para que apliquen tambien en los procesos de EtapaParseo.
+MAX_MEMORIA_PAGINA_MB = _entero_de_entorno('OFERTAS_MAX_MEMORIA_PAGINA_MB', MAX_MEMORIA_PAGINA_MB_DEFECTO)
+
+# Medir con tracemalloc la memoria pico de cada pagina (coste extra, para diagnostico)
+MEDIR_MEMORIA_PARSEO = os.getenv('OFERTAS_MEDIR_MEMORIA') == '1'
+
+# Memoria pico de html.parser por byte de HTML (medido con tracemalloc: ~35-45x)
+FACTOR_MEMORIA_HTML = 40
+
+
+def extraer_productos_busqueda(html_content, max_memoria_mb=None, medir_memoria=None):
+    """
+    Extrae productos de una pagina de busqueda de Amazon.
+
+    En el mismo recorrido de cada item se calcula 'es_prereserva', de modo que
+    ofertas y preórdenes se filtran sobre la misma lista sin volver al HTML.
+
+    Antes de parsear se estima la memoria pico (tamaño del HTML x
+    FACTOR_MEMORIA_HTML) y se descarta la pagina si la estimacion supera
+    max_memoria_mb. Es solo una estimacion: la memoria real del parseo no se
+    limita. Con medir_memoria se registra el pico real medido con
+    tracemalloc (solo se mide, tampoco se corta el parseo).
+
+    Args:
+        html_content: HTML de la pagina de busqueda
+        max_memoria_mb: Limite de la memoria estimada en MB (default MAX_MEMORIA_PAGINA_MB; 0 = sin limite)
+        medir_memoria: Medir el pico con tracemalloc (default MEDIR_MEMORIA_PARSEO)
+    """
+    if max_memoria_mb is None:
+        max_memoria_mb = MAX_MEMORIA_PAGINA_MB
+    if medir_memoria is None:
+        medir_memoria = MEDIR_MEMORIA_PARSEO
+
+    estimado_mb = len(html_content) * FACTOR_MEMORIA_HTML / (1024 * 1024)
+    if max_memoria_mb and estimado_mb > max_memoria_mb:
+        log.warning(
+            "  Pagina descartada sin parsear: %d KB de HTML (~%.0f MB estimados a x%d, limite %d MB)",
+            len(html_content) // 1024, estimado_mb, FACTOR_MEMORIA_HTML, max_memoria_mb
+        )
+        return []
+
+    if not medir_memoria:
+        return _extraer_productos_html(html_content)
+
+    ya_activo = tracemalloc.is_tracing()
+    if not ya_activo:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        productos = _extraer_productos_html(html_content)
+    finally:
+        _, pico = tracemalloc.get_traced_memory()
+        if not ya_activo:
+            tracemalloc.stop()
+    log.info(
+        "  Memoria pico del parseo: %.1f MB (HTML %d KB, x%.0f)",
+        pico / (1024 * 1024), len(html_content) // 1024, pico / max(len(html_content), 1)
+    )
+    return productos
+
+
+def _extraer_productos_html(html_content):
+    """
+    Parsea el HTML y devuelve solo datos planos (Producto). El arbol de
+    BeautifulSoup se destruye al terminar para liberar su memoria en el
+    momento, sin esperar al recolector de ciclos.
+    """
     soup = BeautifulSoup(html_content, 'html.parser')
+    try:
+        return _extraer_items(soup)
+    finally:
+        soup.decompose()
+
+
+def _extraer_items(soup):
+    """
+    Recorre los resultados de búsqueda del arbol y devuelve un Producto por item.
+
+    Cada campo se busca con su cadena de selectores (SELECTORES_CAMPO) y los
+    aciertos, fallos y errores quedan en la ListaProductos.estadisticas.
+    """
+    estadisticas = EstadisticasSelectores()
+    productos = ListaProductos(estadisticas=estadisticas)
     items = soup.select('[data-component-type="s-search-result"]')
 
-    for item in items[:20]:  # Mas productos para encontrar ofertas
+    for item in items[:MAX_ITEMS_PAGINA]:  # Mas productos para encontrar ofertas
+        estadisticas.items += 1
         try:
             asin = item.get('data-asin', '')
             if not asin:
                 continue
 
-            titulo_elem = item.select_one('h2 a span') or item.select_one('h2 span')
+            titulo_elem = estadisticas.seleccionar(item, 'titulo')
             titulo = titulo_elem.get_text(strip=True) if titulo_elem else "Sin titulo"
 
             precio = "N/A"
-            precio_elem = item.select_one('.a-price .a-offscreen')
+            precio_elem = estadisticas.seleccionar(item, 'precio')
             if precio_elem:
                 precio = precio_elem.get_text(strip=True)
 
             precio_anterior = None
-            precio_anterior_elem = item.select_one('.a-price[data-a-strike="true"] .a-offscreen')
+            precio_anterior_elem = estadisticas.seleccionar(item, 'precio_anterior')
             if precio_anterior_elem:
                 precio_anterior = precio_anterior_elem.get_text(strip=True)
 
-            # Calcular descuento
-            descuento = 0
-            if precio_anterior and precio != "N/A":
-                try:
-                    precio_num = float(precio.replace('€', '').replace(',', '.').strip())
-                    precio_ant_num = float(precio_anterior.replace('€', '').replace(',', '.').strip())
-                    if precio_ant_num > 0:
-                        descuento = ((precio_ant_num - precio_num) / precio_ant_num) * 100
-                except:
-                    descuento = 0
-
             # Extraer numero de valoraciones
             valoraciones = 0
-            valoraciones_elem = item.select_one('.a-size-base.s-underline-text') or item.select_one('[aria-label*="estrellas"] + span')
+            valoraciones_elem = estadisticas.seleccionar(item, 'valoraciones')
             if valoraciones_elem:
                 try:
                     val_text = valoraciones_elem.get_text(strip=True).replace('.', '').replace(',', '')
@@ -543,7 +1201,7 @@ def extraer_productos_busqueda(html_content):
 
             # Extraer ventas (ej: "10K+ comprados el mes pasado")
             ventas = 0
-            ventas_elem = item.select_one('.a-size-base.a-color-secondary')
+            ventas_elem = estadisticas.seleccionar(item, 'ventas')
             if ventas_elem:
                 ventas_text = ventas_elem.get_text(strip=True).lower()
                 if 'compra' in ventas_text or 'vendido' in ventas_text:
@@ -557,26 +1215,125 @@ def extraer_productos_busqueda(html_content):
                         ventas = 0
 
             imagen = ""
-            img_elem = item.select_one('img.s-image')
+            img_elem = estadisticas.seleccionar(item, 'imagen')
             if img_elem:
                 imagen = img_elem.get('src', '')
 
+            # Señales de preorden (texto del item completo, una sola vez)
+            es_prereserva = es_texto_prereserva(item.get_text(strip=True).lower())
+
             url_afiliado = f"{BASE_URL}/dp/{asin}?tag={PARTNER_TAG}"
 
-            productos.append({
-                'asin': asin,
-                'titulo': titulo[:100] + "..." if len(titulo) > 100 else titulo,
-                'precio': precio,
-                'precio_anterior': precio_anterior,
-                'descuento': descuento,
-                'valoraciones': valoraciones,
-                'ventas': ventas,
-                'imagen': imagen,
-                'url': url_afiliado,
-                'tiene_oferta': precio_anterior is not None
-            })
-
-        except Exception:
+            titulo = titulo[:100] + "..." if len(titulo) > 100 else titulo
+
+            # Precios en céntimos, descuento y palabras clave se calculan aquí una sola vez
+            productos.append(Producto(
+                asin=asin,
+                titulo=titulo,
+                precio=precio,
+                precio_anterior=precio_anterior,
+                valoraciones=valoraciones,
+                ventas=ventas,
+                imagen=imagen,
+                url=url_afiliado,
+                es_prereserva=es_prereserva,
+                tokens_titulo=tokenizar_titulo(titulo),
+            ))
+
+        except Exception as e:
+            estadisticas.registrar_error(e)
             continue
 
+    if estadisticas.items and not productos:
+        log.warning(
+            "  %d resultados en la pagina pero 0 productos extraidos: posible cambio de maqueta",
+            estadisticas.items
+        )
     return productos
+
+
+def _parsear_pagina(extractor, html_content, tarjetas_descartadas):
+    """Extrae los productos de una página y anota las tarjetas que descartó el prefiltro."""
+    productos = extractor(html_content)
+    if not isinstance(productos, ListaProductos):
+        productos = ListaProductos(productos)
+    productos.tarjetas_descartadas = tarjetas_descartadas
+    return productos
+
+
+class EtapaParseo:
+    """
+    Etapa opcional de parseo: HTML crudo -> lista de productos.
+
+    BeautifulSoup consume CPU y retiene el GIL. Con procesos > 0 el parseo se
+    hace en un ProcessPoolExecutor, de modo que las páginas ya descargadas se
+    parsean en otros núcleos mientras se descargan las siguientes; el worker
+    devuelve solo la lista compacta de productos. Con procesos = 0 (por
+    defecto) se parsea en el momento, en el hilo actual.
+
+    Uso:
+        with EtapaParseo(procesos=2) as etapa:
+            futuro = etapa.enviar(html_content)
+        productos = futuro.result()   # al salir del with todo está parseado
+
+    Args:
+        procesos: Número de procesos del pool (0 = sin pool)
+        extractor: Función html -> productos (debe ser importable a nivel de
+            módulo para poder enviarse al pool)
+        prefiltro: Función opcional html -> (html reducido, tarjetas
+            descartadas) que se aplica antes de parsear (ej:
+            prefiltrar_tarjetas_con_oferta); si el html queda vacío la página
+            no se parsea. Las descartadas quedan en
+            ListaProductos.tarjetas_descartadas
+    """
+
+    def __init__(self, procesos=0, extractor=None, prefiltro=None):
+        self.extractor = extractor or extraer_productos_busqueda
+        self.prefiltro = prefiltro
+        # Estadisticas de selectores acumuladas de todas las paginas (tambien las del pool)
+        self.estadisticas = EstadisticasSelectores()
+        self._pool = ProcessPoolExecutor(max_workers=procesos) if procesos > 0 else None
+        if self._pool is not None:
+            log.debug("Etapa de parseo con %d procesos", procesos)
+
+    def enviar(self, html_content):
+        """Envía una página a parsear. Retorna un Future con la lista de productos."""
+        descartadas = 0
+        if self.prefiltro is not None:
+            # El prefiltro trabaja sobre el texto crudo en este proceso; si no
+            # queda nada que parsear, ni se construye el DOM ni se envia al pool
+            html_content, descartadas = self.prefiltro(html_content)
+            if not html_content:
+                futuro = Future()
+                futuro.set_result(ListaProductos(tarjetas_descartadas=descartadas))
+                return futuro
+        if self._pool is not None:
+            futuro = self._pool.submit(_parsear_pagina, self.extractor, html_content, descartadas)
+        else:
+            futuro = Future()
+            try:
+                futuro.set_result(_parsear_pagina(self.extractor, html_content, descartadas))
+            except Exception as e:
+                futuro.set_exception(e)
+        futuro.add_done_callback(self._acumular_estadisticas)
+        return futuro
+
+    def _acumular_estadisticas(self, futuro):
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        estadisticas = getattr(futuro.result(), 'estadisticas', None)
+        if estadisticas is not None:
+            self.estadisticas.fusionar(estadisticas)
+
+    def cerrar(self, cancelar=False):
+        """Espera a que terminen los parseos pendientes (o los cancela) y libera el pool."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=cancelar)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar(cancelar=exc_type is not None)
+        return False
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de las rutas calientes del core (sin red ni Telegram).
+
+Uso:
+    python -m shared.bench_ofertas prereservas [pagina1.html ... | capturas/]
+    python -m shared.bench_ofertas variantes [-n 10000]
+
+Sin ficheros se generan páginas sintéticas con la misma estructura que las
+páginas de búsqueda de Amazon que usan los tests. Para medir sobre páginas
+reales se pueden pasar ficheros HTML o directorios de capturas del simulador
+(python -m shared.simulador capturar ps capturas/), que se recorren enteros.
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+# Permitir `python shared/bench_ofertas.py` además de `python -m shared.bench_ofertas`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import amazon_ofertas_core as core
+
+
+_TEXTOS_SINTETICOS = [
+    "Disponible el 15 de marzo de 2026",
+    "Próximamente",
+    "Preventa - Edición Deluxe",
+    "Envío GRATIS mañana",
+    "Juego PS5 sin bono de reserva",
+    "Edad no recomendada para menores de 18",
+    "Más opciones de compra",
+    "Fecha de lanzamiento: 4 de abril",
+]
+
+
+def _pagina_sintetica(n_items=20, semilla=0):
+    """Genera una página de búsqueda con n_items resultados de texto variado."""
+    rnd = random.Random(semilla)
+    items = []
+    for i in range(n_items):
+        extra = " ".join(rnd.sample(_TEXTOS_SINTETICOS, 2))
+        items.append(
+            f'<div data-component-type="s-search-result" data-asin="B{semilla:03d}{i:05d}">'
+            f'<h2><a><span>Juego PS5 Título {i} Edición Estándar</span></a></h2>'
+            f'<span>{extra}</span>'
+            f'<span class="a-price"><span class="a-offscreen">{rnd.randint(10, 80)},99€</span></span>'
+            f'</div>'
+        )
+    return "<html><body>" + "".join(items) + "</body></html>"
+
+
+def _ficheros_html(rutas):
+    """Las rutas dadas, con cada directorio sustituido por sus .html (recursivo, en orden)."""
+    for ruta in rutas:
+        if not os.path.isdir(ruta):
+            yield ruta
+            continue
+        for raiz, dirs, ficheros in os.walk(ruta):
+            dirs.sort()
+            for nombre in sorted(ficheros):
+                if nombre.endswith('.html'):
+                    yield os.path.join(raiz, nombre)
+
+
+def _cargar_paginas(rutas):
+    if not rutas:
+        return [_pagina_sintetica(semilla=s) for s in range(10)]
+    paginas = []
+    for ruta in _ficheros_html(rutas):
+        with open(ruta, encoding='utf-8') as f:
+            paginas.append(f.read())
+    return paginas
+
+
+def _textos_items(paginas):
+    """Texto en minúsculas de cada resultado de búsqueda, como lo ve la detección."""
+    textos = []
+    for pagina in paginas:
+        soup = BeautifulSoup(pagina, 'html.parser')
+        for item in soup.select('[data-component-type="s-search-result"]'):
+            textos.append(item.get_text(strip=True).lower())
+    return textos
+
+
+def _es_texto_prereserva_multipasada(texto):
+    """Implementación anterior (todas las listas completas con `in`), como referencia."""
+    if any(ind in texto for ind in core.INDICADORES_PREORDEN):
+        if 'sin bono' in texto or 'no recomendada' in texto:
+            if not any(ind in texto for ind in core.INDICADORES_PREORDEN_FUERTES):
+                return False
+        return True
+    return False
+
+
+def bench_prereservas(rutas, repeticiones=200):
+    """
+    Compara la detección anterior con la actual: las dos buscan subcadena a
+    subcadena; la actual usa listas reducidas, map en C y salida temprana.
+    """
+    textos = _textos_items(_cargar_paginas(rutas))
+    if not textos:
+        print("No se encontraron items en las páginas indicadas")
+        return
+
+    distintos = sum(
+        _es_texto_prereserva_multipasada(t) != core.es_texto_prereserva(t) for t in textos
+    )
+
+    t_multi = timeit.timeit(
+        lambda: [_es_texto_prereserva_multipasada(t) for t in textos], number=repeticiones
+    )
+    t_actual = timeit.timeit(
+        lambda: [core.es_texto_prereserva(t) for t in textos], number=repeticiones
+    )
+    por_item = 1e6 / (len(textos) * repeticiones)
+    print(f"Items: {len(textos)} | repeticiones: {repeticiones}")
+    print(f"  anterior: {t_multi * por_item:.2f} µs/item")
+    print(f"  actual:   {t_actual * por_item:.2f} µs/item")
+    print(f"  resultados distintos: {distintos}")
+
+
+_BASES_TITULO = [
+    "Mando inalambrico DualSense", "Cochecito paseo plegable", "Auriculares gaming estereo",
+    "Mochila cambiador impermeable", "Volante carreras compatible", "Trona evolutiva madera",
+]
+_MODELOS_TITULO = ["Edicion", "Modelo", "Serie", "Version", "Coleccion"]
+
+
+def _titulos_sinteticos(n, semilla=0):
+    """Titulos con familias de variantes de color/tamaño y mucho ruido entre familias."""
+    rnd = random.Random(semilla)
+    variantes = sorted(core.PALABRAS_VARIANTE)
+    titulos = []
+    for i in range(n):
+        familia = rnd.randrange(max(1, n // 4))
+        base = _BASES_TITULO[familia % len(_BASES_TITULO)]
+        modelo = _MODELOS_TITULO[familia % len(_MODELOS_TITULO)]
+        # Palabra unica por familia (solo letras: las cifras no cuentan como palabra clave)
+        clave = "".join(chr(ord('a') + int(c)) for c in str(familia))
+        titulos.append(f"{base} {modelo} fam{clave} {rnd.choice(variantes)}")
+    return titulos
+
+
+def _agrupar_variantes_parejas(entradas):
+    """Agrupación anterior (todas las parejas con union-find), como referencia."""
+    n = len(entradas)
+    padre = list(range(n))
+
+    def encontrar(x):
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
+
+    tokens = [core.tokens_producto(e['producto']) for e in entradas]
+    for i in range(n):
+        for j in range(i + 1, n):
+            if core._son_variantes_tokens(tokens[i], tokens[j]):
+                pi, pj = encontrar(i), encontrar(j)
+                if pi != pj:
+                    padre[pi] = pj
+    grupos = {}
+    for i in range(n):
+        grupos.setdefault(encontrar(i), []).append(i)
+    return sorted(sorted(g) for g in grupos.values())
+
+
+def _grupos_de_resultado(entradas, resultado):
+    indice = {e['producto']['asin']: i for i, e in enumerate(entradas)}
+    grupos = []
+    for r in resultado:
+        asins = [r['producto']['asin']] + [v['asin'] for v in r['producto'].get('variantes_adicionales', [])]
+        grupos.append(sorted(indice[a] for a in asins))
+    return sorted(grupos)
+
+
+def bench_variantes(n=10000, max_referencia=2000):
+    """Compara la agrupación por parejas con la agrupación por bloques de firma."""
+    logging.getLogger().setLevel(logging.WARNING)  # agrupar_variantes registra cada union en INFO
+
+    titulos = _titulos_sinteticos(n)
+    entradas = [
+        {'producto': {'asin': f"B{i:09d}", 'titulo': t, 'url': '', 'precio': '9,99€',
+                      'descuento': float(i % 50), 'valoraciones': i % 1000},
+         'categoria': 'bench'}
+        for i, t in enumerate(titulos)
+    ]
+
+    inicio = timeit.default_timer()
+    resultado = core.agrupar_variantes(entradas)
+    t_bloques = timeit.default_timer() - inicio
+    print(f"Titulos: {n} | grupos: {len(resultado)}")
+    print(f"  bloques:  {t_bloques * 1000:.1f} ms")
+
+    m = min(n, max_referencia)
+    muestra = entradas[:m]
+    inicio = timeit.default_timer()
+    referencia = _agrupar_variantes_parejas(muestra)
+    t_parejas = timeit.default_timer() - inicio
+    iguales = referencia == _grupos_de_resultado(muestra, core.agrupar_variantes(muestra))
+    extrapolado = f" (~{t_parejas * (n / m) ** 2:.1f} s extrapolado a {n})" if m < n else ""
+    print(f"  parejas:  {t_parejas * 1000:.1f} ms con {m} titulos{extrapolado}")
+    print(f"  mismos grupos que la referencia: {'si' if iguales else 'NO'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks del core de ofertas')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p_pre = sub.add_parser('prereservas', help='Detección de preórdenes sobre páginas grabadas')
+    p_pre.add_argument('paginas', nargs='*', help='Ficheros HTML o directorios de capturas del simulador')
+    p_pre.add_argument('-n', type=int, default=200, help='Repeticiones (default 200)')
+
+    p_var = sub.add_parser('variantes', help='Agrupación de variantes sobre títulos sintéticos')
+    p_var.add_argument('-n', type=int, default=10000, help='Títulos (default 10000)')
+    p_var.add_argument('--max-referencia', type=int, default=2000,
+                       help='Títulos para la referencia por parejas, O(n²) (default 2000)')
+
+    args = parser.parse_args(argv)
+    if args.bench == 'prereservas':
+        bench_prereservas(args.paginas, args.n)
+    elif args.bench == 'variantes':
+        bench_variantes(args.n, args.max_referencia)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Backends del historial de ofertas publicadas (el estado anti-duplicados).
+
+- 'json' (por defecto): el fichero posted_*.json de siempre. Se lee entero
+  y se reescribe entero en cada ciclo; los metadatos (_ultimas_categorias,
+  _ultimos_titulos...) comparten espacio de claves con los ASINs.
+- 'sqlite': una base SQLite en modo WAL junto al JSON (mismo nombre,
+  extensión .sqlite3) con tablas separadas e indexadas: publicaciones
+  (asin, fecha), firmas de variante, títulos recientes, últimas categorías
+  publicadas y límite semanal por categoría. Cargar es una consulta por
+  ventana de tiempo sobre el índice de fecha (sin fromisoformat por entrada)
+  y guardar solo inserta las filas nuevas y borra las que ya no caben en
+  ninguna ventana (más antiguas que DIAS_RETENCION_SQLITE).
+- 'diario': un diario append-only junto al JSON (extensión .jsonl), una
+  línea JSON por publicación o cambio de metadatos. Al cargar se reproduce;
+  al guardar solo se añaden las líneas nuevas, así que el diff de cada
+  ciclo son unas pocas líneas. Cuando las líneas sustituidas o más antiguas
+  que DIAS_RETENCION_DIARIO pasan de MAX_LINEAS_CADUCADAS, guardar lo
+  reescribe compactado.
+
+SQLite y el diario migran el contenido del JSON la primera vez que se
+abren; el JSON no se toca. El backend se elige con la variable de entorno
+OFERTAS_BACKEND_ESTADO (json | sqlite | diario). Para volver al JSON o
+migrar a mano:
+    python -m shared.estado migrar ps/posted_ps_deals.sqlite3 ps/posted_ps_deals.json
+
+Todas las fechas se guardan en ISO (datetime.isoformat()), que ordena igual
+como texto que como fecha: las ventanas se filtran comparando cadenas.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Permitir `python shared/estado.py` además de `python -m shared.estado`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import amazon_ofertas_core as core
+from shared.amazon_ofertas_core import DIAS_VENTANA_TITULOS, HistorialTitulos, OfertasPublicadas
+
+log = logging.getLogger(__name__)
+
+BACKEND_ESTADO = os.getenv('OFERTAS_BACKEND_ESTADO', 'json')
+
+EXTENSION_SQLITE = '.sqlite3'
+EXTENSION_DIARIO = '.jsonl'
+
+# Lineas del diario que ya no cuentan (fuera de retencion o sustituidas) a partir
+# de las cuales se reescribe compactado
+MAX_LINEAS_CADUCADAS = 500
+
+# Dias que se conservan las filas con fecha en SQLite: la ventana mas larga
+# que se carga (la de titulos); lo anterior no lo vuelve a leer nadie
+DIAS_RETENCION_SQLITE = DIAS_VENTANA_TITULOS
+
+# Lo mismo para las lineas del diario al compactarlo. Es fija, no la ventana
+# de quien carga: una lectura con ventana corta no puede borrar nada
+DIAS_RETENCION_DIARIO = DIAS_VENTANA_TITULOS
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS publicaciones (
+    asin TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    PRIMARY KEY (asin, fecha)
+);
+CREATE INDEX IF NOT EXISTS idx_publicaciones_fecha ON publicaciones (fecha);
+CREATE TABLE IF NOT EXISTS firmas_variantes (
+    firma TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS titulos (
+    titulo TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_titulos_fecha ON titulos (fecha);
+CREATE TABLE IF NOT EXISTS ultimas_categorias (
+    posicion INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categorias_semanales (
+    categoria TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL
+);
+"""
+
+
+class EstadoJSON:
+    """El fichero JSON de siempre (core.load_posted_deals / core.save_posted_deals)."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def cargar(self, horas_ventana=48, dias_ventana_titulos=DIAS_VENTANA_TITULOS):
+        return core.load_posted_deals(self.ruta, horas_ventana, dias_ventana_titulos)
+
+    def guardar(self, deals_dict, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
+        core.save_posted_deals(deals_dict, self.ruta, ultimas_categorias, ultimos_titulos, categorias_semanales)
+
+
+class EstadoSQLite:
+    """
+    Historial en SQLite (WAL). Las publicaciones se conservan (una fila por
+    ASIN y fecha) durante dias_retencion; la ventana decide qué se carga.
+    ruta_json: JSON del que migrar si la base aún no existe.
+    """
+
+    def __init__(self, ruta, ruta_json=None, dias_retencion=DIAS_RETENCION_SQLITE):
+        self.ruta = ruta
+        self.ruta_json = ruta_json
+        self.dias_retencion = dias_retencion
+
+    @contextmanager
+    def _conexion(self):
+        con = sqlite3.connect(self.ruta)
+        try:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            con.executescript(_ESQUEMA)
+            yield con
+            con.commit()
+        finally:
+            con.close()
+
+    def cargar(self, horas_ventana=48, dias_ventana_titulos=DIAS_VENTANA_TITULOS):
+        if not os.path.exists(self.ruta) and self.ruta_json and os.path.exists(self.ruta_json):
+            log.info("Migrando historial de %s a SQLite (%s)", self.ruta_json, self.ruta)
+            self.guardar(*core.load_posted_deals(self.ruta_json, horas_ventana, dias_ventana_titulos))
+
+        ahora = datetime.now()
+        corte = (ahora - timedelta(hours=horas_ventana)).isoformat()
+        limite_titulos = (ahora - timedelta(days=dias_ventana_titulos)).isoformat()
+        with self._conexion() as con:
+            deals = OfertasPublicadas(
+                con.execute(
+                    'SELECT asin, MAX(fecha) FROM publicaciones WHERE fecha > ? GROUP BY asin', (corte,)
+                ),
+                dict(con.execute('SELECT firma, fecha FROM firmas_variantes WHERE fecha > ?', (corte,))),
+            )
+            ultimas_categorias = [
+                nombre for nombre, in con.execute('SELECT nombre FROM ultimas_categorias ORDER BY posicion')
+            ]
+            filas_titulos = con.execute(
+                'SELECT titulo, fecha FROM titulos WHERE fecha > ? ORDER BY fecha DESC', (limite_titulos,)
+            ).fetchall()
+            categorias_semanales = dict(con.execute('SELECT categoria, fecha FROM categorias_semanales'))
+
+        ultimos_titulos = HistorialTitulos([t for t, _ in filas_titulos], [f for _, f in filas_titulos])
+        log.info("Historial cargado (SQLite): %d ASINs en ventana de %dh", len(deals), horas_ventana)
+        if ultimas_categorias:
+            log.info("Ultimas categorias publicadas (anti-repeticion): %s", ", ".join(ultimas_categorias))
+        return deals, ultimas_categorias, ultimos_titulos, categorias_semanales
+
+    def guardar(self, deals_dict, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
+        """
+        Inserta lo nuevo (las filas que ya existen se ignoran o se actualiza su
+        fecha) y borra las filas más antiguas que dias_retencion.
+        """
+        ultimos_titulos = ultimos_titulos or []
+        fechas_titulos = getattr(ultimos_titulos, 'fechas', None) or [datetime.now().isoformat()] * len(ultimos_titulos)
+        limite = (datetime.now() - timedelta(days=self.dias_retencion)).isoformat()
+        with self._conexion() as con:
+            con.executemany(
+                'INSERT OR IGNORE INTO publicaciones (asin, fecha) VALUES (?, ?)', deals_dict.items()
+            )
+            con.executemany(
+                'INSERT INTO firmas_variantes (firma, fecha) VALUES (?, ?) '
+                'ON CONFLICT (firma) DO UPDATE SET fecha = MAX(fecha, excluded.fecha)',
+                (getattr(deals_dict, 'firmas_variantes', None) or {}).items(),
+            )
+            con.executemany(
+                'INSERT INTO titulos (titulo, fecha) VALUES (?, ?) '
+                'ON CONFLICT (titulo) DO UPDATE SET fecha = MAX(fecha, excluded.fecha)',
+                zip(ultimos_titulos, fechas_titulos),
+            )
+            con.execute('DELETE FROM ultimas_categorias')
+            con.executemany(
+                'INSERT INTO ultimas_categorias (posicion, nombre) VALUES (?, ?)',
+                enumerate(ultimas_categorias or []),
+            )
+            con.executemany(
+                'INSERT OR REPLACE INTO categorias_semanales (categoria, fecha) VALUES (?, ?)',
+                (categorias_semanales or {}).items(),
+            )
+            for tabla in ('publicaciones', 'firmas_variantes', 'titulos'):
+                con.execute(f'DELETE FROM {tabla} WHERE fecha < ?', (limite,))
+
+
+class _Reproduccion:
+    """Estado acumulado al reproducir el diario (la fecha mas reciente de cada clave)."""
+
+    def __init__(self):
+        self.publicaciones = {}
+        self.firmas = {}
+        self.titulos = {}
+        self.ultimas_categorias = []
+        self.semanales = {}
+        self.lineas = 0
+
+    def aplicar(self, evento):
+        tipo = evento['tipo']
+        if tipo == 'publicacion':
+            _mas_reciente(self.publicaciones, evento['asin'], evento['fecha'])
+        elif tipo == 'firma':
+            _mas_reciente(self.firmas, evento['firma'], evento['fecha'])
+        elif tipo == 'titulo':
+            _mas_reciente(self.titulos, evento['titulo'], evento['fecha'])
+        elif tipo == 'ultimas_categorias':
+            self.ultimas_categorias = list(evento['categorias'])
+        elif tipo == 'categoria_semanal':
+            self.semanales[evento['categoria']] = evento['fecha']
+        else:
+            raise ValueError(f"tipo de evento desconocido: {tipo}")
+
+
+def _mas_reciente(fechas, clave, fecha):
+    if fecha > fechas.get(clave, ''):
+        fechas[clave] = fecha
+
+
+def _eventos_nuevos(previo, deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales):
+    """Eventos que hay que añadir al diario reproducido `previo` para llegar al estado dado."""
+    ultimos_titulos = ultimos_titulos or []
+    fechas_titulos = getattr(ultimos_titulos, 'fechas', None) or [datetime.now().isoformat()] * len(ultimos_titulos)
+    eventos = []
+    for asin, fecha in deals_dict.items():
+        if fecha > previo.publicaciones.get(asin, ''):
+            eventos.append({'tipo': 'publicacion', 'asin': asin, 'fecha': fecha})
+    for firma, fecha in (getattr(deals_dict, 'firmas_variantes', None) or {}).items():
+        if fecha > previo.firmas.get(firma, ''):
+            eventos.append({'tipo': 'firma', 'firma': firma, 'fecha': fecha})
+    # Del mas antiguo al mas reciente: el diario queda en orden cronologico
+    for titulo, fecha in reversed(list(zip(ultimos_titulos, fechas_titulos))):
+        if fecha > previo.titulos.get(titulo, ''):
+            eventos.append({'tipo': 'titulo', 'titulo': titulo, 'fecha': fecha})
+    if list(ultimas_categorias or []) != previo.ultimas_categorias:
+        eventos.append({'tipo': 'ultimas_categorias', 'categorias': list(ultimas_categorias or [])})
+    for categoria, fecha in (categorias_semanales or {}).items():
+        if previo.semanales.get(categoria) != fecha:
+            eventos.append({'tipo': 'categoria_semanal', 'categoria': categoria, 'fecha': fecha})
+    return eventos
+
+
+def _linea(evento):
+    return json.dumps(evento, ensure_ascii=False) + '\n'
+
+
+def _termina_en_salto(ruta):
+    """True si el fichero no existe, está vacío o su último byte es un salto de línea."""
+    try:
+        with open(ruta, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    except FileNotFoundError:
+        return True
+
+
+def _estado_en_ventana(repro, desde_deals, desde_titulos):
+    """Tupla de historial con las publicaciones/firmas y los titulos posteriores a cada fecha."""
+    corte = desde_deals.isoformat()
+    limite_titulos = desde_titulos.isoformat()
+    deals = OfertasPublicadas(
+        {asin: fecha for asin, fecha in repro.publicaciones.items() if fecha > corte},
+        {firma: fecha for firma, fecha in repro.firmas.items() if fecha > corte},
+    )
+    titulos = sorted(
+        ((t, f) for t, f in repro.titulos.items() if f > limite_titulos), key=lambda tf: tf[1], reverse=True
+    )
+    ultimos_titulos = HistorialTitulos([t for t, _ in titulos], [f for _, f in titulos])
+    return deals, repro.ultimas_categorias, ultimos_titulos, repro.semanales
+
+
+class EstadoDiario:
+    """
+    Historial como diario append-only (JSON Lines). Cargar lo reproduce
+    entero y no lo modifica. Guardar añade solo las lineas de lo nuevo
+    (reproduce el diario para saber qué hay) y, si las lineas sustituidas o
+    con más de dias_retencion días llegan a max_caducadas, lo reescribe con
+    solo lo retenido. ruta_json: JSON del que migrar si el diario aún no
+    existe.
+    """
+
+    def __init__(self, ruta, ruta_json=None, max_caducadas=None, dias_retencion=DIAS_RETENCION_DIARIO):
+        self.ruta = ruta
+        self.ruta_json = ruta_json
+        self.max_caducadas = MAX_LINEAS_CADUCADAS if max_caducadas is None else max_caducadas
+        self.dias_retencion = dias_retencion
+
+    def _reproducir(self):
+        repro = _Reproduccion()
+        if not os.path.exists(self.ruta):
+            return repro
+        invalidas = 0
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            for linea in f:
+                if not linea.strip():
+                    continue
+                repro.lineas += 1
+                try:
+                    repro.aplicar(json.loads(linea))
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                    invalidas += 1
+        if invalidas:
+            log.warning("Diario de historial: %d lineas invalidas ignoradas (%s)", invalidas, self.ruta)
+        return repro
+
+    def cargar(self, horas_ventana=48, dias_ventana_titulos=DIAS_VENTANA_TITULOS):
+        if not os.path.exists(self.ruta) and self.ruta_json and os.path.exists(self.ruta_json):
+            # Se migra todo lo retenido, no solo la ventana de esta lectura
+            log.info("Migrando historial de %s al diario (%s)", self.ruta_json, self.ruta)
+            self._compactar(*core.load_posted_deals(self.ruta_json, self.dias_retencion * 24, self.dias_retencion))
+
+        repro = self._reproducir()
+        ahora = datetime.now()
+        estado = _estado_en_ventana(
+            repro, ahora - timedelta(hours=horas_ventana), ahora - timedelta(days=dias_ventana_titulos)
+        )
+        deals = estado[0]
+
+        log.info("Historial cargado (diario): %d ASINs en ventana de %dh", len(deals), horas_ventana)
+        if repro.ultimas_categorias:
+            log.info("Ultimas categorias publicadas (anti-repeticion): %s", ", ".join(repro.ultimas_categorias))
+        return estado
+
+    def guardar(self, deals_dict, ultimas_categorias=None, ultimos_titulos=None, categorias_semanales=None):
+        """Añade al final del diario una linea por cada dato nuevo o cambiado."""
+        repro = self._reproducir()
+        eventos = _eventos_nuevos(repro, deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales)
+        if eventos:
+            # Una ultima linea a medias (proceso cortado al escribir) se cierra
+            # antes: si no, la primera linea nueva se pegaria a ella y se
+            # perderian las dos
+            cortada = not _termina_en_salto(self.ruta)
+            with open(self.ruta, 'a', encoding='utf-8') as f:
+                if cortada:
+                    f.write('\n')
+                f.writelines(_linea(evento) for evento in eventos)
+            for evento in eventos:
+                repro.aplicar(evento)
+            repro.lineas += len(eventos)
+
+        # Se compacta con la retencion fija del diario, nunca con la ventana de quien cargo
+        limite = datetime.now() - timedelta(days=self.dias_retencion)
+        retenido = _estado_en_ventana(repro, limite, limite)
+        deals, ultimas, titulos, semanales = retenido
+        vigentes = (len(deals) + len(deals.firmas_variantes) + len(titulos)
+                    + (1 if ultimas else 0) + len(semanales))
+        caducadas = repro.lineas - vigentes
+        if caducadas >= self.max_caducadas:
+            self._compactar(*retenido)
+            log.info("Diario de historial compactado: %d lineas caducadas eliminadas, %d vigentes",
+                     caducadas, vigentes)
+
+    def _compactar(self, deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales):
+        """Reescribe el diario con solo el estado dado (fichero temporal + rename: nunca queda a medias)."""
+        eventos = _eventos_nuevos(
+            _Reproduccion(), deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales
+        )
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.writelines(_linea(evento) for evento in eventos)
+        os.replace(temporal, self.ruta)
+
+
+BACKENDS = {
+    'json': EstadoJSON,
+    'sqlite': EstadoSQLite,
+    'diario': EstadoDiario,
+}
+
+
+def ruta_sqlite(filepath):
+    """Base SQLite que acompaña a un fichero de historial JSON (mismo nombre, .sqlite3)."""
+    return os.path.splitext(filepath)[0] + EXTENSION_SQLITE
+
+
+def ruta_diario(filepath):
+    """Diario que acompaña a un fichero de historial JSON (mismo nombre, .jsonl)."""
+    return os.path.splitext(filepath)[0] + EXTENSION_DIARIO
+
+
+def abrir_estado(filepath, backend=None):
+    """
+    Backend de historial para el fichero JSON `filepath` del canal.
+    backend: 'json', 'sqlite' o 'diario' (default BACKEND_ESTADO).
+    """
+    backend = backend or BACKEND_ESTADO
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de estado desconocido: '{backend}' (disponibles: {', '.join(BACKENDS)})")
+    if backend == 'sqlite':
+        return EstadoSQLite(ruta_sqlite(filepath), ruta_json=filepath)
+    if backend == 'diario':
+        return EstadoDiario(ruta_diario(filepath), ruta_json=filepath)
+    return BACKENDS[backend](filepath)
+
+
+def load_posted_deals(filepath, horas_ventana=48, dias_ventana_titulos=DIAS_VENTANA_TITULOS, backend=None):
+    """
+    core.load_posted_deals con el backend configurado. Retorna la misma tupla:
+    (dict_ofertas, ultimas_categorias, ultimos_titulos, categorias_semanales)
+    """
+    return abrir_estado(filepath, backend).cargar(horas_ventana, dias_ventana_titulos)
+
+
+def save_posted_deals(deals_dict, filepath, ultimas_categorias=None, ultimos_titulos=None,
+                      categorias_semanales=None, backend=None):
+    """core.save_posted_deals con el backend configurado."""
+    abrir_estado(filepath, backend).guardar(deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales)
+
+
+def _abrir_por_extension(ruta):
+    if ruta.endswith(EXTENSION_SQLITE):
+        return EstadoSQLite(ruta)
+    if ruta.endswith(EXTENSION_DIARIO):
+        return EstadoDiario(ruta)
+    return EstadoJSON(ruta)
+
+
+def migrar(origen, destino, horas_ventana=96, dias_ventana_titulos=DIAS_VENTANA_TITULOS):
+    """
+    Copia el historial vigente de un fichero a otro; el formato de cada uno
+    sale de su extensión (.sqlite3, .jsonl o JSON).
+    """
+    estado = _abrir_por_extension(origen).cargar(horas_ventana, dias_ventana_titulos)
+    _abrir_por_extension(destino).guardar(*estado)
+    return estado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Historial de ofertas publicadas: migracion entre formatos')
+    sub = parser.add_subparsers(dest='accion', required=True)
+
+    p_mig = sub.add_parser('migrar', help='Copia el historial vigente entre JSON, SQLite y diario')
+    p_mig.add_argument('origen', help='Fichero de origen (.json, .sqlite3 o .jsonl)')
+    p_mig.add_argument('destino', help='Fichero de destino (.json, .sqlite3 o .jsonl)')
+    p_mig.add_argument('--horas', type=int, default=96, help='Ventana de ASINs en horas (default 96)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if not os.path.exists(args.origen):
+        parser.error(f"No existe el fichero de origen: {args.origen}")
+    deals, _, titulos, _ = migrar(args.origen, args.destino, args.horas)
+    print(f"Migrados {len(deals)} ASINs y {len(titulos)} titulos a {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
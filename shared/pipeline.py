@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Ciclo de publicación de ofertas por etapas, común a todos los canales.
+
+    descargar -> parsear -> filtrar -> ordenar -> elegir -> agrupar -> seleccionar -> publicar
+
+Cada etapa es un generador que recibe el flujo de la anterior y pasa cada
+resultado a la siguiente en cuanto lo tiene: una categoría ya parseada se
+filtra mientras se descargan las siguientes. Las etapas que necesitan ver
+todas las categorías (ordenar: puntuación conjunta y ASINs repetidos;
+agrupar: variantes y mezcla de ganadores) consumen su entrada entera antes
+de emitir.
+
+Todas tienen la firma etapa(flujo, canal, estado) -> iterable, así que se
+pueden cronometrar (TiemposEtapas) y sustituir de una en una
+(ejecutar_ciclo(canal, etapas={'publicar': otra})). Cada canal es una
+ConfigCanal: sus parámetros y sus hooks (funciones de descarga, envío,
+estado y reglas propias).
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from shared.amazon_ofertas_core import (
+    BASE_URL,
+    PARTNER_TAG,
+    EtapaParseo,
+    MAX_RESERVA_POR_CATEGORIA,
+    actualizar_reserva,
+    candidatos_de_reserva,
+    registrar_titulo_publicado,
+    registrar_variante_publicada,
+    repartir_ofertas_por_categoria,
+    seleccionar_ofertas_ciclo,
+    variante_ya_publicada,
+)
+
+log = logging.getLogger(__name__)
+
+
+class ConfigCanal:
+    """
+    Parámetros y hooks de un canal para ejecutar_ciclo().
+
+    Obligatorios: nombre (para los logs), categorias, las funciones de
+    descarga/parseo/envío/estado y la prioridad de marca. Los hooks
+    opcionales (None = no hacen nada) son:
+        al_cargar_estado(estado): tras cargar el historial
+        saltar_categoria(categoria, estado) -> bool: antes de descargarla
+        ordenar_ganadores(entradas) -> entradas: antes de agrupar variantes
+        admitir(entrada, elegidas) -> bool: regla extra de seleccionar_ofertas_ciclo
+        al_publicar(entrada, estado): tras cada publicación con éxito
+    """
+
+    def __init__(self, nombre, categorias, token, chat_id, variables_credenciales,
+                 obtener_pagina, extraer, send_photo, send_message, format_mensaje,
+                 load_posted_deals, save_posted_deals, load_reserva, save_reserva,
+                 prioridad, titulo_similar, agrupar_variantes,
+                 fichero_historial, prefiltro=None, procesos_parseo=0, dev_mode=False,
+                 categorias_verificar_titulos=(), umbral_similitud=0.5,
+                 categorias_limite_semanal=(), categorias_excluidas_repeticion=(),
+                 ofertas_por_ciclo=1, pausa_entre_publicaciones=0,
+                 al_cargar_estado=None, saltar_categoria=None, ordenar_ganadores=None,
+                 admitir=None, al_publicar=None):
+        self.nombre = nombre
+        self.categorias = categorias
+        self.token = token
+        self.chat_id = chat_id
+        self.variables_credenciales = variables_credenciales
+        self.obtener_pagina = obtener_pagina
+        self.extraer = extraer
+        self.prefiltro = prefiltro
+        self.procesos_parseo = procesos_parseo
+        self.send_photo = send_photo
+        self.send_message = send_message
+        self.format_mensaje = format_mensaje
+        self.load_posted_deals = load_posted_deals
+        self.save_posted_deals = save_posted_deals
+        self.load_reserva = load_reserva
+        self.save_reserva = save_reserva
+        self.prioridad = prioridad
+        self.titulo_similar = titulo_similar
+        self.agrupar_variantes = agrupar_variantes
+        self.fichero_historial = fichero_historial
+        self.dev_mode = dev_mode
+        self.categorias_verificar_titulos = categorias_verificar_titulos
+        self.umbral_similitud = umbral_similitud
+        self.categorias_limite_semanal = categorias_limite_semanal
+        self.categorias_excluidas_repeticion = list(categorias_excluidas_repeticion)
+        self.ofertas_por_ciclo = ofertas_por_ciclo
+        self.pausa_entre_publicaciones = pausa_entre_publicaciones
+        self.al_cargar_estado = al_cargar_estado
+        self.saltar_categoria = saltar_categoria
+        self.ordenar_ganadores = ordenar_ganadores
+        self.admitir = admitir
+        self.al_publicar = al_publicar
+
+    def clave_orden(self, producto):
+        """Mayor descuento, luego marca prioritaria, luego valoraciones, luego ventas."""
+        return (producto['descuento'], self.prioridad(producto), producto['valoraciones'], producto['ventas'])
+
+    def clave_global(self, entrada):
+        return (entrada['producto']['descuento'], self.prioridad(entrada['producto']))
+
+
+class EstadoCiclo:
+    """Historial cargado al empezar el ciclo y lo que las etapas van anotando."""
+
+    def __init__(self, posted_deals, ultimas_categorias, ultimos_titulos, categorias_semanales, reserva):
+        self.posted_deals = posted_deals
+        self.posted_asins = set(posted_deals.keys())
+        self.ultimas_categorias = ultimas_categorias
+        self.ultimos_titulos = ultimos_titulos
+        self.categorias_semanales = categorias_semanales
+        self.reserva = reserva
+        self.ahora = datetime.now()
+        # Categorias sin pagina en este ciclo (se cubren con la reserva, que no se actualiza)
+        self.categorias_sin_pagina = []
+        self.extra = {}  # datos propios de los hooks del canal
+
+
+class TiemposEtapas:
+    """
+    Tiempo de cada etapa. Cada next() de una etapa incluye el de las
+    anteriores (tira de ellas), así que el tiempo propio es la diferencia
+    con la etapa previa de la cadena.
+    """
+
+    def __init__(self):
+        self.acumulado = {}
+
+    def medir(self, nombre, flujo):
+        """Envuelve el flujo de una etapa acumulando el tiempo de cada next()."""
+        self.acumulado[nombre] = 0.0  # registrada ya, en el orden de la cadena
+        return self._medido(nombre, iter(flujo))
+
+    def _medido(self, nombre, iterador):
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                self.acumulado[nombre] += time.perf_counter() - inicio
+                return
+            self.acumulado[nombre] += time.perf_counter() - inicio
+            yield elemento
+
+    def propios(self):
+        """dict etapa -> segundos propios, en el orden de la cadena."""
+        propios, previo = {}, 0.0
+        for nombre, acumulado in self.acumulado.items():
+            propios[nombre] = max(acumulado - previo, 0.0)
+            previo = acumulado
+        return propios
+
+    def registrar_en_log(self):
+        log.info("Tiempos por etapa: %s", " | ".join(
+            f"{nombre} {segundos:.2f}s" for nombre, segundos in self.propios().items()
+        ))
+
+
+# --- Etapas ---
+
+def descargar(flujo, canal, estado):
+    """(categoria, html o None) de cada categoría que no esté en pausa."""
+    una_semana = timedelta(days=7)
+    for categoria in canal.categorias:
+        log.info("")
+        log.info("--- Categoria: %s ---", categoria['nombre'])
+
+        if canal.saltar_categoria and canal.saltar_categoria(categoria, estado):
+            continue
+
+        # Verificar limite semanal para ciertas categorias
+        if categoria['nombre'] in canal.categorias_limite_semanal:
+            ultima_pub_str = estado.categorias_semanales.get(categoria['nombre'])
+            if ultima_pub_str:
+                try:
+                    ultima_pub = datetime.fromisoformat(ultima_pub_str)
+                    tiempo_transcurrido = estado.ahora - ultima_pub
+                    if tiempo_transcurrido < una_semana:
+                        dias_restantes = (una_semana - tiempo_transcurrido).days + 1
+                        log.info(
+                            "  SALTADA por limite semanal: ultima publicacion el %s (hace %d dias, faltan ~%d dias)",
+                            ultima_pub.strftime('%d/%m %H:%M'), tiempo_transcurrido.days, dias_restantes
+                        )
+                        continue
+                    else:
+                        log.debug(
+                            "  Limite semanal OK: ultima publicacion hace %d dias (supera los 7 requeridos)",
+                            tiempo_transcurrido.days
+                        )
+                except (ValueError, TypeError):
+                    pass
+
+        html_content = canal.obtener_pagina(BASE_URL + categoria['url'])
+        if not html_content:
+            log.warning("  No se pudo obtener la pagina, saltando categoria")
+        yield categoria, html_content
+
+
+def parsear(flujo, canal, estado):
+    """
+    (categoria, productos o None). Con procesos_parseo > 0 las páginas se
+    parsean en otros núcleos mientras se descargan las siguientes, y cada una
+    sale en cuanto está lista (en el orden de las categorías). El prefiltro
+    descarta sobre el HTML crudo las tarjetas sin precio tachado.
+    """
+    etapa = EtapaParseo(canal.procesos_parseo, extractor=canal.extraer, prefiltro=canal.prefiltro)
+    pendientes = deque()
+
+    def recoger():
+        categoria, futuro = pendientes.popleft()
+        if futuro is None:
+            return categoria, None
+        try:
+            return categoria, futuro.result()
+        except Exception as e:
+            log.error("  Error al parsear la pagina de %s: %s", categoria['nombre'], e)
+            return categoria, None
+
+    with etapa:
+        for categoria, html_content in flujo:
+            pendientes.append((categoria, etapa.enviar(html_content) if html_content else None))
+            # El HTML crudo no se necesita mas: no retenerlo hasta el final del ciclo
+            del html_content
+            while pendientes and (pendientes[0][1] is None or pendientes[0][1].done()):
+                yield recoger()
+        while pendientes:
+            yield recoger()
+    etapa.estadisticas.registrar_en_log()
+
+
+def filtrar(flujo, canal, estado):
+    """
+    (categoria, ofertas con descuento). Las categorías sin página
+    (bloqueo, timeout, error de parseo, o una página sin ninguna tarjeta de
+    resultado, como un captcha) salen al final con los candidatos recientes
+    de la reserva, que pasan los mismos filtros que los nuevos.
+    """
+    for categoria, productos in flujo:
+        if productos is None:
+            estado.categorias_sin_pagina.append(categoria)
+            continue
+        if not productos and not getattr(productos, 'tarjetas_descartadas', 0):
+            # Ni el prefiltro ni el parser vieron una tarjeta: captcha o pagina bloqueada
+            log.warning("  Pagina de '%s' sin resultados (captcha o bloqueo?)", categoria['nombre'])
+            estado.categorias_sin_pagina.append(categoria)
+            continue
+        log.info("")
+        log.info("--- Resultados: %s ---", categoria['nombre'])
+        ofertas = [p for p in productos if p['tiene_oferta']]
+        # Las tarjetas sin precio tachado se descartan casi todas en el
+        # prefiltro, antes de parsear: se suman a las que el parser dejo pasar
+        sin_descuento = getattr(productos, 'tarjetas_descartadas', 0) + len(productos) - len(ofertas)
+        log.info(
+            "  Scraped: %d productos (%d con oferta, %d sin descuento)",
+            len(ofertas) + sin_descuento, len(ofertas), sin_descuento
+        )
+        if not ofertas:
+            log.info("  No hay productos con descuento en esta categoria")
+            continue
+        yield categoria, ofertas
+
+    for categoria in estado.categorias_sin_pagina:
+        candidatos = candidatos_de_reserva(estado.reserva, categoria['nombre'])
+        if candidatos:
+            log.info(
+                "Reserva: '%s' sin pagina en este ciclo, se usan %d candidatos del ultimo scrapeo",
+                categoria['nombre'], len(candidatos)
+            )
+            yield categoria, candidatos
+
+
+def ordenar(flujo, canal, estado):
+    """
+    (categoria, ofertas_ordenadas). Primero por mayor descuento, luego marca
+    prioritaria, luego valoraciones, luego ventas; un ASIN que sale en varias
+    búsquedas solo compite en la categoría donde queda mejor.
+    """
+    yield from repartir_ofertas_por_categoria(list(flujo), canal.clave_orden)
+
+
+def elegir(flujo, canal, estado):
+    """
+    {'producto', 'categoria'} con la mejor oferta válida de cada categoría:
+    el primer candidato que no está publicado, no es variante de lo publicado
+    ni tiene un título similar.
+    """
+    prioridad = canal.prioridad
+    for categoria, ofertas_ordenadas in flujo:
+        log.info("")
+        log.info("--- Seleccion: %s ---", categoria['nombre'])
+        if categoria not in estado.categorias_sin_pagina:
+            actualizar_reserva(
+                estado.reserva, categoria['nombre'], ofertas_ordenadas[:MAX_RESERVA_POR_CATEGORIA],
+                clave_orden=canal.clave_orden
+            )
+        if not ofertas_ordenadas:
+            log.info("  Todas sus ofertas compiten en otra categoria (ASINs repetidos)")
+            continue
+
+        log.debug("  Top candidatos antes de filtros anti-duplicacion:")
+        for i, p in enumerate(ofertas_ordenadas[:5], 1):
+            marca_flag = f" [MARCA PRIO: {p['marca']}]" if prioridad(p) else ""
+            log.debug(
+                "    %d. [%s] %s | %.0f%% dto | %d vals | %d ventas%s",
+                i, p['asin'], p['titulo'][:50], p['descuento'],
+                p['valoraciones'], p['ventas'], marca_flag
+            )
+
+        for producto in ofertas_ordenadas:
+            asin = producto['asin']
+            titulo_corto = producto['titulo'][:45]
+
+            if asin in estado.posted_asins:
+                log.info(
+                    "  DESCARTADO [ya publicado en <48h] %s... (%.0f%% dto, ASIN: %s)",
+                    titulo_corto, producto['descuento'], asin
+                )
+                continue
+
+            if variante_ya_publicada(estado.posted_deals, producto['titulo']):
+                log.info(
+                    "  DESCARTADO [variante de un producto ya publicado] %s... (%.0f%% dto, ASIN: %s)",
+                    titulo_corto, producto['descuento'], asin
+                )
+                continue
+
+            if (categoria['nombre'] in canal.categorias_verificar_titulos
+                    and canal.titulo_similar(producto['titulo'], estado.ultimos_titulos, canal.umbral_similitud)):
+                log.info(
+                    "  DESCARTADO [titulo similar a reciente] %s... (%.0f%% dto)",
+                    titulo_corto, producto['descuento']
+                )
+                continue
+
+            marca_flag = f" [marca prioritaria: {producto['marca']}]" if prioridad(producto) else ""
+            log.info(
+                "  ELEGIDO para categoria: %s... (%.0f%% dto, %d valoraciones, ASIN: %s)%s",
+                titulo_corto, producto['descuento'], producto['valoraciones'], asin, marca_flag
+            )
+            yield {'producto': producto, 'categoria': categoria}
+            break
+        else:
+            log.info("  Sin candidatos validos: todos descartados por duplicacion o similitud de titulo")
+
+    # La reserva se guarda ya: aunque este ciclo no publique, el siguiente puede usarla
+    if not canal.dev_mode:
+        canal.save_reserva(estado.reserva)
+
+
+def agrupar(flujo, canal, estado):
+    """
+    Ganadores de cada categoría con las variantes del mismo producto
+    agrupadas, ordenados por la clave global.
+    """
+    mejores = list(flujo)
+    if canal.ordenar_ganadores:
+        mejores = canal.ordenar_ganadores(mejores)
+    mejores = canal.agrupar_variantes(mejores)
+    yield from sorted(mejores, key=canal.clave_global, reverse=True)
+
+
+def seleccionar(flujo, canal, estado):
+    """
+    Hasta ofertas_por_ciclo entradas, evitando repetir las categorías de las
+    últimas publicaciones y con diversidad dentro del ciclo.
+    """
+    mejores = list(flujo)
+    if not mejores:
+        log.info("")
+        log.info("=" * 60)
+        log.info("RESULTADO: No hay ofertas nuevas para publicar en este ciclo")
+        log.info("=" * 60)
+        return
+
+    ultimas_categorias = estado.ultimas_categorias
+    log.info("")
+    log.info("--- Seleccion global (ranking de mejores por categoria) ---")
+    for i, entrada in enumerate(mejores, 1):
+        p = entrada['producto']
+        cat = entrada['categoria']['nombre']
+        tipo_cat = f" ({entrada['categoria']['tipo']})" if 'tipo' in entrada['categoria'] else ""
+        marca_flag = f" [marca prio: {p['marca']}]" if canal.prioridad(p) else ""
+        en_ultimas = " [cat. reciente]" if cat in ultimas_categorias else ""
+        log.info(
+            "  %d. [%s] %s... | %.0f%% dto | cat: %s%s%s%s",
+            i, p['asin'], p['titulo'][:40], p['descuento'], cat, tipo_cat, marca_flag, en_ultimas
+        )
+
+    excluidas = canal.categorias_excluidas_repeticion
+    elegidas = seleccionar_ofertas_ciclo(
+        mejores, canal.ofertas_por_ciclo, ultimas_categorias, excluidas, canal.admitir
+    )
+    if not elegidas:
+        log.info("")
+        log.info("=" * 60)
+        log.info("RESULTADO: Ninguna candidata cumple las restricciones del canal en este ciclo")
+        log.info("=" * 60)
+        return
+
+    primera_elegida = elegidas[0]['categoria']['nombre']
+    if primera_elegida in ultimas_categorias and primera_elegida not in excluidas:
+        log.info(
+            "Todas las categorias candidatas estan en el historial reciente [%s], "
+            "publicando la mejor disponible igualmente",
+            ", ".join(ultimas_categorias)
+        )
+    elif elegidas[0] != mejores[0]:
+        log.info(
+            "Anti-repeticion: la #1 global (%s) fue descartada porque su categoria '%s' "
+            "aparece en las recientes [%s]. Se elige la siguiente valida.",
+            mejores[0]['producto']['titulo'][:35],
+            mejores[0]['categoria']['nombre'],
+            ", ".join(ultimas_categorias)
+        )
+    yield from elegidas
+
+
+def publicar(flujo, canal, estado):
+    """
+    Envía cada entrada elegida y emite las que se publicaron. Al terminar
+    guarda el historial (salvo en modo dev). Sin entradas no hace nada (el
+    ciclo ya terminó con "No hay ofertas nuevas").
+    """
+    elegidas = list(flujo)
+    if not elegidas:
+        return
+
+    publicadas = 0
+    for n_elegida, entrada in enumerate(elegidas):
+        producto = entrada['producto']
+        categoria = entrada['categoria']
+
+        if n_elegida:
+            time.sleep(canal.pausa_entre_publicaciones)
+
+        log.info("")
+        log.info(">>> OFERTA SELECCIONADA PARA PUBLICAR (%d/%d):", n_elegida + 1, len(elegidas))
+        log.info("    Titulo:    %s", producto['titulo'])
+        log.info("    Categoria: %s | Descuento: %.0f%%", categoria['nombre'], producto['descuento'])
+        log.info("    Precio:    %s (antes: %s)", producto['precio'], producto.get('precio_anterior', 'N/A'))
+        log.info("    ASIN:      %s | Valoraciones: %d | Ventas: %d",
+                 producto['asin'], producto['valoraciones'], producto['ventas'])
+        log.info("    URL:       %s", producto['url'])
+
+        mensaje = canal.format_mensaje(producto, categoria)
+
+        # Enviar a Telegram (con foto si disponible)
+        if producto['imagen']:
+            log.debug("    Enviando con foto: %s", producto['imagen'])
+            exito = canal.send_photo(producto['imagen'], mensaje)
+        else:
+            log.debug("    Enviando sin foto (no disponible)")
+            exito = canal.send_message(mensaje)
+
+        if not exito:
+            log.error("Fallo al enviar a Telegram, no se guarda el ASIN en el historial")
+            continue
+
+        registrar_publicacion(entrada, canal, estado)
+        publicadas += 1
+        yield entrada
+
+    # En DEV_MODE no se escribe para no contaminar el historial de produccion
+    if canal.dev_mode:
+        log.info("DEV_MODE: historial no guardado (%s sin cambios)", canal.fichero_historial)
+    else:
+        canal.save_posted_deals(
+            estado.posted_deals, estado.ultimas_categorias, estado.ultimos_titulos, estado.categorias_semanales
+        )
+
+    log.info("")
+    log.info("=" * 60)
+    log.info("FIN - %s oferta(s) publicada(s) en Telegram", publicadas)
+    log.info("=" * 60)
+
+
+def registrar_publicacion(entrada, canal, estado):
+    """Anota en el historial del ciclo una oferta publicada (ASINs, firma, categoria, titulo, limites)."""
+    producto = entrada['producto']
+    categoria = entrada['categoria']
+    fecha = datetime.now().isoformat()
+
+    estado.posted_deals[producto['asin']] = fecha
+    # Guardar también ASINs de variantes agrupadas para evitar republicarlas
+    for variante in producto.get('variantes_adicionales', []):
+        estado.posted_deals[variante['asin']] = fecha
+    # Y su firma de variante, para descartar otros colores/plataformas del mismo producto
+    estado.posted_deals = registrar_variante_publicada(estado.posted_deals, producto['titulo'])
+    # Añadir categoria al inicio de la lista y mantener solo las ultimas 4
+    estado.ultimas_categorias = [categoria['nombre']] + estado.ultimas_categorias[:3]
+    log.debug("Historial de categorias actualizado: %s", ", ".join(estado.ultimas_categorias))
+
+    # Si es categoria con verificacion de titulos, guardar el titulo
+    if categoria['nombre'] in canal.categorias_verificar_titulos:
+        # Se conservan todos los de la ventana (DIAS_VENTANA_TITULOS), indexados por LSH
+        estado.ultimos_titulos = registrar_titulo_publicado(estado.ultimos_titulos, producto['titulo'])
+        log.debug("Titulo guardado en anti-similitud (total: %d)", len(estado.ultimos_titulos))
+
+    # Si es categoria con limite semanal, guardar el timestamp
+    if categoria['nombre'] in canal.categorias_limite_semanal:
+        estado.categorias_semanales[categoria['nombre']] = fecha
+        log.debug("Timestamp de limite semanal actualizado para categoria '%s'", categoria['nombre'])
+
+    if canal.al_publicar:
+        canal.al_publicar(entrada, estado)
+
+
+ETAPAS = {
+    'descargar': descargar,
+    'parsear': parsear,
+    'filtrar': filtrar,
+    'ordenar': ordenar,
+    'elegir': elegir,
+    'agrupar': agrupar,
+    'seleccionar': seleccionar,
+    'publicar': publicar,
+}
+
+
+def cargar_estado(canal):
+    """Historial del canal (vacío en modo dev para no contaminar el JSON de producción)."""
+    if canal.dev_mode:
+        log.info(
+            "DEV_MODE: historial de publicaciones ignorado (%s no se leerá ni escribirá)",
+            canal.fichero_historial
+        )
+        estado = EstadoCiclo({}, [], [], {}, {})
+    else:
+        estado = EstadoCiclo(*canal.load_posted_deals(), canal.load_reserva())
+
+    if estado.ultimas_categorias:
+        log.info(
+            "Anti-repeticion de categoria: se evitaran las ultimas %d categorias [%s]",
+            len(estado.ultimas_categorias), ", ".join(estado.ultimas_categorias)
+        )
+    if estado.ultimos_titulos:
+        log.info(
+            "Anti-titulo-similar activo para categorias %s (%d titulos recientes guardados)",
+            ", ".join(canal.categorias_verificar_titulos), len(estado.ultimos_titulos)
+        )
+    if canal.al_cargar_estado:
+        canal.al_cargar_estado(estado)
+    return estado
+
+
+def ejecutar_ciclo(canal, etapas=None):
+    """
+    Un ciclo completo del canal: carga el historial, encadena las etapas y
+    retorna el número de ofertas publicadas. etapas: dict nombre -> función
+    para sustituir alguna de ETAPAS.
+    """
+    if not canal.token or not canal.chat_id:
+        variable_token, variable_chat = canal.variables_credenciales
+        if canal.dev_mode:
+            log.error(
+                "DEV_MODE activo pero credenciales dev no configuradas. "
+                "Establece DEV_%s y DEV_%s.", variable_token, variable_chat
+            )
+        else:
+            log.error(
+                "Credenciales de Telegram no configuradas. "
+                "Establece las variables de entorno %s y %s.", variable_token, variable_chat
+            )
+        return 0
+
+    log.info("=" * 60)
+    if canal.dev_mode:
+        log.info("INICIO [DEV MODE] - %s | Amazon.es -> Telegram (canal de pruebas)", canal.nombre)
+    else:
+        log.info("INICIO - %s | Amazon.es -> Telegram", canal.nombre)
+    log.info("Tag de afiliado: %s | Hora: %s", PARTNER_TAG, datetime.now().strftime('%d/%m/%Y %H:%M'))
+    log.info("=" * 60)
+
+    desconocidas = set(etapas or {}) - set(ETAPAS)
+    if desconocidas:
+        raise ValueError(f"Etapas desconocidas: {', '.join(sorted(desconocidas))}")
+    etapas = {**ETAPAS, **(etapas or {})}
+    estado = cargar_estado(canal)
+    tiempos = TiemposEtapas()
+    flujo = None
+    for nombre, etapa in etapas.items():
+        flujo = tiempos.medir(nombre, etapa(flujo, canal, estado))
+    ofertas_publicadas = sum(1 for _ in flujo)
+    tiempos.registrar_en_log()
+    return ofertas_publicadas
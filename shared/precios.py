@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Parseo de precios de Amazon.es (formato es-ES) a céntimos enteros.
+
+Formatos soportados:
+    '19,99€', '19,99 €', '€19,99', '1.299,99 €', '1.299 €', '19.99'
+    espacios duros (NBSP / NNBSP) entre cifra y símbolo o como separador de millares
+    rangos '12,99 € - 19,99 €' (se toma el extremo inferior)
+
+El resultado se memoiza: los mismos textos de precio se repiten entre items,
+categorías y ciclos del modo continuo.
+"""
+
+import re
+from functools import lru_cache
+
+# Cifras con separadores opcionales ('1.299,99', '19,99', '1299')
+_REGEX_NUMERO = re.compile(r'\d[\d.,]*')
+
+# Espacio usado como separador de millares ('1 299,99')
+_REGEX_MILLARES_ESPACIO = re.compile(r'(?<=\d) (?=\d{3}(?!\d))')
+
+# Separadores de rango: guion, en-dash, em-dash y 'a' (ej: '10 € a 20 €')
+_REGEX_RANGO = re.compile(r'\s*(?:-|–|—|\ba\b)\s*')
+
+
+def _numero_a_centimos(numero):
+    """
+    Convierte una cifra es-ES ('1.299,99') a céntimos. Retorna None si no es válida.
+
+    - Con '.' y ',' a la vez, el último que aparece es el separador decimal.
+    - Solo ',': separador decimal (convención es-ES).
+    - Solo '.': millares si va seguido de exactamente 3 cifras o aparece varias
+      veces ('1.299', '1.299.000'); si no, decimal ('19.99').
+    """
+    numero = numero.strip('.,')
+    if not numero:
+        return None
+
+    if ',' in numero and '.' in numero:
+        if numero.rfind(',') > numero.rfind('.'):
+            entero, _, decimales = numero.replace('.', '').rpartition(',')
+        else:
+            entero, _, decimales = numero.replace(',', '').rpartition('.')
+    elif ',' in numero:
+        if numero.count(',') > 1:
+            return None
+        entero, _, decimales = numero.partition(',')
+    elif '.' in numero:
+        partes = numero.split('.')
+        if len(partes) > 2 or len(partes[1]) == 3:
+            entero, decimales = ''.join(partes), ''
+        else:
+            entero, decimales = partes
+    else:
+        entero, decimales = numero, ''
+
+    if not entero.isdigit() or (decimales and not decimales.isdigit()):
+        return None
+    # Redondear a céntimos (ej: '1,999' -> 200)
+    decimales = (decimales + '000')[:3]
+    centimos = int(entero) * 100 + int(decimales[:2])
+    if decimales[2] >= '5':
+        centimos += 1
+    return centimos
+
+
+@lru_cache(maxsize=2048)
+def rango_precio_centimos(texto):
+    """
+    Parsea un precio o rango de precios a céntimos.
+
+    Retorna tupla (minimo, maximo) en céntimos, o None si no hay precio válido.
+    Para un precio simple, minimo == maximo.
+    """
+    if not texto or not isinstance(texto, str):
+        return None
+
+    limpio = (
+        texto.replace('\xa0', ' ')
+        .replace('\u202f', ' ')
+        .replace('€', ' ')
+        .replace('EUR', ' ')
+        .strip()
+    )
+    limpio = _REGEX_MILLARES_ESPACIO.sub('', limpio)
+    valores = []
+    for parte in _REGEX_RANGO.split(limpio):
+        match = _REGEX_NUMERO.search(parte)
+        if not match:
+            continue
+        centimos = _numero_a_centimos(match.group())
+        if centimos is not None:
+            valores.append(centimos)
+
+    if not valores:
+        return None
+    return min(valores), max(valores)
+
+
+def precio_a_centimos(texto):
+    """
+    Convierte un texto de precio ('1.299,99 €', '19,99€', '12,99 € - 19,99 €')
+    a céntimos enteros. En rangos se usa el extremo inferior.
+
+    Retorna None si el texto no contiene un precio válido (ej: 'N/A').
+    """
+    rango = rango_precio_centimos(texto)
+    return rango[0] if rango else None
+
+
+def calcular_descuento(precio_cent, precio_anterior_cent):
+    """Porcentaje de descuento a partir de precios en céntimos (0 si no aplica)."""
+    if precio_cent is None or not precio_anterior_cent:
+        return 0
+    return ((precio_anterior_cent - precio_cent) / precio_anterior_cent) * 100
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Registro compacto de producto para el pipeline de ofertas.
+
+Producto usa __slots__ y guarda, calculados una sola vez al construirlo, los
+precios en céntimos, el descuento y las palabras clave normalizadas del título.
+Se comporta como un dict (p['precio'], p.get(...), .copy(), 'x' in p) para que
+el código y los tests que trabajan con dicts sigan funcionando sin cambios.
+"""
+
+from collections.abc import MutableMapping
+
+from shared.precios import precio_a_centimos, calcular_descuento
+
+
+# Claves con slot propio; cualquier otra va al dict de claves extra
+_CAMPOS = (
+    'asin', 'titulo', 'precio', 'precio_anterior', 'descuento',
+    'valoraciones', 'ventas', 'imagen', 'url', 'tiene_oferta',
+    'es_prereserva', 'variantes_adicionales',
+    'precio_cent', 'precio_anterior_cent', 'tokens_titulo',
+    'marca', 'prioridad_marca',
+)
+_CLAVES = frozenset(_CAMPOS)
+
+
+class Producto(MutableMapping):
+    """
+    Producto extraído de una página de búsqueda.
+
+    Claves de datos: asin, titulo, precio, precio_anterior, descuento,
+    valoraciones, ventas, imagen, url, tiene_oferta, es_prereserva y
+    (opcional) variantes_adicionales.
+    Claves derivadas: precio_cent, precio_anterior_cent, tokens_titulo
+    (frozenset de palabras clave, lo calcula el core al extraer; None si el
+    título cambió después) y marca / prioridad_marca (las anota el canal la
+    primera vez que ordena el producto).
+    Cualquier otra clave se admite como en un dict y se guarda aparte.
+
+    Una clave sin asignar se comporta como ausente (p.get('x', d) -> d).
+    No es un dict: para serializarlo a JSON hay que convertirlo antes
+    (json.dumps(dict(producto))).
+    """
+
+    __slots__ = _CAMPOS + ('_extra',)
+
+    def __init__(self, asin, titulo, precio="N/A", precio_anterior=None,
+                 valoraciones=0, ventas=0, imagen="", url="", es_prereserva=False,
+                 descuento=None, tokens_titulo=None):
+        self._extra = None
+        self.asin = asin
+        self.titulo = titulo
+        self.precio = precio
+        self.precio_anterior = precio_anterior
+        self.valoraciones = valoraciones
+        self.ventas = ventas
+        self.imagen = imagen
+        self.url = url
+        self.es_prereserva = es_prereserva
+        self.tiene_oferta = precio_anterior is not None
+        self.precio_cent = precio_a_centimos(precio)
+        self.precio_anterior_cent = precio_a_centimos(precio_anterior)
+        self.tokens_titulo = tokens_titulo
+        if descuento is None:
+            descuento = calcular_descuento(self.precio_cent, self.precio_anterior_cent)
+        self.descuento = descuento
+
+    # --- Interfaz de dict ---
+
+    def __getitem__(self, clave):
+        if clave in _CLAVES:
+            try:
+                return getattr(self, clave)
+            except AttributeError:
+                raise KeyError(clave) from None
+        if self._extra is None:
+            raise KeyError(clave)
+        return self._extra[clave]
+
+    def __setitem__(self, clave, valor):
+        if clave not in _CLAVES:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[clave] = valor
+            return
+        setattr(self, clave, valor)
+        # Mantener coherentes los datos derivados
+        if clave == 'titulo':
+            self.tokens_titulo = None  # se recalcula bajo demanda en el core
+            for derivada in ('marca', 'prioridad_marca'):
+                if hasattr(self, derivada):
+                    delattr(self, derivada)
+        elif clave == 'precio':
+            self.precio_cent = precio_a_centimos(valor)
+        elif clave == 'precio_anterior':
+            self.precio_anterior_cent = precio_a_centimos(valor)
+
+    def __delitem__(self, clave):
+        if clave not in self:
+            raise KeyError(clave)
+        if clave in _CLAVES:
+            delattr(self, clave)
+        else:
+            del self._extra[clave]
+
+    def __contains__(self, clave):
+        if clave in _CLAVES:
+            return hasattr(self, clave)
+        return self._extra is not None and clave in self._extra
+
+    def __iter__(self):
+        for clave in _CAMPOS:
+            if hasattr(self, clave):
+                yield clave
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Producto({dict(self)!r})"
+
+    def copy(self):
+        """Copia superficial (como dict.copy): las listas se comparten."""
+        nuevo = Producto.__new__(Producto)
+        for clave in _CAMPOS:
+            if hasattr(self, clave):
+                setattr(nuevo, clave, getattr(self, clave))
+        nuevo._extra = dict(self._extra) if self._extra else None
+        return nuevo
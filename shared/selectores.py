@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Selectores CSS de las tarjetas de resultado de Amazon, declarados como
+cadenas de alternativas por campo, y estadísticas de qué selector acierta.
+
+Con las estadísticas se ve qué alternativas no coinciden nunca (se pueden
+reordenar o podar) y un cambio de maqueta de Amazon aparece en el log como
+aviso en lugar de como una ejecución silenciosa con 0 productos.
+"""
+
+import logging
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+# Cadenas de selectores por campo, en orden de preferencia: se usa el primero que coincide
+SELECTORES_CAMPO = {
+    'titulo': ('h2 a span', 'h2 span'),
+    'precio': ('.a-price .a-offscreen',),
+    'precio_anterior': ('.a-price[data-a-strike="true"] .a-offscreen',),
+    'valoraciones': ('.a-size-base.s-underline-text', '[aria-label*="estrellas"] + span'),
+    'ventas': ('.a-size-base.a-color-secondary',),
+    'imagen': ('img.s-image',),
+}
+
+# Campos opcionales: es normal que no coincidan (ej: sin precio tachado no hay oferta)
+CAMPOS_OPCIONALES = {'precio_anterior', 'ventas', 'valoraciones'}
+
+
+class EstadisticasSelectores:
+    """
+    Contadores de la extracción: intentos y aciertos por (campo, selector),
+    campos sin ningún selector coincidente, items procesados y con error.
+    """
+
+    def __init__(self):
+        self.intentos = Counter()
+        self.aciertos = Counter()
+        self.sin_match = Counter()
+        self.errores = Counter()
+        self.items = 0
+        self.items_con_error = 0
+
+    def seleccionar(self, item, campo):
+        """Prueba la cadena de selectores del campo y retorna el primer elemento que coincide (o None)."""
+        for selector in SELECTORES_CAMPO[campo]:
+            self.intentos[(campo, selector)] += 1
+            elem = item.select_one(selector)
+            if elem is not None:
+                self.aciertos[(campo, selector)] += 1
+                return elem
+        self.sin_match[campo] += 1
+        return None
+
+    def registrar_error(self, error):
+        self.items_con_error += 1
+        self.errores[type(error).__name__] += 1
+
+    def fusionar(self, otra):
+        """Suma los contadores de otra instancia (ej: de otra página o de un proceso del pool)."""
+        self.intentos.update(otra.intentos)
+        self.aciertos.update(otra.aciertos)
+        self.sin_match.update(otra.sin_match)
+        self.errores.update(otra.errores)
+        self.items += otra.items
+        self.items_con_error += otra.items_con_error
+
+    def fallos(self, campo, selector):
+        """Veces que el selector se probó y no coincidió (se pasó al siguiente de la cadena)."""
+        return self.intentos[(campo, selector)] - self.aciertos[(campo, selector)]
+
+    def campos_sin_match(self):
+        """Campos obligatorios en los que ningún selector coincidió en ningún item."""
+        if not self.items:
+            return []
+        return [
+            campo for campo in SELECTORES_CAMPO
+            if campo not in CAMPOS_OPCIONALES and self.sin_match[campo] >= self.items
+        ]
+
+    def registrar_en_log(self):
+        """Vuelca el resumen al log: tasa de acierto por selector y avisos de maqueta."""
+        if not self.items:
+            return
+        log.debug(
+            "Estadisticas de selectores: %d items (%d con error%s)",
+            self.items, self.items_con_error,
+            ": " + ", ".join(f"{k} x{v}" for k, v in self.errores.most_common()) if self.errores else ""
+        )
+        for campo, selectores in SELECTORES_CAMPO.items():
+            for selector in selectores:
+                intentos = self.intentos[(campo, selector)]
+                if not intentos:
+                    continue
+                log.debug(
+                    "  %-16s %-48s %d/%d aciertos",
+                    campo, selector, self.aciertos[(campo, selector)], intentos
+                )
+                if not self.aciertos[(campo, selector)] and campo not in CAMPOS_OPCIONALES:
+                    log.info("  Selector sin aciertos (candidato a reordenar o podar): %s -> '%s'", campo, selector)
+
+        for campo in self.campos_sin_match():
+            log.warning(
+                "Ningun selector de '%s' coincidio en %d items: posible cambio de maqueta en Amazon",
+                campo, self.items
+            )
+        if self.items_con_error:
+            log.warning("%d de %d items fallaron al extraerse", self.items_con_error, self.items)
+
+
+class ListaProductos(list):
+    """
+    Lista de productos de una página con las estadísticas de su extracción y
+    el número de tarjetas que el prefiltro descartó antes de parsear.
+    """
+
+    def __init__(self, productos=(), estadisticas=None, tarjetas_descartadas=0):
+        super().__init__(productos)
+        self.estadisticas = estadisticas if estadisticas is not None else EstadisticasSelectores()
+        self.tarjetas_descartadas = tarjetas_descartadas
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Similitud entre conjuntos de palabras clave de títulos: índice MinHash + LSH.
+
+Sirve para preguntar "¿se parece este título a alguno de los miles publicados
+en las últimas semanas?" sin comparar contra todos: cada título se resume en
+una firma MinHash, la firma se parte en bandas y solo los títulos que
+coinciden en alguna banda son candidatos. Los candidatos se verifican después
+con el Jaccard exacto, así que el índice nunca da falsos positivos; a cambio
+puede perder algún similar justo en el umbral (ver BANDAS/FILAS_POR_BANDA).
+"""
+
+import random
+import zlib
+from functools import lru_cache
+
+# 32 bandas de 2 filas: un par con Jaccard 0.5 es candidato con probabilidad
+# 1 - (1 - 0.5**2)**32 ≈ 0.9999; con Jaccard 0.1, ≈ 0.28 (se descarta al verificar)
+BANDAS = 32
+FILAS_POR_BANDA = 2
+NUM_PERMUTACIONES = BANDAS * FILAS_POR_BANDA
+
+_PRIMO = (1 << 61) - 1
+_MASCARA = (1 << 32) - 1
+
+# Permutaciones fijas (semilla constante): las firmas son reproducibles entre ejecuciones
+_rnd = random.Random(0x5EED)
+_PERMUTACIONES = tuple(
+    (_rnd.randrange(1, _PRIMO), _rnd.randrange(0, _PRIMO)) for _ in range(NUM_PERMUTACIONES)
+)
+del _rnd
+
+
+@lru_cache(maxsize=8192)
+def _hashes_palabra(palabra):
+    """Valor de cada permutación para una palabra (estable entre procesos, a diferencia de hash())."""
+    x = zlib.crc32(palabra.encode('utf-8'))
+    return tuple(((a * x + b) % _PRIMO) & _MASCARA for a, b in _PERMUTACIONES)
+
+
+def firma_minhash(palabras):
+    """Firma MinHash (tupla de NUM_PERMUTACIONES enteros) de un conjunto no vacío de palabras."""
+    return tuple(map(min, zip(*(_hashes_palabra(p) for p in palabras))))
+
+
+def claves_bandas(firma):
+    """Claves de cubeta de una firma: (indice_banda, filas de la banda)."""
+    return [
+        (b, firma[b * FILAS_POR_BANDA:(b + 1) * FILAS_POR_BANDA])
+        for b in range(BANDAS)
+    ]
+
+
+def jaccard(palabras1, palabras2):
+    """Jaccard exacto entre dos conjuntos de palabras (0 si alguno está vacío)."""
+    if not palabras1 or not palabras2:
+        return 0.0
+    return len(palabras1 & palabras2) / len(palabras1 | palabras2)
+
+
+class IndiceLSH:
+    """
+    Índice LSH de conjuntos de palabras, con clave arbitraria (hashable) por entrada.
+
+    buscar() retorna las claves cuyo Jaccard exacto con la consulta alcanza el
+    umbral, mirando solo las entradas que comparten alguna banda.
+    """
+
+    def __init__(self):
+        self._palabras = {}
+        self._cubetas = {}
+
+    def __len__(self):
+        return len(self._palabras)
+
+    def __contains__(self, clave):
+        return clave in self._palabras
+
+    def agregar(self, clave, palabras):
+        """Añade (o ignora si ya existe) una entrada. Los conjuntos vacíos no se indexan."""
+        if not palabras or clave in self._palabras:
+            return
+        self._palabras[clave] = palabras
+        for cubeta in claves_bandas(firma_minhash(palabras)):
+            self._cubetas.setdefault(cubeta, []).append(clave)
+
+    def candidatos(self, palabras):
+        """Claves que comparten al menos una banda con la consulta (sin verificar)."""
+        if not palabras:
+            return set()
+        encontrados = set()
+        for cubeta in claves_bandas(firma_minhash(palabras)):
+            encontrados.update(self._cubetas.get(cubeta, ()))
+        return encontrados
+
+    def buscar(self, palabras, umbral=0.5):
+        """Claves con Jaccard exacto >= umbral respecto a la consulta."""
+        return [
+            clave for clave in self.candidatos(palabras)
+            if jaccard(palabras, self._palabras[clave]) >= umbral
+        ]
+
+    def hay_similar(self, palabras, umbral=0.5):
+        """True si alguna entrada indexada tiene Jaccard exacto >= umbral."""
+        return any(
+            jaccard(palabras, self._palabras[clave]) >= umbral
+            for clave in self.candidatos(palabras)
+        )
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Simulador offline de la selección de ofertas sobre páginas capturadas.
+
+Reproduce ciclos de buscar_y_publicar_ofertas (y buscar_prereservas_ps en PS)
+con las páginas de búsqueda grabadas en disco: sin red, sin Telegram y sin
+esperas. La hora es virtual (datetime.now() devuelve la del ciclo simulado y
+time.sleep() la adelanta) y el estado (historial, reserva de candidatos) vive
+en memoria, así que semanas de ciclos horarios se simulan en segundos y los
+ficheros reales del canal no se tocan.
+
+Uso:
+    python -m shared.simulador capturar ps capturas/
+    python -m shared.simulador simular ps capturas/ [--ciclos 336] [--cada 60]
+        [--inicio 2026-10-01T00:00] [--config LIMITE_ACCESORIOS_DIAS=5] [-v]
+
+Formato de las capturas: un subdirectorio por ejecución grabada (se usan en
+orden de nombre) con una página por categoría, <nombre de categoría>.html
+(ej. capturas/20261001-0900/juegos_ps5.html). Una categoría sin fichero
+cuenta como página que no se pudo descargar. Si hay más ciclos que capturas
+se vuelve a empezar por la primera.
+"""
+
+import argparse
+import ast
+import importlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+import types
+import unicodedata
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+
+# Permitir `python shared/simulador.py` además de `python -m shared.simulador`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import amazon_ofertas_core as core
+from shared import pipeline
+from shared.selectores import ListaProductos
+
+
+CANALES = ('bebe', 'ps')
+
+# Funciones de un ciclo del canal, en el orden en que las llama main()
+_FUNCIONES_CICLO = ('buscar_y_publicar_ofertas', 'buscar_prereservas_ps')
+
+log = logging.getLogger(__name__)
+
+
+def importar_canal(canal):
+    """Módulo del canal sin configurar su log a fichero (la simulación no debe escribir en él)."""
+    with _parcheado(core, setup_logging=lambda log_file: None):
+        return importlib.import_module(f'{canal}.amazon_{canal}_ofertas')
+
+
+def nombre_captura(nombre_categoria):
+    """Nombre del fichero de una categoría en una captura: 'Próximos PS5' -> 'proximos_ps5.html'."""
+    ascii_ = unicodedata.normalize('NFKD', nombre_categoria).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '_', ascii_.lower()).strip('_') + '.html'
+
+
+def categorias_del_canal(modulo):
+    """Todas las categorías con URL del canal (CATEGORIAS_*: ofertas, preórdenes...)."""
+    categorias = []
+    for nombre, valor in vars(modulo).items():
+        if nombre.startswith('CATEGORIAS_') and isinstance(valor, list):
+            categorias.extend(c for c in valor if isinstance(c, dict) and 'url' in c)
+    return categorias
+
+
+def listar_capturas(directorio):
+    """Subdirectorios de captura, en orden de nombre."""
+    capturas = sorted(
+        os.path.join(directorio, nombre) for nombre in os.listdir(directorio)
+        if os.path.isdir(os.path.join(directorio, nombre))
+    )
+    if not capturas:
+        raise ValueError(f"No hay capturas en '{directorio}'")
+    return capturas
+
+
+class RelojVirtual:
+    """Hora simulada: datetime.now() la devuelve y time.sleep() la adelanta."""
+
+    def __init__(self, inicio):
+        self.ahora = inicio
+        reloj = self
+
+        class DatetimeVirtual(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return reloj.ahora
+
+        self.datetime = DatetimeVirtual
+        # Las pausas adelantan la hora simulada; los cronómetros siguen midiendo tiempo real
+        self.time = types.SimpleNamespace(sleep=self.dormir, perf_counter=time.perf_counter)
+
+    def dormir(self, segundos):
+        self.ahora += timedelta(seconds=segundos)
+
+
+class EstadoEnMemoria:
+    """
+    Ficheros de estado del canal en memoria (ruta -> JSON serializado), con
+    las mismas firmas que las funciones de carga/guardado del core. Se
+    serializa de verdad para que lo que vuelve en el ciclo siguiente sea lo
+    mismo que se leería del disco.
+    """
+
+    def __init__(self):
+        self.ficheros = {}
+
+    def _leer(self, filepath):
+        texto = self.ficheros.get(filepath)
+        return None if texto is None else json.loads(texto)
+
+    def load_posted_deals(self, filepath, horas_ventana=48, dias_ventana_titulos=core.DIAS_VENTANA_TITULOS):
+        data = self._leer(filepath)
+        if data is None:
+            return {}, [], [], {}
+        return core.posted_deals_desde_datos(data, horas_ventana, dias_ventana_titulos)
+
+    def save_posted_deals(self, deals_dict, filepath, ultimas_categorias=None, ultimos_titulos=None,
+                          categorias_semanales=None):
+        data = core.datos_posted_deals(deals_dict, ultimas_categorias, ultimos_titulos, categorias_semanales)
+        self.ficheros[filepath] = json.dumps(data)
+
+    def load_reserva_candidatos(self, filepath):
+        data = self._leer(filepath)
+        return data if isinstance(data, dict) else {}
+
+    def save_reserva_candidatos(self, reserva, filepath):
+        self.ficheros[filepath] = json.dumps(reserva)
+
+
+@contextmanager
+def _parcheado(modulo, **valores):
+    """Sustituye atributos de un módulo mientras dura el bloque."""
+    originales = {nombre: getattr(modulo, nombre) for nombre in valores}
+    for nombre, valor in valores.items():
+        setattr(modulo, nombre, valor)
+    try:
+        yield
+    finally:
+        for nombre, valor in originales.items():
+            setattr(modulo, nombre, valor)
+
+
+def _memorizar(funcion, copiar=None):
+    """
+    Memoriza una función de un argumento (una página). Las capturas se repiten
+    ciclo tras ciclo y se devuelve siempre el mismo objeto str, así que cada
+    página se prefiltra y parsea una sola vez.
+    """
+    cache = {}
+
+    def memorizada(entrada):
+        if entrada not in cache:
+            cache[entrada] = funcion(entrada)
+        return copiar(cache[entrada]) if copiar else cache[entrada]
+
+    return memorizada
+
+
+def _copiar_productos(productos):
+    """Copia de los productos de una página: cada ciclo los anota (puntuación, variantes...)."""
+    return ListaProductos(
+        [p.copy() for p in productos], getattr(productos, 'estadisticas', None),
+        getattr(productos, 'tarjetas_descartadas', 0)
+    )
+
+
+def _convertir_valor(texto):
+    try:
+        return ast.literal_eval(texto)
+    except (ValueError, SyntaxError):
+        return texto
+
+
+def simular(canal, directorio, ciclos=None, cada=timedelta(hours=1), inicio=None, config=None):
+    """
+    Simula `ciclos` ciclos del canal (por defecto uno por captura) empezando
+    en `inicio` y separados `cada`. config: dict parametro -> valor para
+    cambiar reglas del canal (ej. {'LIMITE_ACCESORIOS_DIAS': 5}).
+
+    Retorna la lista de publicaciones: dicts con fecha, tipo ('oferta' o
+    'prereserva'), categoria, asin, titulo y descuento.
+    """
+    bot = importar_canal(canal)
+    config = dict(config or {})
+    for nombre in config:
+        if not hasattr(bot, nombre):
+            raise ValueError(f"El canal '{canal}' no tiene el parametro '{nombre}'")
+
+    capturas = listar_capturas(directorio)
+    ciclos = len(capturas) if ciclos is None else ciclos
+    inicio = inicio or datetime.now().replace(minute=0, second=0, microsecond=0)
+    reloj = RelojVirtual(inicio)
+    estado = EstadoEnMemoria()
+    paginas = {}  # ruta -> html, leída una vez
+    publicaciones = []
+    pendiente = []  # (tipo, producto, categoria) del mensaje que se va a enviar
+    captura_actual = [capturas[0]]
+
+    nombres_por_url = {core.BASE_URL + c['url']: c['nombre'] for c in categorias_del_canal(bot)}
+
+    def obtener_pagina(url, reintentos=3):
+        ruta = os.path.join(captura_actual[0], nombre_captura(nombres_por_url.get(url, url)))
+        if ruta not in paginas:
+            if not os.path.exists(ruta):
+                return None
+            with open(ruta, encoding='utf-8') as f:
+                paginas[ruta] = f.read()
+        return paginas[ruta]
+
+    def formateador(tipo, formatear):
+        def formatear_y_anotar(producto, categoria):
+            pendiente[:] = [(tipo, producto, categoria)]
+            return formatear(producto, categoria)
+        return formatear_y_anotar
+
+    def enviar(*args):
+        tipo, producto, categoria = pendiente[0]
+        publicaciones.append({
+            'fecha': reloj.ahora,
+            'tipo': tipo,
+            'categoria': categoria['nombre'],
+            'asin': producto['asin'],
+            'titulo': producto['titulo'],
+            'descuento': producto.get('descuento'),
+        })
+        return True
+
+    parches_canal = {
+        'DEV_MODE': False,
+        'PROCESOS_PARSEO': 0,
+        '_effective_token': lambda: 'simulacion',
+        '_effective_chat_id': lambda: 'simulacion',
+        'obtener_pagina': obtener_pagina,
+        'prefiltrar_tarjetas_con_oferta': _memorizar(bot.prefiltrar_tarjetas_con_oferta),
+        'extraer_productos_busqueda': _memorizar(bot.extraer_productos_busqueda, _copiar_productos),
+        'format_telegram_message': formateador('oferta', bot.format_telegram_message),
+        'send_telegram_photo': enviar,
+        'send_telegram_message': enviar,
+        '_load_posted_deals_core': estado.load_posted_deals,
+        '_save_posted_deals_core': estado.save_posted_deals,
+        '_load_reserva_candidatos_core': estado.load_reserva_candidatos,
+        '_save_reserva_candidatos_core': estado.save_reserva_candidatos,
+    }
+    if hasattr(bot, 'datetime'):
+        parches_canal['datetime'] = reloj.datetime
+    if hasattr(bot, 'format_prereserva_message'):
+        parches_canal['format_prereserva_message'] = formateador('prereserva', bot.format_prereserva_message)
+    parches_canal.update(config)
+
+    funciones = [getattr(bot, nombre) for nombre in _FUNCIONES_CICLO if hasattr(bot, nombre)]
+    with ExitStack() as pila:
+        pila.enter_context(_parcheado(bot, **parches_canal))
+        pila.enter_context(_parcheado(core, datetime=reloj.datetime))
+        pila.enter_context(_parcheado(pipeline, datetime=reloj.datetime, time=reloj.time))
+        for n_ciclo in range(ciclos):
+            # Las pausas entre envios adelantan el reloj, pero el siguiente ciclo
+            # empieza a su hora programada (como el cron)
+            reloj.ahora = max(reloj.ahora, inicio + n_ciclo * cada)
+            captura_actual[0] = capturas[n_ciclo % len(capturas)]
+            for funcion in funciones:
+                funcion()
+
+    return publicaciones
+
+
+def informe(publicaciones):
+    """Texto con lo que se habría publicado y el reparto por categoría."""
+    lineas = []
+    for pub in publicaciones:
+        descuento = f"{pub['descuento']:.0f}% dto" if pub['descuento'] else "-"
+        lineas.append(
+            f"  {pub['fecha'].strftime('%d/%m %H:%M')}  {pub['tipo']:<10} {pub['categoria']:<20} "
+            f"{descuento:>8}  {pub['asin']}  {pub['titulo'][:50]}"
+        )
+    por_tipo = Counter(pub['tipo'] for pub in publicaciones)
+    lineas.append("")
+    lineas.append("Publicadas: " + (", ".join(f"{n} {tipo}(s)" for tipo, n in por_tipo.items()) or "ninguna"))
+    for categoria, n in Counter(pub['categoria'] for pub in publicaciones).most_common():
+        lineas.append(f"  {categoria}: {n}")
+    return "\n".join(lineas)
+
+
+def capturar(canal, directorio):
+    """Descarga ahora las páginas de todas las categorías del canal a una captura nueva."""
+    bot = importar_canal(canal)
+    destino = os.path.join(directorio, datetime.now().strftime('%Y%m%d-%H%M'))
+    os.makedirs(destino, exist_ok=True)
+    for categoria in categorias_del_canal(bot):
+        html_content = core.obtener_pagina(core.BASE_URL + categoria['url'])
+        if not html_content:
+            log.warning("Sin pagina para '%s', no se guarda", categoria['nombre'])
+            continue
+        with open(os.path.join(destino, nombre_captura(categoria['nombre'])), 'w', encoding='utf-8') as f:
+            f.write(html_content)
+    return destino
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulador offline de la seleccion de ofertas')
+    sub = parser.add_subparsers(dest='accion', required=True)
+
+    p_cap = sub.add_parser('capturar', help='Graba las paginas actuales de las categorias del canal')
+    p_cap.add_argument('canal', choices=CANALES)
+    p_cap.add_argument('directorio', help='Directorio de capturas')
+
+    p_sim = sub.add_parser('simular', help='Reproduce ciclos sobre las capturas grabadas')
+    p_sim.add_argument('canal', choices=CANALES)
+    p_sim.add_argument('directorio', help='Directorio de capturas')
+    p_sim.add_argument('--ciclos', type=int, default=None, help='Ciclos a simular (default: uno por captura)')
+    p_sim.add_argument('--cada', type=int, default=60, help='Minutos entre ciclos (default 60)')
+    p_sim.add_argument('--inicio', type=datetime.fromisoformat, default=None,
+                       help='Hora del primer ciclo, ISO (default: la hora en punto actual)')
+    p_sim.add_argument('--config', action='append', default=[], metavar='PARAMETRO=VALOR',
+                       help='Cambia un parametro del canal (ej. LIMITE_ACCESORIOS_DIAS=5); repetible')
+    p_sim.add_argument('-v', '--verbose', action='store_true', help='Muestra el log de cada ciclo')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if getattr(args, 'verbose', False) or args.accion == 'capturar' else logging.ERROR,
+        format='%(message)s',
+    )
+
+    if args.accion == 'capturar':
+        print(f"Captura guardada en {capturar(args.canal, args.directorio)}")
+        return
+
+    config = {}
+    for asignacion in args.config:
+        nombre, sep, valor = asignacion.partition('=')
+        if not sep:
+            parser.error(f"--config espera PARAMETRO=VALOR: '{asignacion}'")
+        config[nombre.strip()] = _convertir_valor(valor.strip())
+
+    try:
+        publicaciones = simular(
+            args.canal, args.directorio, args.ciclos, timedelta(minutes=args.cada), args.inicio, config
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(informe(publicaciones))
+
+
+if __name__ == "__main__":
+    main()